@@ -7,7 +7,6 @@ import json
 import uuid
 import datetime
 
-import geopy as geopy
 import psutil
 import distutils
 try:
@@ -15,9 +14,11 @@ try:
 except ImportError:
     pass
 from django.conf import settings
+from django.db.models import Prefetch
 from roundware.rw import models
 from roundware.lib.exception import RoundException
-from roundware.lib.api import (get_project_tags_old as get_project_tags, t, log_event, form_to_request,
+from roundware.lib.localization import Localizations
+from roundware.lib.api import (get_project_tags_old as get_project_tags, log_event, queue_event, form_to_request,
                                check_for_single_audiotrack, get_parameter_from_request )
 
 logger = logging.getLogger(__name__)
@@ -99,12 +100,16 @@ def get_config(request):
 
         s.save()
         session_id = s.id
-        log_event('start_session', s.id, None)
+        queue_event('start_session', s.id, None)
 
-    sharing_message = t("none set", project.sharing_message_loc, l)
-    out_of_range_message = t("none set", project.out_of_range_message_loc, l)
-    legal_agreement = t("none set", project.legal_agreement_loc, l)
-    demo_stream_message = t("none set", project.demo_stream_message_loc, l)
+    localizations = Localizations()
+    for field_name in ('sharing_message_loc', 'out_of_range_message_loc',
+                       'legal_agreement_loc', 'demo_stream_message_loc'):
+        localizations.load(models.Project, field_name, [project.id])
+    sharing_message = localizations.get(project, 'sharing_message_loc', [l], "none set")
+    out_of_range_message = localizations.get(project, 'out_of_range_message_loc', [l], "none set")
+    legal_agreement = localizations.get(project, 'legal_agreement_loc', [l], "none set")
+    demo_stream_message = localizations.get(project, 'demo_stream_message_loc', [l], "none set")
 
     response = [
         {"device": {"device_id": device_id}},
@@ -186,23 +191,16 @@ def get_available_assets(request):
             If that's not available, look for a language field on the model and
             use that.  If that's not available, fall back to English.
         """
-        try:
-            localization = tag.loc_msg.get(language=best_lang_id)
-        except models.LocalizedString.DoesNotExist:
+        asset_lang = asset.language
+        if asset_lang and best_lang_id != asset_lang:
             # try object's specified language
-            asset_lang = asset.language
-            try:
-                if asset_lang and best_lang_id != asset_lang:
-                    localization = tag.loc_msg.get(language=asset_lang)
-                else:
-                    # fall back to English
-                    english = models.Language.objects.get(language_code='en')
-                    localization = tag.loc_msg.get(language=english)
-            except models.LocalizedString.DoesNotExist:
-                # Worst case return the unlocalized value.
-                # Yes, Tag.loc_msg = Tag.value.
-                return tag.value
-        return localization.localized_string
+            languages = [best_lang_id, asset_lang]
+        else:
+            # fall back to English
+            languages = [best_lang_id, localizations.english_id]
+        # Worst case return the unlocalized value.
+        # Yes, Tag.loc_msg = Tag.value.
+        return localizations.get(tag, 'loc_msg', languages, tag.value)
 
     form = request.GET
     kw = {}
@@ -253,14 +251,8 @@ def get_available_assets(request):
         assets = models.Asset.objects.filter(id__in=asset_id.split(','))
 
     elif envelope_id:
-        assets = []
-        envelopes = models.Envelope.objects.filter(
-            id__in=envelope_id.split(','))
-        for e in envelopes:
-            e_assets = e.assets.all()
-            for a in e_assets:
-                if a not in assets:
-                    assets.append(a)
+        assets = models.Asset.objects.filter(
+            envelope__in=envelope_id.split(',')).distinct()
 
     elif project_id:
         project = models.Project.objects.get(id=project_id)
@@ -290,26 +282,30 @@ def get_available_assets(request):
                     raise RoundException("Project does not specify a "
                                          "radius and no radius parameter "
                                          "passed to operation.")
-            radius = float(radius)
-            for asset in assets:
-                distance = geopy.distance.distance(
-                    (latitude, longitude),
-                    (asset.latitude, asset.longitude)
-                ).meters
-                if distance > radius:
-                    assets = assets.exclude(id=asset.id)
+            assets = models.filter_within_radius(
+                assets, latitude, longitude, radius)
     else:
         raise RoundException("This operation requires that you pass a "
                              "project_id, asset_id, or envelope_id")
 
+    # only ready assets unless another status is asked for; processing and
+    # failed assets still point at the unconverted upload
+    assets = assets.filter(status=extras.get('status', models.Asset.READY))
+
     assets_info = {}
     assets_info['number_of_assets'] = {}
     for mtype in asset_media_types:
         assets_info['number_of_assets'][mtype] = 0
     assets_list = []
 
+    # load everything the assets are rendered with up front, in a fixed
+    # number of queries however many assets there are
+    assets = list(assets.select_related('project', 'language').prefetch_related(
+        Prefetch('tags', queryset=models.Tag.objects.select_related('tag_category'))))
+    localizations = Localizations().load(models.Asset, 'loc_description', [a.id for a in assets])
+    localizations.load(models.Tag, 'loc_msg', [tag.id for a in assets for tag in a.tags.all()])
     for asset in assets:
-        loc_desc = t("", asset.loc_description, lng_id)
+        loc_desc = localizations.get(asset, 'loc_description', [lng_id])
 
         if asset.mediatype in asset_media_types:
             assets_info['number_of_assets'][asset.mediatype] += 1
@@ -379,7 +375,7 @@ def get_events(request):
                      latitude=e.latitude,
                      longitude=e.longitude,
                      data=e.data,
-                     tags=e.tags,
+                     tags=",".join(str(t) for t in e.tags) if e.tags else e.tags,
                      server_time=str(e.server_time),
                      )
             )
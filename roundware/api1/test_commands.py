@@ -0,0 +1,46 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+from django.test import TestCase
+from model_bakery import baker
+
+from roundware.api1 import commands
+from roundware.rw.models import Language
+from rw.tests.common import FakeRequest
+
+
+class TestGetAvailableAssetsLocalization(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.english = baker.make(Language, language_code='en')
+        cls.spanish = baker.make(Language, language_code='es')
+        cls.french = baker.make(Language, language_code='fr')
+        cls.project = baker.make_recipe('rw.project')
+        session = baker.make_recipe('rw.default_session', project=cls.project, language=cls.spanish)
+        one = baker.make_recipe('rw.localized_string', language=cls.english, localized_string="One")
+        uno = baker.make_recipe('rw.localized_string', language=cls.spanish, localized_string="Uno")
+        cls.both = baker.make_recipe('rw.tag', project=cls.project, value="both", loc_msg=[one, uno])
+        cls.english_only = baker.make_recipe('rw.tag', project=cls.project, value="english_only",
+                                             loc_msg=[one])
+        baker.make_recipe('rw.asset', project=cls.project, session=session, language=cls.spanish,
+                          tags=[cls.both, cls.english_only])
+
+    def localized_values(self, params):
+        request = FakeRequest()
+        request.GET = dict(params, project_id=str(self.project.id))
+        asset, = commands.get_available_assets(request)["assets"]
+        return {tag["tag_id"]: tag["localized_value"] for tag in asset["tags"]}
+
+    def test_falls_back_to_asset_language_before_english(self):
+        values = self.localized_values({"language": "fr"})
+        self.assertEqual(values[self.both.id], "Uno")
+        # English is only tried when the asset's language is the one requested
+        self.assertEqual(values[self.english_only.id], "english_only")
+
+    def test_falls_back_to_english_in_asset_language(self):
+        values = self.localized_values({"language": "es"})
+        self.assertEqual(values[self.both.id], "Uno")
+        self.assertEqual(values[self.english_only.id], "One")
+        self.assertEqual(self.localized_values({}), values)
@@ -0,0 +1,75 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Query budget for the API V1 get_available_assets operation, which legacy
+# kiosk clients still use. Projects of different size are seeded as for API V2
+# and the operation fails if listing the larger project costs more queries.
+#
+# Sizes can be raised to benchmark it, printing a report:
+#   QUERY_BUDGET_SIZES=10,1000 QUERY_BUDGET_REPORT=1 ./manage.py test roundware.api1.test_query_budget \
+#     --settings=roundware.settings.testing
+from __future__ import unicode_literals
+import os
+import sys
+import time
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from model_bakery import baker
+
+from roundware.api1 import commands
+from roundware.api2 import test_query_budget
+from roundware.rw.models import Envelope, Language
+from rw.tests.common import FakeRequest
+
+
+class TestGetAvailableAssetsQueryBudget(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.english = baker.make(Language, language_code='en')
+        cls.spanish = baker.make(Language, language_code='es')
+        cls.seeds = [test_query_budget.seed_project(size, cls.english) for size in test_query_budget.SIZES]
+
+    def measure(self, params):
+        request = FakeRequest()
+        request.GET = params
+        with CaptureQueriesContext(connection) as queries:
+            start = time.time()
+            result = commands.get_available_assets(request)
+            elapsed = time.time() - start
+        return len(queries), elapsed, result
+
+    def test_query_counts_do_not_grow_with_asset_count(self):
+        for params in ({}, {"language": "es"}):
+            measurements = []
+            for name, project, session, projectgroup in self.seeds:
+                request_params = dict(params, project_id=str(project.id))
+                count, elapsed, result = self.measure(request_params)
+                self.assertEqual(len(result["assets"]), project.asset_set.count())
+                self.assertTrue(all(asset["tags"] for asset in result["assets"]))
+                measurements.append((count, elapsed))
+
+            if os.environ.get("QUERY_BUDGET_REPORT"):
+                sys.stderr.write("\nget_available_assets %s: %s\n" % (params, "  ".join(
+                    "%4d q %7.1f ms" % (count, elapsed * 1000) for count, elapsed in measurements)))
+
+            with self.subTest(params=params):
+                counts = [count for count, elapsed in measurements]
+                self.assertEqual(min(counts), max(counts),
+                                 "get_available_assets query count grows with asset count: %s" % counts)
+
+    def test_envelope_query_counts_do_not_grow_with_asset_count(self):
+        counts = []
+        for name, project, session, projectgroup in self.seeds:
+            assets = list(project.asset_set.all())
+            # overlapping envelopes: each asset is listed once
+            envelopes = [baker.make(Envelope, session=session, assets=assets),
+                         baker.make(Envelope, session=session, assets=assets[:1])]
+            count, elapsed, result = self.measure({"envelope_id": ",".join(str(e.id) for e in envelopes)})
+            self.assertEqual(sorted(asset["asset_id"] for asset in result["assets"]),
+                             sorted(asset.id for asset in assets))
+            counts.append(count)
+        self.assertEqual(min(counts), max(counts),
+                         "get_available_assets envelope query count grows with asset count: %s" % counts)
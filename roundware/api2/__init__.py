@@ -1,4 +1,4 @@
 # Roundware Server is released under the GNU Affero General Public License v3.
 # See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
 
-default_app_config = 'api2.apps.RoundwareApi2Config'
+default_app_config = 'roundware.api2.apps.RoundwareApi2Config'
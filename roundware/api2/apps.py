@@ -4,7 +4,10 @@
 from django.apps import AppConfig
 
 class RoundwareApi2Config(AppConfig):
-    name = 'rw_api_2'
+    name = 'roundware.api2'
+    label = 'api2'
+    verbose_name = 'Roundware API V2'
 
     def ready(self):
-        import roundware.api2.signals
\ No newline at end of file
+        from roundware.api2 import cache
+        cache.connect_signals()
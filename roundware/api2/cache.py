@@ -0,0 +1,113 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Caching for read-heavy API V2 endpoints which only change when a project is
+# edited. Responses are stored in the settings.API_CACHE backend under a key
+# containing a generation number; saving or deleting any model they are built
+# from bumps the generation, which orphans every cached response at once.
+# Any Django cache backend works: local-memory or file caches on a single
+# node, a memcached-protocol server shared by multi-node installs.
+from __future__ import unicode_literals
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models.signals import post_save, post_delete, m2m_changed
+import hashlib
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = "api2:generation"
+
+# Backends whose incr is not atomic across processes
+NON_ATOMIC_INCR_CACHES = (DatabaseCache, FileBasedCache, LocMemCache)
+
+# Models the cached endpoints are built from, as app_label.ModelName
+INVALIDATING_MODELS = (
+    "rw.Language",
+    "rw.LocalizedString",
+    "rw.Project",
+    "rw.ProjectGroup",
+    "rw.Tag",
+    "rw.TagCategory",
+    "rw.TagRelationship",
+    "rw.UIElement",
+    "rw.UIElementName",
+    "rw.UIGroup",
+    "rw.UIItem",
+)
+
+
+def get_cache():
+    return caches[settings.API_CACHE]
+
+
+def get_generation(cache):
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # start from the clock so a generation evicted from the cache is never reused
+        cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+        generation = cache.get(GENERATION_KEY, 0)
+    return generation
+
+
+def make_key(name, pk, variant, generation):
+    """
+    Build a key of fixed length, safe for memcached, from the endpoint name,
+    object id and the request variant (e.g. language and filter parameters).
+    """
+    digest = hashlib.md5(repr(variant).encode("utf-8")).hexdigest()
+    return "api2:%s:%s:%s:%s" % (generation, name, pk, digest)
+
+
+def get_or_build(name, pk, variant, build):
+    """
+    Return the cached response data for the endpoint, calling build() to
+    create and store it on a miss.
+    """
+    cache = get_cache()
+    key = make_key(name, pk, variant, get_generation(cache))
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, settings.API_CACHE_TIMEOUT)
+    return data
+
+
+def invalidate(**kwargs):
+    """
+    Orphan every cached response by moving to a new generation.
+    """
+    cache = get_cache()
+    if isinstance(cache, NON_ATOMIC_INCR_CACHES):
+        # incr is a separate read and write there, so concurrent invalidations
+        # could both write the same generation; a value never used before can't
+        cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+        return
+    cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # evicted between add and incr
+        cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+
+
+def invalidate_m2m(sender, instance, action, **kwargs):
+    if action.startswith("post_") and instance._meta.label in INVALIDATING_MODELS:
+        invalidate()
+
+
+def connect_signals():
+    """
+    Invalidate on changes to any of INVALIDATING_MODELS. Called from the api2
+    AppConfig so edits from every process, not only those serving the API,
+    are seen.
+    """
+    for model in INVALIDATING_MODELS:
+        post_save.connect(invalidate, sender=model, dispatch_uid="api2_cache_save_%s" % model)
+        post_delete.connect(invalidate, sender=model, dispatch_uid="api2_cache_delete_%s" % model)
+    m2m_changed.connect(invalidate_m2m, dispatch_uid="api2_cache_m2m")
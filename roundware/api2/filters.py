@@ -3,12 +3,18 @@
 import numbers
 
 from django.contrib.auth.models import User
-from roundware.rw.models import (Asset, Audiotrack, Envelope, Event, Language, ListeningHistoryItem,
-                                 LocalizedString, Project, ProjectGroup, Session, Speaker, Tag, TagCategory,
-                                 TagRelationship, TimedAsset, UIElement, UIElementName, UIItem, UIGroup, Vote)
+from roundware.rw.models import (Asset, AssetDailyStats, Audiotrack, Envelope, Event, Language,
+                                 ListeningHistoryItem, LocalizedString, Project, ProjectDailyStats, ProjectGroup,
+                                 ProjectHourlyStats, Session, Speaker, Tag, TagCategory,
+                                 TagRelationship, TimedAsset, UIElement, UIElementName, UIItem, UIGroup, Vote,
+                                 filter_within_radius)
 from distutils.util import strtobool
+from decimal import Decimal
+import datetime
 import django_filters
+from django.contrib.gis.geos import Polygon
 from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
 
 BOOLEAN_CHOICES = (('false', False), ('true', True),
                    (0, False), (1, True),)
@@ -43,6 +49,25 @@ class WordListFilter(django_filters.Filter):
             return qs
         return qs
 
+class DateTimePrefixFilter(django_filters.CharFilter):
+    # match the day of a date or the second of a datetime as a range, which
+    # unlike a text startswith can use the index on the field
+    def filter(self, qs, value):
+        if value in (None, ''):
+            return qs
+        value = value.strip()
+        start = parse_datetime(value)
+        if start is not None:
+            end = start + datetime.timedelta(seconds=1)
+        else:
+            day = parse_date(value)
+            if day is None:
+                return qs.none()
+            start = datetime.datetime.combine(day, datetime.time())
+            end = start + datetime.timedelta(days=1)
+        return qs.filter(**{'%s__gte' % self.field_name: start,
+                            '%s__lt' % self.field_name: end})
+
 class DescriptionFilenameAssetFilter(django_filters.CharFilter):
   def filter(self, qs, value):
     if value:
@@ -57,6 +82,75 @@ class NanoNumberFilter(django_filters.NumberFilter):
         return super(NanoNumberFilter, self).filter(qs, value)
 
 
+class CoordinateFilter(django_filters.NumberFilter):
+    # latitude/longitude are used as the center point when radius is passed
+    def filter(self, qs, value):
+        if self.parent.data.get('radius') not in (None, ''):
+            return qs
+        return super(CoordinateFilter, self).filter(qs, value)
+
+
+class AssetStatusFilter(django_filters.TypedChoiceFilter):
+    # only ready assets unless another status is asked for; processing and
+    # failed assets still point at the unconverted upload
+    def filter(self, qs, value):
+        return super(AssetStatusFilter, self).filter(qs, value or Asset.READY)
+
+
+class CoordinatePrefixFilter(CoordinateFilter):
+    # match the coordinates the value is a prefix of, as when they were stored
+    # as text, with a range: 42.3 matches from 42.3 up to but excluding 42.4
+    def filter(self, qs, value):
+        if value in (None, '') or self.parent.data.get('radius') not in (None, ''):
+            return qs
+        step = Decimal(1).scaleb(min(value.as_tuple().exponent, 0))
+        if value.is_signed():
+            return qs.filter(**{'%s__gt' % self.field_name: value - step,
+                                '%s__lte' % self.field_name: value})
+        return qs.filter(**{'%s__gte' % self.field_name: value,
+                            '%s__lt' % self.field_name: value + step})
+
+
+class RadiusFilter(django_filters.NumberFilter):
+    # perform a database-side radius (meters) search around latitude/longitude
+    def filter(self, qs, value):
+        if value in (None, ''):
+            return qs
+        latitude = self.parent.data.get('latitude')
+        longitude = self.parent.data.get('longitude')
+        if latitude in (None, '') or longitude in (None, ''):
+            return qs
+        return filter_within_radius(qs, latitude, longitude, value)
+
+
+class BoundingBoxFilter(django_filters.CharFilter):
+    # min_longitude,min_latitude,max_longitude,max_latitude, matched against
+    # the indexed geography location
+    def filter(self, qs, value):
+        if value in (None, ''):
+            return qs
+        try:
+            bbox = [float(v) for v in value.split(',')]
+        except ValueError:
+            return qs.none()
+        if len(bbox) != 4:
+            return qs.none()
+        return qs.filter(**{'%s__intersects' % self.field_name: Polygon.from_bbox(bbox)})
+
+
+class IntegerArrayFilter(django_filters.Filter):
+    # compare a comma separated list of integers with an integer array field;
+    # 'contains' requires all of them, 'overlap' any of them
+    def filter(self, qs, value):
+        if value in (None, ''):
+            return qs
+        try:
+            integers = [int(v) for v in value.split(',')]
+        except ValueError:
+            return qs.none()
+        return qs.filter(**{'%s__%s' % (self.field_name, self.lookup_expr): integers})
+
+
 class UserNameEmailFilter(django_filters.CharFilter):
   def filter(self, qs, value):
     if value:
@@ -76,9 +170,11 @@ class AssetFilterSet(django_filters.FilterSet):
     media_type = django_filters.CharFilter(field_name='mediatype')
     language = django_filters.CharFilter(field_name='language__language_code')
     envelope_id = IntegerListAndFilter(field_name='envelope__id')
-    longitude = django_filters.NumberFilter(lookup_expr='startswith')
-    latitude = django_filters.NumberFilter(lookup_expr='startswith')
+    longitude = CoordinateFilter(lookup_expr='startswith')
+    latitude = CoordinateFilter(lookup_expr='startswith')
+    radius = RadiusFilter()
     submitted = django_filters.TypedChoiceFilter(choices=BOOLEAN_CHOICES, coerce=strtobool)
+    status = AssetStatusFilter(choices=Asset.STATUSES)
     audiolength__lte = NanoNumberFilter(field_name='audiolength', lookup_expr='lte')
     audiolength__gte = NanoNumberFilter(field_name='audiolength', lookup_expr='gte')
     created__lte = django_filters.DateTimeFilter(field_name='created', lookup_expr='lte')
@@ -141,22 +237,22 @@ class EnvelopeFilterSet(django_filters.FilterSet):
 
 class EventFilterSet(django_filters.FilterSet):
     event_type = django_filters.CharFilter(lookup_expr='icontains')
-    server_time = django_filters.DateTimeFilter(lookup_expr='startswith')
+    server_time = DateTimePrefixFilter()
     server_time__lt = django_filters.DateTimeFilter(field_name='server_time', lookup_expr='lt')
     server_time__gt = django_filters.DateTimeFilter(field_name='server_time', lookup_expr='gt')
     session_id = django_filters.NumberFilter()
-    latitude = django_filters.CharFilter(lookup_expr='startswith')
-    longitude = django_filters.CharFilter(lookup_expr='startswith')
-    tag_ids = WordListFilter(field_name='tags', lookup_expr='contains')
+    latitude = CoordinatePrefixFilter()
+    longitude = CoordinatePrefixFilter()
+    radius = RadiusFilter()
+    bbox = BoundingBoxFilter(field_name='location')
+    tag_ids = IntegerArrayFilter(field_name='tags', lookup_expr='contains')
+    tag_ids__any = IntegerArrayFilter(field_name='tags', lookup_expr='overlap')
 
     class Meta:
         model = Event
         fields = ['event_type',
                   'server_time',
-                  'session_id',
-                  'latitude',
-                  'longitude',
-                  'tags']
+                  'session_id']
 
 
 class LanguageFilterSet(django_filters.FilterSet):
@@ -236,6 +332,38 @@ class SpeakerFilterSet(django_filters.FilterSet):
         fields = ["activeyn", "project_id"]
 
 
+class AssetDailyStatsFilterSet(django_filters.FilterSet):
+    project_id = django_filters.NumberFilter()
+    asset_id = django_filters.NumberFilter()
+    start = django_filters.DateFilter(field_name='date', lookup_expr='gte')
+    end = django_filters.DateFilter(field_name='date', lookup_expr='lte')
+
+    class Meta:
+        model = AssetDailyStats
+        fields = ['project_id', 'asset_id']
+
+
+class ProjectDailyStatsFilterSet(django_filters.FilterSet):
+    project_id = django_filters.NumberFilter()
+    start = django_filters.DateFilter(field_name='date', lookup_expr='gte')
+    end = django_filters.DateFilter(field_name='date', lookup_expr='lte')
+
+    class Meta:
+        model = ProjectDailyStats
+        fields = ['project_id']
+
+
+class ProjectHourlyStatsFilterSet(django_filters.FilterSet):
+    project_id = django_filters.NumberFilter()
+    start = django_filters.DateFilter(field_name='hour', lookup_expr='gte')
+    # through the end of the given day
+    end = django_filters.DateFilter(field_name='hour__date', lookup_expr='lte')
+
+    class Meta:
+        model = ProjectHourlyStats
+        fields = ['project_id']
+
+
 class TagFilterSet(django_filters.FilterSet):
     description = django_filters.CharFilter(lookup_expr='icontains')
     data = django_filters.CharFilter(lookup_expr='icontains')
@@ -0,0 +1,107 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Keyset pagination for large, append-mostly lists. Pages are ordered newest
+# first on (time field, id) and each page's `next` link carries the position
+# of its last row, so fetching any page is an index range scan of page_size
+# rows no matter how deep it is, unlike OFFSET based page numbers.
+from __future__ import unicode_literals
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def wants_keyset_page(request):
+    """
+    True if the request asks for keyset pages: ?paginate=cursor, or a cursor
+    from a previous page.
+    """
+    return request.query_params.get('paginate') == 'cursor' or 'cursor' in request.query_params
+
+
+class KeysetPagination(BasePagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+
+    def __init__(self, time_field=None):
+        # without a time field pages are ordered by id alone
+        self.time_field = time_field
+        self.next_position = None
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            raise ParseError("page_size must be a number")
+        return max(1, min(page_size, self.max_page_size))
+
+    def encode_cursor(self, position):
+        return urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(cursor.encode('ascii')).decode('ascii'))
+            if not isinstance(position, list):
+                raise ValueError(position)
+            if self.time_field:
+                time, pk = parse_datetime(position[0]), int(position[1])
+                if time is None:
+                    raise ValueError(position[0])
+                return time, pk
+            return int(position[0]),
+        except (TypeError, ValueError, IndexError):
+            raise ParseError("Invalid cursor")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        if self.time_field:
+            queryset = queryset.order_by('-' + self.time_field, '-id')
+            if position:
+                time, pk = position
+                # the redundant time <= bound lets the index scan start at the
+                # cursor, which the OR alone does not
+                queryset = queryset.filter(**{self.time_field + '__lte': time}) \
+                                   .filter(Q(**{self.time_field + '__lt': time}) |
+                                           Q(**{self.time_field: time, 'id__lt': pk}))
+        else:
+            queryset = queryset.order_by('-id')
+            if position:
+                queryset = queryset.filter(id__lt=position[0])
+
+        # one extra row tells whether there is a next page
+        rows = list(queryset[:page_size + 1])
+        page = rows[:page_size]
+        if len(rows) > page_size:
+            last = page[-1]
+            if self.time_field:
+                self.next_position = [getattr(last, self.time_field).isoformat(), last.id]
+            else:
+                self.next_position = [last.id]
+        return page
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
@@ -0,0 +1,104 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Streaming of large list responses. Rather than building serializer.data for
+# the whole queryset, ids are read with a server-side cursor and the objects
+# serialized and sent a chunk at a time, so memory use does not grow with the
+# size of the list. Requested with ?format=ndjson (one JSON object per line) or
+# ?stream=true (a regular JSON array, sent in chunks).
+from __future__ import unicode_literals
+from distutils.util import strtobool
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+
+
+def dumps(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline delimited JSON: each item of a list on its own line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, list):
+            data = [data]
+        return ''.join(dumps(item) + '\n' for item in data).encode('utf-8')
+
+
+# renderer_classes of views that can stream
+STREAMING_RENDERER_CLASSES = list(api_settings.DEFAULT_RENDERER_CLASSES) + [NDJSONRenderer]
+
+
+def wants_stream(request):
+    """
+    True for ?format=ndjson or ?stream=true.
+    """
+    if request.accepted_renderer.format == NDJSONRenderer.format:
+        return True
+    try:
+        return bool(strtobool(request.query_params.get('stream', 'false')))
+    except ValueError:
+        raise ParseError("stream must be true or false")
+
+
+def iter_chunks(queryset, chunk_size):
+    """
+    Yield the objects of queryset, in its order, chunk_size at a time. Each
+    chunk is loaded with the queryset's select_related and prefetch_related,
+    which QuerySet.iterator() alone would skip.
+    """
+    chunk = []
+    for pk in queryset.values_list('pk', flat=True).iterator(chunk_size=chunk_size):
+        chunk.append(pk)
+        if len(chunk) == chunk_size:
+            yield load_chunk(queryset, chunk)
+            chunk = []
+    if chunk:
+        yield load_chunk(queryset, chunk)
+
+
+def load_chunk(queryset, pks):
+    objects = {obj.pk: obj for obj in queryset.filter(pk__in=pks).order_by()}
+    return [objects[pk] for pk in pks if pk in objects]
+
+
+def stream_list(request, queryset, serializer_class, context=None, chunk_size=CHUNK_SIZE):
+    """
+    StreamingHttpResponse of queryset serialized by serializer_class, as NDJSON
+    or a JSON array depending on the request.
+    """
+    ndjson = request.accepted_renderer.format == NDJSONRenderer.format
+
+    def generate():
+        first = True
+        if not ndjson:
+            yield '['
+        for chunk in iter_chunks(queryset, chunk_size):
+            data = serializer_class(chunk, many=True, context=context or {}).data
+            if ndjson:
+                yield ''.join(dumps(item) + '\n' for item in data)
+            else:
+                items = ','.join(dumps(item) for item in data)
+                yield items if first else ',' + items
+                first = False
+        if not ndjson:
+            yield ']'
+
+    content_type = NDJSONRenderer.media_type if ndjson else 'application/json'
+    return StreamingHttpResponse(generate(), content_type=content_type)
@@ -1,16 +1,18 @@
 # Roundware Server is released under the GNU Affero General Public License v3.
 # See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
 
-from roundware.rw.models import (Asset, Audiotrack, Envelope, Event, Language, ListeningHistoryItem,
-                                 LocalizedString, Project, ProjectGroup, Session, Speaker, Tag,
+from roundware.rw.models import (Asset, AssetDailyStats, Audiotrack, Envelope, Event, Language,
+                                 ListeningHistoryItem, LocalizedString, Project, ProjectDailyStats,
+                                 ProjectGroup, ProjectHourlyStats, Session, Speaker, Tag,
                                  TagCategory, TagRelationship, TimedAsset, UIElement, UIElementName,
                                  UIGroup, UIItem, Vote)
-from roundware.lib.api import vote_count_by_asset, vote_summary_by_asset
+from roundware.lib.api import format_vote_counts
 from rest_framework import serializers
 from rest_framework.serializers import ValidationError
 from django.contrib.auth.models import User
 from django.conf import settings
 from datetime import datetime
+from collections import OrderedDict
 import time
 import re
 import logging
@@ -50,6 +52,7 @@ class AssetSerializer(AdminLocaleStringSerializerMixin, serializers.ModelSeriali
             'file',
             'volume',
             'submitted',
+            'status',
             'created',
             'updated',
             'weight',
@@ -67,6 +70,7 @@ class AssetSerializer(AdminLocaleStringSerializerMixin, serializers.ModelSeriali
             'envelope',
             'user'
         )
+        read_only_fields = ('status',)
         localized_fields = ['loc_description', 'loc_alt_text']
 
     def to_representation(self, obj):
@@ -101,15 +105,24 @@ class AssetSerializer(AdminLocaleStringSerializerMixin, serializers.ModelSeriali
 
         del result["loc_caption"]
 
-        try:
-            user = User.objects.get(pk=result["user"])
-            serializer = UserInfoSerializer(user)
+        # querysets are expected to select_related user__userprofile, see prefetch()
+        if obj.user is not None:
+            serializer = UserInfoSerializer(obj.user)
             result["user"] = serializer.data
-        except User.DoesNotExist:
+        else:
             result["user"] = None
 
         return result
 
+    @staticmethod
+    def prefetch(queryset):
+        """
+        Load everything to_representation needs in a fixed number of queries
+        rather than one per Asset.
+        """
+        return queryset.select_related('user__userprofile') \
+                       .prefetch_related('tags', 'loc_description', 'loc_alt_text', 'envelope')
+
 
 class AudiotrackSerializer(serializers.ModelSerializer):
     class Meta:
@@ -165,7 +178,7 @@ class EnvelopeSerializer(serializers.ModelSerializer):
 class EventSerializer(serializers.ModelSerializer):
     class Meta:
         model = Event
-        fields = "__all__"
+        exclude = ('location',)
 
     def to_representation(self, obj):
         result = super(EventSerializer, self).to_representation(obj)
@@ -203,7 +216,6 @@ class ListenEventSerializer(serializers.ModelSerializer):
 
     def to_representation(self, obj):
         result = super(ListenEventSerializer, self).to_representation(obj)
-        session = Session.objects.get(pk=result["session"])
         result["start_time"] = result["starttime"]
         del result["starttime"]
         result["session_id"] = result["session"]
@@ -211,9 +223,13 @@ class ListenEventSerializer(serializers.ModelSerializer):
         result["asset_id"] = result["asset"]
         del result["asset"]
         del result["duration"]
-        result["project_id"] = session.project_id
+        result["project_id"] = obj.session.project_id
         return result
 
+    @staticmethod
+    def prefetch(queryset):
+        return queryset.select_related('session')
+
 
 class LocalizedStringSerializer(serializers.ModelSerializer):
 
@@ -226,10 +242,17 @@ class LocalizedStringSerializer(serializers.ModelSerializer):
         result["text"] = result["localized_string"]
         del result["localized_string"]
         result["language_id"] = result["language"]
-        lang = Language.objects.get(pk=result["language_id"])
-        result["language"] = lang.language_code
+        result["language"] = obj.language.language_code
         return result
 
+    @staticmethod
+    def prefetch(queryset):
+        return queryset.select_related('language')
+
+
+PROJECT_LOCALIZED_FIELDS = ('demo_stream_message_loc', 'legal_agreement_loc', 'description_loc',
+                            'sharing_message_loc', 'out_of_range_message_loc')
+
 
 class ProjectSerializer(AdminLocaleStringSerializerMixin, serializers.ModelSerializer):
     class Meta:
@@ -240,20 +263,20 @@ class ProjectSerializer(AdminLocaleStringSerializerMixin, serializers.ModelSeria
 
     def to_representation(self, obj):
         result = super(ProjectSerializer, self).to_representation(obj)
-        # session, passed in context, is used to determine string localization
-        session = None
-        if "session" in self.context:
-            session = self.context["session"]
         # localize strings per language associated with session
-        for field in ['demo_stream_message_loc', 'legal_agreement_loc', 'description_loc',
-                      'sharing_message_loc', 'out_of_range_message_loc']:
-            result[field[:-4]] = _select_localized_string(result[field], session=session)
+        language_id = _get_language_id(self.context)
+        for field in PROJECT_LOCALIZED_FIELDS:
+            result[field[:-4]] = _localize(getattr(obj, field).all(), language_id)
             del result[field]
 
         result["language_ids"] = result["languages"]
         del result["languages"]
         return result
 
+    @staticmethod
+    def prefetch(queryset):
+        return queryset.prefetch_related('languages', *PROJECT_LOCALIZED_FIELDS)
+
 
 class ProjectChooserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -269,21 +292,12 @@ class ProjectChooserSerializer(serializers.ModelSerializer):
         result = super(ProjectChooserSerializer, self).to_representation(obj)
         result["project_id"] = result["id"]
         del result["id"]
-        language_code = None
-        if "language_code" in self.context:
-            language_code = self.context["language_code"]
-        try:
-            lang = Language.objects.get(language_code=language_code)
-        except Language.DoesNotExist:
-            lang = Language.objects.get(language_code="en")
-        loc_str_ids = result["description_loc"]
         # if any localized strings exist for description_loc, return only the
         # string associated with the passed language_code
-        if loc_str_ids:
-            for loc_str_id in loc_str_ids:
-                loc_str = LocalizedString.objects.get(pk=loc_str_id)
-                if loc_str.language_id == lang.id:
-                    result["description_loc"] = loc_str.localized_string
+        if result["description_loc"]:
+            localized = _localize(obj.description_loc.all(), _get_language_id(self.context))
+            if localized is not None:
+                result["description_loc"] = localized
         else:
             result["description_loc"] = ""
         thumb = settings.MEDIA_URL + "project" + str(result["project_id"]) + "-thumb.png"
@@ -291,6 +305,10 @@ class ProjectChooserSerializer(serializers.ModelSerializer):
 
         return result
 
+    @staticmethod
+    def prefetch(queryset):
+        return queryset.prefetch_related('description_loc')
+
 
 class ProjectGroupSerializer(serializers.ModelSerializer):
     class Meta:
@@ -390,6 +408,42 @@ class SpeakerSerializer(serializers.ModelSerializer):
 #         return stream
 
 
+class StatsSerializer(serializers.ModelSerializer):
+    """
+    Base for the rollup tables read by api/2/stats/
+    """
+    def to_representation(self, obj):
+        result = super(StatsSerializer, self).to_representation(obj)
+        del result["id"]
+        result["project_id"] = result["project"]
+        del result["project"]
+        if "asset" in result:
+            result["asset_id"] = result["asset"]
+            del result["asset"]
+        if "duration" in result:
+            result["duration_in_seconds"] = result["duration"] / 1000000000.0
+            del result["duration"]
+        return result
+
+
+class AssetDailyStatsSerializer(StatsSerializer):
+    class Meta:
+        model = AssetDailyStats
+        fields = "__all__"
+
+
+class ProjectDailyStatsSerializer(StatsSerializer):
+    class Meta:
+        model = ProjectDailyStats
+        fields = "__all__"
+
+
+class ProjectHourlyStatsSerializer(StatsSerializer):
+    class Meta:
+        model = ProjectHourlyStats
+        fields = "__all__"
+
+
 class TagSerializer(AdminLocaleStringSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
@@ -399,14 +453,12 @@ class TagSerializer(AdminLocaleStringSerializerMixin, serializers.ModelSerialize
     def to_representation(self, obj):
         result = super(TagSerializer, self).to_representation(obj)
         # find correct localized strings
-        session = None
-        if "session" in self.context:
-            session = self.context["session"]
+        language_id = _get_language_id(self.context)
 
         # TODO: determine who is using these loc_* fields - not in spec doc!
         # TODO: `filter` field is also not in spec doc
         for field in ["loc_msg", "loc_description"]:
-            result[field] = _select_localized_string(result[field], session=session)
+            result[field] = _localize(getattr(obj, field).all(), language_id)
 
         # rename fields to use *_id convention and for _loc consistency
         result['project_id'] = result['project']
@@ -420,13 +472,17 @@ class TagSerializer(AdminLocaleStringSerializerMixin, serializers.ModelSerialize
 
         del result["relationships_old"]
 
-        tagrelationships = TagRelationship.objects.filter(tag=result["id"])
-        serializer = TagRelationshipSerializer(tagrelationships, many=True)
+        serializer = TagRelationshipSerializer(obj.tagrelationship_set.all(), many=True)
 
         result["relationships"] = serializer.data
 
         return result
 
+    @staticmethod
+    def prefetch(queryset):
+        return queryset.prefetch_related('loc_msg', 'loc_description', 'relationships_old',
+                                         'tagrelationship_set')
+
 
 class TagCategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -471,78 +527,45 @@ class TimedAssetSerializer(serializers.ModelSerializer):
         return result
 
 
-class UIConfigSerializer(AdminLocaleStringSerializerMixin, serializers.ModelSerializer):
-    class Meta:
-        model = UIGroup
-        exclude = ('active', 'index', 'name', 'project', 'ui_mode')
-
-    def to_representation(self, obj):
-        result = super(UIConfigSerializer, self).to_representation(obj)
-        # replace tag_category.id with capitalized tag_category.name
-        tc = TagCategory.objects.get(pk=result['tag_category'])
-        result['group_short_name'] = tc.name.title()
-        del result['tag_category']
-        # session, passed in context, is used to determine string localization
-        session = None
-        if "session" in self.context:
-            session = self.context["session"]
-
-        # localize strings per language associated with session
-        for field in ["header_text_loc"]:
-            result[field] = _select_localized_string(result[field], session=session)
-
-        result['header_display_text'] = result['header_text_loc']
-        del result['header_text_loc']
-
-        uiitems = UIItem.objects.filter(ui_group=result["id"], active=True)
-
-        # filter listen display_items to one per tag_id; speak returns all
-        if self.context["mode"] == "listen":
-            used_tag_ids = []
-            exclude_uiitem_ids = []
-            for uiitem in uiitems:
-                # if tag_id already iterated, exclude from queryset
+def build_uiconfig(uigroups, session=None):
+    """
+    The api/2/projects/:id/uiconfig/ document for the listen and speak groups
+    of a queryset of UIGroups, with strings localized to the session language. Built in one
+    pass over prefetched groups, items, tags and strings into plain dicts, so
+    it can be cached as is.
+    """
+    language_id = _get_language_id({"session": session})
+    uigroups = uigroups.filter(ui_mode__in=(UIGroup.LISTEN, UIGroup.SPEAK)) \
+                       .select_related('tag_category') \
+                       .prefetch_related('header_text_loc', 'uiitem_set__tag__loc_msg')
+    config = {UIGroup.LISTEN: [], UIGroup.SPEAK: []}
+    for uigroup in uigroups:
+        listen = uigroup.ui_mode == UIGroup.LISTEN
+        display_items = []
+        used_tag_ids = set()
+        for uiitem in uigroup.uiitem_set.all():
+            if not uiitem.active:
+                continue
+            # listen returns one display_item per tag_id; speak returns all
+            if listen:
                 if uiitem.tag_id in used_tag_ids:
-                    exclude_uiitem_ids.append(uiitem.id)
-                else:
-                    used_tag_ids.append(uiitem.tag_id)
-            uiitems = uiitems.exclude(pk__in=exclude_uiitem_ids)
-
-        serializer = UIConfigItemSerializer(uiitems, context={"session": session, "mode": self.context["mode"]}, many=True)
-        result["display_items"] = serializer.data
-        del result['id']
-
-        return result
-
-
-class UIConfigItemSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = UIItem
-        exclude = ('active', 'index', 'ui_group')
-
-    def to_representation(self, obj):
-        result = super(UIConfigItemSerializer, self).to_representation(obj)
-        result['tag_id'] = result['tag']
-        del result['tag']
-        result['parent_id'] = result['parent']
-        del result['parent']
-        result['default_state'] = result['default']
-        del result['default']
-        # session, passed in context, is used to determine string localization
-        session = None
-        if "session" in self.context:
-            session = self.context["session"]
-
-        # display localized tag text in addition to tag_id
-        tlm = Tag.objects.filter(pk=result['tag_id']).values_list('loc_msg__id', flat=True)
-        lm = _select_localized_string(tlm, session=session)
-        result['tag_display_text'] = lm
-
-        # set all parent_ids to "null" for listen items to flatten response
-        if self.context["mode"] == "listen":
-            result['parent_id'] = None
-
-        return result
+                    continue
+                used_tag_ids.add(uiitem.tag_id)
+            display_items.append({
+                "id": uiitem.id,
+                "tag_id": uiitem.tag_id,
+                # listen items have no parents, to flatten the response
+                "parent_id": None if listen else uiitem.parent_id,
+                "default_state": uiitem.default,
+                "tag_display_text": _localize(uiitem.tag.loc_msg.all(), language_id),
+            })
+        config[uigroup.ui_mode].append({
+            "select": uigroup.select,
+            "group_short_name": uigroup.tag_category.name.title(),
+            "header_display_text": _localize(uigroup.header_text_loc.all(), language_id),
+            "display_items": display_items,
+        })
+    return config
 
 
 class UIElementSerializer(serializers.ModelSerializer):
@@ -561,25 +584,27 @@ class UIElementSerializer(serializers.ModelSerializer):
         return result
 
 
-class UIElementProjectSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = UIElement
-        exclude = ('id', 'project', 'variant', 'file_extension')
-
-    def to_representation(self, obj):
-        result = super(UIElementProjectSerializer, self).to_representation(obj)
-        uien = UIElementName.objects.filter(id=result['uielementname'])[0]
-
-        # concatenate full file name for client convenience
-        result['file_name'] = uien.name + obj.variant + "." + obj.file_extension
-
-        # display localized label text
-        lt = _select_localized_string_with_code(result['label_text_loc'], self.context["lc"])
-        result['label_text'] = lt
-
-        del result['uielementname']
-        del result['label_text_loc']
-        return {uien.name: result}
+def build_uielements(uielements, language_id):
+    """
+    The uielements of api/2/projects/:id/uielements/ for a queryset of
+    UIElements: for each UIElementName view, the elements of that view keyed by
+    name, with label text localized to language_id. Built in one pass over
+    elements prefetched with their names and labels.
+    """
+    uielements = uielements.select_related('uielementname').prefetch_related('label_text_loc')
+    views = OrderedDict((str(view), {}) for view, label in UIElementName.VIEWS)
+    for uielement in uielements:
+        uien = uielement.uielementname
+        if uien.view not in views:
+            continue
+        views[uien.view][uien.name] = {
+            "label_text_color": uielement.label_text_color,
+            "label_position": uielement.label_position,
+            # concatenate full file name for client convenience
+            "file_name": uien.name + uielement.variant + "." + uielement.file_extension,
+            "label_text": _localize(uielement.label_text_loc.all(), language_id),
+        }
+    return views
 
 
 class UIElementNameSerializer(serializers.ModelSerializer):
@@ -605,20 +630,20 @@ class UIGroupSerializer(AdminLocaleStringSerializerMixin, serializers.ModelSeria
         result['project_id'] = result['project']
         del result['project']
         # find correct localized strings
-        session = None
-        if "session" in self.context:
-            session = self.context["session"]
-
+        language_id = _get_language_id(self.context)
         for field in ["header_text_loc"]:
-            result[field] = _select_localized_string(result[field], session=session)
+            result[field] = _localize(getattr(obj, field).all(), language_id)
 
-        uiitems = UIItem.objects.filter(ui_group=result["id"])
-        serializer = UIItemSerializer(uiitems, many=True)
+        serializer = UIItemSerializer(obj.uiitem_set.all(), many=True)
 
         result["ui_items"] = serializer.data
 
         return result
 
+    @staticmethod
+    def prefetch(queryset):
+        return queryset.prefetch_related('header_text_loc', 'uiitem_set')
+
 
 class UIItemSerializer(serializers.ModelSerializer):
     class Meta:
@@ -708,29 +733,41 @@ class VoteSerializer(serializers.ModelSerializer):
         del result["asset"]
         result["session_id"] = result["session"]
         del result["session"]
-        result["asset_votes"] = vote_count_by_asset(result["asset_id"])
+        result["asset_votes"] = format_vote_counts(obj.asset.voteaggregate_set.all())
         return result
 
+    @staticmethod
+    def prefetch(queryset):
+        return queryset.prefetch_related('asset__voteaggregate_set')
+
+
+def _get_language_id(context):
+    """
+    Id of the Language to localize strings to: the language of the session or
+    language_code in the serializer context, or English. Stored in the context
+    so it is only looked up once per response.
+    """
+    if "_language_id" not in context:
+        lang = None
+        if context.get("session") is not None:
+            lang = Language.objects.filter(pk=context["session"].language_id).first()
+        elif context.get("language_code") is not None:
+            lang = Language.objects.filter(language_code=context["language_code"]).first()
+        if lang is None:
+            lang = Language.objects.get(language_code="en")
+        context["_language_id"] = lang.id
+    return context["_language_id"]
 
-class VoteSummarySerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Vote
-        fields = "__all__"
 
-    def to_representation(self, obj):
-        result = super(VoteSummarySerializer, self).to_representation(obj)
-        type = None
-        if "type" in self.context:
-            type = self.context["type"]
-        del result["voter"]
-        result["asset_id"] = result["asset"]
-        del result["asset"]
-        del result["session"]
-        del result["value"]
-        del result["id"]
-        del result["type"]
-        result["asset_votes"] = vote_summary_by_asset(result["asset_id"], type)
-        return result
+def _localize(loc_strs, language_id):
+    """
+    Return the text of the first LocalizedString in the given language.
+    Pass related managers' .all() so prefetched strings are used.
+    """
+    for loc_str in loc_strs:
+        if loc_str.language_id == language_id:
+            return loc_str.localized_string
+    return None
 
 
 def _select_localized_string(loc_str_ids, session=None):
@@ -747,18 +784,3 @@ def _select_localized_string(loc_str_ids, session=None):
         if loc_str.language == lang:
             return loc_str.localized_string
     return None
-
-
-def _select_localized_string_with_code(loc_str_ids, language_code):
-    if language_code is not None:
-        try:
-            lang = Language.objects.get(language_code=language_code)
-        except Language.DoesNotExist:
-            lang = Language.objects.get(language_code="en")
-    else:
-        lang = Language.objects.get(language_code="en")
-    for loc_str_id in loc_str_ids:
-        loc_str = LocalizedString.objects.get(pk=loc_str_id)
-        if loc_str.language == lang:
-            return loc_str.localized_string
-    return None
@@ -0,0 +1,130 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Query budget for API V2 read endpoints. Two projects of different size are
+# seeded from rw/baker_recipes.py and every endpoint is requested for both; an
+# endpoint fails if serving the larger project costs more queries, i.e. if a
+# serializer queries per row.
+#
+# Sizes can be raised to benchmark response times, printing a report:
+#   QUERY_BUDGET_SIZES=10,1000 QUERY_BUDGET_REPORT=1 ./manage.py test roundware.api2.test_query_budget \
+#     --settings=roundware.settings.testing
+from __future__ import unicode_literals
+import os
+import sys
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from model_bakery import baker
+
+from roundware.rw.models import Language, ProjectGroup, UIGroup
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+SIZES = [int(size) for size in os.environ.get("QUERY_BUDGET_SIZES", "2,6").split(",")]
+
+# Endpoints which still run per-row queries. They are measured and reported
+# but not held to the budget.
+KNOWN_UNBOUNDED = ()
+
+
+def seed_project(size, language):
+    """
+    Create a project with `size` of each tag, ui group, ui element, asset, vote
+    and event, and a project group holding it and size - 1 further projects,
+    all named with the returned prefix.
+    """
+    name = "seed%d-" % size
+    project = baker.make_recipe('rw.project', name=name + "0")
+    session = baker.make_recipe('rw.default_session', project=project, language=language)
+    for i in range(size):
+        text = baker.make_recipe('rw.localized_string', language=language,
+                                 localized_string="project%s-%s" % (project.id, i))
+        tag = baker.make_recipe('rw.tag', project=project, loc_msg=[text], loc_description=[text])
+        parent = baker.make_recipe('rw.tag_relationship', tag=tag)
+        baker.make_recipe('rw.tag_relationship', tag=tag, parent=parent)
+        for ui_mode in (UIGroup.LISTEN, UIGroup.SPEAK):
+            uigroup = baker.make_recipe('rw.uigroup', project=project, ui_mode=ui_mode,
+                                        tag_category=tag.tag_category, header_text_loc=[text])
+            baker.make_recipe('rw.uiitem', ui_group=uigroup, tag=tag)
+        baker.make_recipe('rw.uielement', project=project, label_text_loc=[text])
+
+        asset = baker.make_recipe('rw.asset', project=project, session=session, language=language,
+                                  user=baker.make('auth.User'), tags=[tag], loc_description=[text])
+        baker.make_recipe('rw.listen_event', session=session, asset=asset)
+        baker.make_recipe('rw.vote', session=session, asset=asset)
+        baker.make_recipe('rw.event', session=session)
+
+    projects = [project]
+    for i in range(1, size):
+        text = baker.make_recipe('rw.localized_string', language=language)
+        projects.append(baker.make_recipe('rw.project', name=name + str(i), description_loc=[text]))
+    projectgroup = baker.make(ProjectGroup, projects=projects, active=True)
+    return name, project, session, projectgroup
+
+
+def endpoints(name, project, session, projectgroup):
+    """
+    (url name, url args, query parameters) for each endpoint, scoped to a
+    single seeded project.
+    """
+    return [
+        ("asset-list", [], {"project_id": project.id, "paginate": "false"}),
+        ("event-list", [], {"session_id": session.id}),
+        ("listenevent-list", [], {"project_id": project.id}),
+        ("localizedstring-list", [], {"localized_string": "project%s-" % project.id}),
+        ("project-list", [], {"name": name}),
+        ("project-assets", [project.id], {}),
+        ("project-tags", [project.id], {"session_id": session.id}),
+        ("project-uiconfig", [project.id], {"session_id": session.id}),
+        ("project-uielements", [project.id], {"variant": "@2x"}),
+        ("project-uigroups", [project.id], {"session_id": session.id}),
+        ("projectgroup-projects", [projectgroup.id], {"latitude": 0, "longitude": 0}),
+        ("tag-list", [], {"project_id": project.id}),
+        ("uigroup-list", [], {"project_id": project.id, "session_id": session.id}),
+        ("uiitem-list", [], {"project_id": project.id}),
+        ("vote-list", [], {"project_id": project.id}),
+    ]
+
+
+class TestQueryBudget(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.english = baker.make(Language, language_code='en')
+        cls.user = baker.make('auth.User')
+        cls.seeds = [seed_project(size, cls.english) for size in SIZES]
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def measure(self, name, args, params):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.time()
+            response = self.client.get(reverse(name, args=args), params, format='json')
+            elapsed = time.time() - start
+        self.assertEqual(response.status_code, status.HTTP_200_OK, "%s: %s" % (name, response.data))
+        return len(queries), elapsed
+
+    def test_query_counts_do_not_grow_with_result_size(self):
+        results = {}
+        for seed in self.seeds:
+            for name, args, params in endpoints(*seed):
+                results.setdefault(name, []).append(self.measure(name, args, params))
+
+        if os.environ.get("QUERY_BUDGET_REPORT"):
+            sys.stderr.write("\n%-24s %s\n" % ("endpoint", "  ".join("size %-13d" % s for s in SIZES)))
+            for name, measurements in sorted(results.items()):
+                sys.stderr.write("%-24s %s\n" % (name, "  ".join("%4d q %7.1f ms" % (count, elapsed * 1000)
+                                                               for count, elapsed in measurements)))
+
+        for name, measurements in results.items():
+            if name in KNOWN_UNBOUNDED:
+                continue
+            with self.subTest(endpoint=name):
+                counts = [count for count, elapsed in measurements]
+                self.assertEqual(min(counts), max(counts),
+                                 "%s query count grows with result size: %s" % (name, counts))
@@ -3,21 +3,32 @@
 
 
 from __future__ import unicode_literals
+from base64 import urlsafe_b64encode
 import datetime
+import json
+import os
+import tempfile
 
 from django.urls import reverse
 from model_bakery import baker
 
 from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 
+from roundware.api2 import cache as api_cache
+from roundware.lib import stats
 from roundware.rw.models import (ListeningHistoryItem, Asset, Project,
                                  Audiotrack, Session, Envelope,
-                                 Speaker, LocalizedString, UIGroup, UIItem,
-                                 Language, Tag, TagCategory)
+                                 Speaker, LocalizedString, UIElement, UIElementName, UIGroup, UIItem,
+                                 Language, Tag, TagCategory, ProjectGroup, Event)
 
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 
 TEST_POLYGONS = {
     "crazy_shape": "MULTIPOLYGON(((-0.774183051414968 -0.120296667618684,-0.697181433024807 0.197879831012361,-0.52645517133469 0.200040922932489,-0.444333678369823 -0.0571290155627506,-0.468105689491232 -0.245144012613892,-0.774183051414968 -0.120296667618684)),((-1.25042096457759 0.204363106772745,-1.01702303720376 0.504754883670546,-0.599932296619044 0.625776031197718,-0.152586269152534 0.448566493747217,0.0354287278986072 0.00122046628070716,-0.109364430749973 -0.30349349445735,-0.340601266203676 -0.487186307668236,-0.811719304791594 -0.487186307668236,-1.0969834382485 -0.331587689419015,-1.25042096457759 0.204363106772745),(-0.774183051414968 -0.120296667618684,-0.811719304791594 -0.275399299495685,-0.504844252133409 -0.374809527821576,-0.314668163162139 -0.327265505578759,-0.239029945957657 -0.0506457398023664,-0.362212185404957 0.325384254299917,-0.796591661350698 0.35563954118171,-0.880874246235692 0.122241613807879,-0.958673555360303 -0.0917064862847996,-0.889518613916205 -0.0247126367608296,-0.796591661350698 -0.111156313565952,-0.774183051414968 -0.120296667618684)))",
@@ -178,16 +189,33 @@ class TestServer(APITestCase):
         self.speaker1 = baker.make(Speaker, project=self.project1,
                                    shape=TEST_POLYGONS["crazy_shape"],
                                    attenuation_distance=100, activeyn=True)
+        self.projectgroup1 = baker.make(ProjectGroup, projects=[self.project1], active=True)
 
     def test_api2_in_order(self):
         self.users_post()
         self.sessions_post()
+        self.sessions_playlist_get()
         self.projects_get()
         self.projects_tags_get()
+        self.projects_tags_cached_get()
+        self.projects_uiconfig_get()
+        self.projects_uielements_get()
         self.projects_assets_get()
+        self.assets_stream_get()
+        self.projects_asset_points_get()
         self.vote_assets_post()
         self.vote_assets_get()
+        self.votes_summary_get()
+        self.assets_blocked_get()
         self.assets_random_get()
+        self.assets_radius_get()
+        self.assets_status_get()
+        self.projectgroups_projects_get()
+        self.uploads_resumable()
+        self.events_batch_post()
+        self.events_cursor_get()
+        self.stats_get()
+        self.assets_list_query_count()
 
         # some endpoints cannot be tested currently
         # self.streams_post()
@@ -241,6 +269,32 @@ class TestServer(APITestCase):
         # check geo_listen_enabled returns same as passed param, not project value
         self.assertEqual(response.data["geo_listen_enabled"], False)
 
+    def sessions_playlist_get(self):
+        url = reverse('session-playlist', args=[self.session_id])
+        response = self.client.get(url, {"limit": 5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["session_id"], self.session_id)
+        self.assertEqual(len(response.data["tracks"]), 1)
+        track = response.data["tracks"][0]
+        self.assertEqual(track["track_id"], self.track1.id)
+        # each project asset is returned at most once without repeatrecordings
+        asset_ids = [item["asset_id"] for item in track["items"]]
+        self.assertEqual(sorted(asset_ids), [self.asset1.id, self.asset2.id])
+        for item in track["items"]:
+            self.assertLessEqual(item["fadein"], item["duration"] / 2)
+            self.assertLessEqual(item["fadeout"], item["duration"] / 2)
+        # away from asset1, which sits at 0.1, 0.1; asset2 has no location and
+        # is heard everywhere
+        response = self.client.get(url, {"latitude": 1.1, "longitude": 0.1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        asset_ids = [item["asset_id"] for item in response.data["tracks"][0]["items"]]
+        self.assertEqual(asset_ids, [self.asset2.id])
+        # latitude without longitude is rejected
+        response = self.client.get(url, {"latitude": 0.1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {"latitude": "abc", "longitude": 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def projects_get(self):
         url = "%s?session_id=%s" % (reverse('project-detail', args=[self.project1.id]), self.session_id)
         response = self.client.get(url, format='json')
@@ -260,6 +314,58 @@ class TestServer(APITestCase):
         self.assertEqual(len(response.data), 2)
         self.assertEqual(response.data[0]["project_id"], self.project1.id)
 
+    def projects_tags_cached_get(self):
+        url = reverse('project-tags', args=[self.project1.id])
+
+        def tag2_value(response):
+            return [t["value"] for t in response.data if t["id"] == self.tag2.id][0]
+        with self.settings(API_CACHE='locmemcache'):
+            caches['locmemcache'].clear()
+            response = self.client.get(url, format='json')
+            self.assertEqual(tag2_value(response), "young")
+            # queryset updates send no signals, so the cached response is served
+            Tag.objects.filter(pk=self.tag2.pk).update(value="old")
+            response = self.client.get(url, format='json')
+            self.assertEqual(tag2_value(response), "young")
+            # saving a Tag invalidates it
+            self.tag2.value = "old"
+            self.tag2.save()
+            response = self.client.get(url, format='json')
+            self.assertEqual(tag2_value(response), "old")
+        self.tag2.value = "young"
+        self.tag2.save()
+
+    def projects_uiconfig_get(self):
+        # browse groups are not part of the uiconfig
+        baker.make(UIGroup, project=self.project1, ui_mode=UIGroup.BROWSE,
+                   tag_category=self.tagcat3, active=True)
+        url = reverse('project-uiconfig', args=[self.project1.id])
+        response = self.client.get(url, {"session_id": self.session.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(response.data), [UIGroup.LISTEN, UIGroup.SPEAK])
+        self.assertEqual(len(response.data["listen"]), 2)
+        self.assertEqual(len(response.data["speak"]), 3)
+        gender = [g for g in response.data["listen"] if g["group_short_name"] == "Gender"][0]
+        self.assertEqual(sorted(gender["display_items"], key=lambda i: i["id"]), [
+            {"id": self.uiitem1.id, "tag_id": self.tag1.id, "parent_id": None,
+             "default_state": self.uiitem1.default, "tag_display_text": "One"},
+            {"id": self.uiitem2.id, "tag_id": self.tag2.id, "parent_id": None,
+             "default_state": self.uiitem2.default, "tag_display_text": None},
+        ])
+
+    def projects_uielements_get(self):
+        name = baker.make(UIElementName, name="logo", view="home")
+        baker.make(UIElement, project=self.project1, uielementname=name, variant="@2x",
+                   file_extension="png", label_text_loc=[self.english_msg, self.spanish_msg])
+        url = reverse('project-uielements', args=[self.project1.id])
+        response = self.client.get(url, {"variant": "@2x", "language_code": "es"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(response.data["uielements"]), sorted(v for v, label in UIElementName.VIEWS))
+        logo = response.data["uielements"]["home"]["logo"]
+        self.assertEqual(logo["file_name"], "logo@2x.png")
+        self.assertEqual(logo["label_text"], "Uno")
+        self.assertEqual(response.data["uielements"]["listen"], {})
+
     def projects_assets_get(self):
         url = reverse('project-assets', args=[self.project1.id])
         data = {}
@@ -291,6 +397,154 @@ class TestServer(APITestCase):
         self.assertEqual(response.data[0]["type"], "rate")
         self.assertEqual(response.data[0]["avg"], 2)
 
+    def votes_summary_get(self):
+        url = reverse('vote-summary')
+        response = self.client.get(url, {"type": "rate"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{"asset_id": 1, "asset_votes": {"average": 2, "count": 1}}])
+        # resubmitting with a new value updates the totals
+        data = {"session_id": self.session_id,
+                "vote_type": "rate",
+                "value": 4}
+        self.client.post('/api/2/assets/1/votes/', data, format='json')
+        response = self.client.get(url, {"type": "rate"}, format='json')
+        self.assertEqual(response.data[0]["asset_votes"], {"average": 4, "count": 1})
+
+    def events_batch_post(self):
+        url = reverse('event-batch')
+        count = Event.objects.count()
+        data = [{"session_id": self.session_id,
+                 "event_type": "start_listen",
+                 "client_time": "Mon, 01 Jan 2024 10:00:00 -0500",
+                 "latitude": "1.0",
+                 "longitude": "2.0"},
+                {"session_id": self.session_id,
+                 "event_type": "stop_listen",
+                 "tag_ids": "1,2"}]
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([e["event_type"] for e in response.data], ["start_listen", "stop_listen"])
+        self.assertEqual(response.data[0]["latitude"], 1.0)
+        self.assertEqual(response.data[1]["tag_ids"], [1, 2])
+        self.assertEqual(Event.objects.count(), count + 2)
+        url = reverse('event-list')
+        response = self.client.get(url, {"server_time": datetime.date.today().isoformat(),
+                                         "event_type": "stop_listen"}, format='json')
+        self.assertEqual([e["tag_ids"] for e in response.data], [[1, 2]])
+        response = self.client.get(url, {"tag_ids": "2,1", "event_type": "listen"}, format='json')
+        self.assertEqual([e["event_type"] for e in response.data], ["stop_listen"])
+        response = self.client.get(url, {"tag_ids__any": "2,3", "event_type": "listen"}, format='json')
+        self.assertEqual([e["event_type"] for e in response.data], ["stop_listen"])
+        response = self.client.get(url, {"bbox": "1.5,0.5,2.5,1.5", "event_type": "listen"}, format='json')
+        self.assertEqual([e["event_type"] for e in response.data], ["start_listen"])
+        response = self.client.get(url, {"latitude": 1.001, "longitude": 2, "radius": 500,
+                                         "event_type": "listen"}, format='json')
+        self.assertEqual([e["event_type"] for e in response.data], ["start_listen"])
+        response = self.client.get(url, {"latitude": 1.1, "longitude": 2, "radius": 500}, format='json')
+        self.assertEqual(response.data, [])
+        # without radius, coordinates match as a prefix like the old text columns
+        response = self.client.get(url, {"latitude": "1.0", "longitude": "2", "event_type": "listen"},
+                                   format='json')
+        self.assertEqual([e["event_type"] for e in response.data], ["start_listen"])
+        response = self.client.get(url, {"latitude": "1.1", "event_type": "listen"}, format='json')
+        self.assertEqual(response.data, [])
+        # an unknown session rejects the whole batch
+        data.append({"session_id": 999999, "event_type": "stop_listen"})
+        response = self.client.post(url, {"events": data}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Event.objects.count(), count + 2)
+
+    def events_cursor_get(self):
+        # events created in the same instant are ordered by id
+        Event.objects.filter(session_id=self.session_id).update(server_time=datetime.datetime(2020, 1, 1))
+        expected = list(Event.objects.filter(session_id=self.session_id)
+                                     .order_by('-server_time', '-id').values_list('id', flat=True))
+        self.assertGreater(len(expected), 2)
+        ids = []
+        url = reverse('event-list')
+        params = {"session_id": self.session_id, "paginate": "cursor", "page_size": 2}
+        while url:
+            response = self.client.get(url, params, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            ids.extend(e["id"] for e in response.data["results"])
+            # the next link carries every parameter
+            url, params = response.data["next"], {}
+        self.assertEqual(ids, expected)
+        response = self.client.get(reverse('event-list'), {"cursor": "bogus"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # valid JSON which is not a position
+        response = self.client.get(reverse('event-list'), {"cursor": urlsafe_b64encode(b"{}").decode('ascii')},
+                                   format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def stats_get(self):
+        stats.rollup()
+        response = self.client.get(reverse('stats-projects'), {"project_id": self.project1.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]["project_id"], self.project1.id)
+        self.assertGreater(response.data[0]["sessions"], 0)
+        response = self.client.get(reverse('stats-sessions'), {"project_id": self.project1.id,
+                                                               "start": datetime.date.today().isoformat()},
+                                   format='json')
+        self.assertEqual(sum(hour["sessions"] for hour in response.data), Session.objects.filter(
+            project=self.project1, starttime__date=datetime.date.today()).count())
+        response = self.client.get(reverse('stats-assets'), {"end": "2000-01-01"}, format='json')
+        self.assertEqual(response.data, [])
+
+    def assets_stream_get(self):
+        url = reverse('asset-list')
+        expected = self.client.get(url, {"project_id": self.project1.id}, format='json').data
+        self.assertGreater(len(expected), 0)
+        response = self.client.get(url, {"project_id": self.project1.id, "format": "ndjson"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], [a["id"] for a in expected])
+        response = self.client.get(reverse('project-assets', args=[self.project1.id]), {"stream": "true"})
+        self.assertTrue(response.streaming)
+        data = json.loads(b"".join(response.streaming_content).decode("utf-8"))
+        self.assertEqual(sorted(a["id"] for a in data), sorted(a["id"] for a in expected))
+
+    def projects_asset_points_get(self):
+        url = reverse('project-assets-points', args=[self.project1.id])
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        assets = Asset.objects.filter(project=self.project1).order_by('id')
+        self.assertEqual(response.data["count"], assets.count())
+        self.assertEqual(response.data["id"], [a.id for a in assets])
+        self.assertEqual(response.data["tag_ids"],
+                         [sorted(a.tags.values_list('id', flat=True)) for a in assets])
+        etag = response["ETag"]
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        # retagging an asset changes the ETag
+        tags = list(assets[0].tags.all())
+        assets[0].tags.clear()
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["tag_ids"][0], [])
+        assets[0].tags.add(*tags)
+
+    def assets_blocked_get(self):
+        url = reverse('asset-blocked')
+        response = self.client.get(url, {"session_id": self.session_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        data = {"session_id": self.session_id,
+                "vote_type": "block_asset"}
+        response = self.client.post('/api/2/assets/2/votes/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(url, {"session_id": self.session_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data["blocked_asset_ids"]), [2])
+        # posting the same vote without a value toggles it off
+        self.client.post('/api/2/assets/2/votes/', data, format='json')
+        response = self.client.get(url, {"session_id": self.session_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
     def assets_random_get(self):
         data = {"mediatype": "audio",
                 "project_id": self.project1.id,
@@ -307,6 +561,138 @@ class TestServer(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 2)
 
+    def assets_radius_get(self):
+        data = {"project_id": self.project1.id,
+                "latitude": 0.1,
+                "longitude": 0.1,
+                "radius": 100}
+        response = self.client.get(reverse('asset-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # asset2 has no location, asset1 sits at the center point
+        self.assertEqual([a["id"] for a in response.data], [self.asset1.id])
+        data["latitude"] = 1.1
+        response = self.client.get(reverse('asset-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 0)
+
+    def assets_status_get(self):
+        processing = baker.make(Asset, project=self.project1, status=Asset.PROCESSING)
+        failed = baker.make(Asset, project=self.project1, status=Asset.FAILED)
+        lists = [(reverse('asset-list'), {"project_id": self.project1.id}),
+                 (reverse('project-assets', args=[self.project1.id]), {})]
+        for url, params in lists:
+            response = self.client.get(url, params, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids = [a["id"] for a in response.data]
+            self.assertIn(self.asset1.id, ids)
+            self.assertNotIn(processing.id, ids)
+            self.assertNotIn(failed.id, ids)
+            # other statuses are listed when asked for
+            response = self.client.get(url, dict(params, status=Asset.PROCESSING), format='json')
+            self.assertEqual([a["id"] for a in response.data], [processing.id])
+        processing.delete()
+        failed.delete()
+
+    def projectgroups_projects_get(self):
+        url = reverse('projectgroup-projects', args=[self.projectgroup1.id])
+        # inside the active speaker
+        response = self.client.get(url, {"latitude": 0.1, "longitude": -0.1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p["project_id"] for p in response.data], [self.project1.id])
+        # outside every speaker of a geo listen project
+        response = self.client.get(url, {"latitude": -0.1, "longitude": 0.1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 0)
+
+    def uploads_resumable(self):
+        with self.settings(MEDIA_ROOT=tempfile.mkdtemp(), RESUMABLE_UPLOAD_DIR=tempfile.mkdtemp()):
+            url = reverse('upload-list')
+            response = self.client.post(url, {"filename": "long.m4a", "size": settings.RESUMABLE_UPLOAD_MAX_SIZE + 1},
+                                        format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            response = self.client.post(url, {"filename": "long.m4a", "size": 10}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(response.data["offset"], 0)
+            detail_url = reverse('upload-detail', args=[response.data["id"]])
+            finalize_url = reverse('upload-finalize', args=[response.data["id"]])
+            # the partial file is not under the public MEDIA_ROOT
+            self.assertFalse(os.listdir(settings.MEDIA_ROOT))
+
+            # other users cannot see or write to the upload
+            other = APIClient()
+            other.force_authenticate(baker.make(User))
+            self.assertEqual(other.get(detail_url).status_code, status.HTTP_404_NOT_FOUND)
+            response = other.put(detail_url, b"01234", content_type='application/octet-stream',
+                                 HTTP_CONTENT_RANGE='bytes 0-4/10')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+            self.assertEqual(other.delete(detail_url).status_code, status.HTTP_404_NOT_FOUND)
+            response = other.post(finalize_url, {"envelope_id": self.envelope1.id}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+            response = self.client.put(detail_url, b"01234", content_type='application/octet-stream',
+                                       HTTP_CONTENT_RANGE='bytes 0-4/10')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data["offset"], 5)
+            # a range beyond the received bytes is rejected with the current offset
+            response = self.client.put(detail_url, b"9", content_type='application/octet-stream',
+                                       HTTP_CONTENT_RANGE='bytes 9-9/10')
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+            self.assertEqual(response.data["offset"], 5)
+            # finalizing an incomplete upload is refused
+            response = self.client.post(finalize_url, {"envelope_id": self.envelope1.id}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+            # resuming from the offset reported by GET
+            self.assertEqual(self.client.get(detail_url).data["offset"], 5)
+            response = self.client.put(detail_url, b"56789", content_type='application/octet-stream',
+                                       HTTP_CONTENT_RANGE='bytes 5-9/10')
+            self.assertEqual(response.data["offset"], 10)
+
+            saved_statuses = []
+
+            def record_status(sender, instance, **kwargs):
+                saved_statuses.append(instance.status)
+            post_save.connect(record_status, sender=Asset)
+            try:
+                response = self.client.post(finalize_url, {"envelope_id": self.envelope1.id,
+                                                           "mediatype": "audio"}, format='json')
+            finally:
+                post_save.disconnect(record_status, sender=Asset)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            asset = Asset.objects.get(pk=response.data["id"])
+            self.assertEqual(asset.status, Asset.PROCESSING)
+            # the Asset is never saved as ready with the unconverted file
+            self.assertNotIn(Asset.READY, saved_statuses)
+            with open(os.path.join(settings.MEDIA_ROOT, asset.filename), 'rb') as f:
+                self.assertEqual(f.read(), b"0123456789")
+            # the upload is removed once it becomes an Asset
+            self.assertEqual(self.client.get(detail_url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def assets_list_query_count(self):
+        project = baker.make(Project)
+        lists = [(reverse('asset-list'), {"project_id": project.id, "paginate": "false"}),
+                 (reverse('project-assets', args=[project.id]), {})]
+
+        def make_assets(count):
+            for i in range(count):
+                user = baker.make(User)
+                baker.make(Asset, project=project, user=user, tags=(self.tag1,),
+                           loc_description=[self.english_msg])
+
+        def count_queries(url, data):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(response.data), len(queries)
+
+        make_assets(2)
+        small = [count_queries(url, data) for url, data in lists]
+        make_assets(10)
+        large = [count_queries(url, data) for url, data in lists]
+        for (small_assets, small_queries), (large_assets, large_queries) in zip(small, large):
+            self.assertEqual((small_assets, large_assets), (2, 12))
+            # serializing more assets must not cost more queries
+            self.assertEqual(small_queries, large_queries)
+
     def ensure_token_required(self):
         self.client.credentials(HTTP_AUTHORIZATION='')
         self.assertRaises(AssertionError, self.sessions_post)
@@ -314,3 +700,20 @@ class TestServer(APITestCase):
         self.assertRaises(AssertionError, self.projects_tags_get)
         self.assertRaises(AssertionError, self.projects_assets_get)
         self.assertRaises(AssertionError, self.vote_assets_post)
+
+
+class TestApiCache(SimpleTestCase):
+
+    def test_receivers_are_connected_at_startup(self):
+        uids = [key[0] for key, receiver in post_save.receivers]
+        self.assertIn("api2_cache_save_rw.Tag", uids)
+
+    def test_invalidate_moves_to_an_unused_generation(self):
+        with self.settings(API_CACHE='locmemcache'):
+            cache = api_cache.get_cache()
+            cache.clear()
+            generations = [api_cache.get_generation(cache)]
+            for i in range(3):
+                api_cache.invalidate()
+                generations.append(api_cache.get_generation(cache))
+            self.assertEqual(len(set(generations)), 4)
@@ -24,6 +24,7 @@ router.register(r'projects', views.ProjectViewSet)
 router.register(r'projectgroups', views.ProjectGroupViewSet)
 router.register(r'sessions', views.SessionViewSet)
 router.register(r'speakers', views.SpeakerViewSet)
+router.register(r'stats', views.StatsViewSet, basename='stats')
 # router.register(r'streams', views.StreamViewSet, base_name="Stream")
 router.register(r'tags', views.TagViewSet)
 router.register(r'tagcategories', views.TagCategoryViewSet)
@@ -33,6 +34,7 @@ router.register(r'uielements', views.UIElementViewSet)
 router.register(r'uielementnames', views.UIElementNameViewSet)
 router.register(r'uigroups', views.UIGroupViewSet)
 router.register(r'uiitems', views.UIItemViewSet)
+router.register(r'uploads', views.UploadViewSet, basename='upload')
 router.register(r'users', views.UserViewSet)
 router.register(r'votes', views.VoteViewSet)
 
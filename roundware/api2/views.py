@@ -6,17 +6,23 @@ from __future__ import unicode_literals
 from django.contrib.auth.models import User
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
+from django.core.exceptions import ValidationError
 from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.conf import settings
+from django.db.models import Min
 from rest_framework.decorators import action
 
 from roundware.rw.models import (Asset, Audiotrack, Event, Envelope, Language, ListeningHistoryItem,
                                  LocalizedString, Project, ProjectGroup, Session, Speaker, Tag, TagCategory,
                                  TagRelationship, TimedAsset, UIElement, UIElementName, UIGroup,
-                                 UIItem, UserProfile, Vote)
+                                 UIItem, UserProfile, Vote, get_blocked_asset_ids)
 from roundware.api2 import serializers
-from roundware.api2.filters import (AssetFilterSet, AudiotrackFilterSet, EnvelopeFilterSet, EventFilterSet,
-                                    LanguageFilterSet, ListeningHistoryItemFilterSet, LocalizedStringFilterSet,
+from roundware.api2.filters import (AssetFilterSet, AssetDailyStatsFilterSet, AudiotrackFilterSet,
+                                    EnvelopeFilterSet, EventFilterSet, LanguageFilterSet,
+                                    ListeningHistoryItemFilterSet, LocalizedStringFilterSet,
+                                    ProjectDailyStatsFilterSet, ProjectHourlyStatsFilterSet,
                                     ProjectFilterSet, ProjectGroupFilterSet, SessionFilterSet, SpeakerFilterSet,
                                     TagFilterSet, TagCategoryFilterSet, TagRelationshipFilterSet, TimedAssetFilterSet,
                                     UIConfigFilterSet, UIElementFilterSet, UIElementNameFilterSet,
@@ -24,8 +30,16 @@ from roundware.api2.filters import (AssetFilterSet, AudiotrackFilterSet, Envelop
 from roundware.lib.api import (get_project_tags_new as get_project_tags,
                                add_asset_to_envelope,
                                save_asset_from_request, vote_asset, get_projects_by_location,
-                               vote_count_by_asset, log_event, save_speaker_from_request)
+                               vote_count_by_asset, vote_summaries, log_event, log_events,
+                               get_asset_points, get_asset_points_etag,
+                               save_speaker_from_request)
+from roundware.lib.playlist import get_session_playlist, DEFAULT_PLAYLIST_LENGTH
+from roundware.lib.exception import RoundException
+from roundware.lib import uploads
+from roundware.api2 import cache as api_cache
+from roundware.api2.pagination import KeysetPagination, wants_keyset_page
 from roundware.api2.permissions import AuthenticatedReadAdminWrite
+from roundware.api2.renderers import STREAMING_RENDERER_CLASSES, stream_list, wants_stream
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated, DjangoObjectPermissions
 from rest_framework.response import Response
@@ -40,6 +54,7 @@ from random import sample
 from datetime import datetime
 from distutils.util import strtobool
 from collections import OrderedDict
+from io import BytesIO
 try:
     from profiling import profile
 except ImportError: # pragma: no cover
@@ -48,6 +63,18 @@ except ImportError: # pragma: no cover
 logger = logging.getLogger(__name__)
 
 
+def _cache_variant(request, session=None):
+    """
+    The request parameters a cached response depends on. session_id only
+    selects the language, so it is replaced by the session's language.
+    """
+    params = request.query_params
+    variant = sorted((key, params.getlist(key)) for key in params if key != "session_id")
+    if session is not None:
+        variant.append(("language_id", session.language_id))
+    return variant
+
+
 # Note: Keep this stuff in alphabetical order!
 
 class AssetPaginationMixin(object):
@@ -99,21 +126,33 @@ class AssetViewSet(viewsets.GenericViewSet, AssetPaginationMixin,):
     """
 
     # TODO: Implement DjangoObjectPermissions
-    queryset = Asset.objects.prefetch_related('tags', 'loc_description', 'loc_alt_text', 'envelope') \
-                            .select_related('session', 'project', 'language', 'initialenvelope').all()
+    queryset = serializers.AssetSerializer.prefetch(Asset.objects.all()) \
+                         .select_related('session', 'project', 'language', 'initialenvelope')
     permission_classes = (IsAuthenticated,)
     pagination_class = AssetPagination
     serializer_class = serializers.AssetSerializer
     filter_backends = (DjangoFilterBackend, OrderingFilter,)
     ordering_fields = ('id', 'session_id', 'audiolength', 'weight', 'volume')
     filter_class = AssetFilterSet
+    renderer_classes = STREAMING_RENDERER_CLASSES
 
     # @profile(stats=True)
     def list(self, request):
         """
         GET api/2/assets/ - retrieve list of Assets filtered by parameters
+        ?paginate=cursor returns pages of page_size (max 1000) with a `next` link
+        ?format=ndjson or ?stream=true streams the full list a chunk at a time
         """
         assets = self.filter_queryset(self.get_queryset())
+        if wants_stream(request):
+            return stream_list(request, assets, serializers.AssetSerializer,
+                               context={"admin": "admin" in request.query_params})
+        if wants_keyset_page(request):
+            paginator = KeysetPagination('created')
+            page = paginator.paginate_queryset(assets, request)
+            serializer = self.get_serializer(page, context={"admin": "admin" in request.query_params}, many=True)
+            return paginator.get_paginated_response(serializer.data)
+
         if "paginate" in request.query_params:
             paginate = strtobool(request.query_params['paginate'])
         else:
@@ -233,7 +272,7 @@ class AssetViewSet(viewsets.GenericViewSet, AssetPaginationMixin,):
         # ensure indices returned are unique
         random_idx = sample(range(asset_count), limit)
         selected_ids = [assets[x] for x in random_idx]
-        results = Asset.objects.filter(id__in=selected_ids)
+        results = serializers.AssetSerializer.prefetch(Asset.objects.filter(id__in=selected_ids))
         serializer = serializers.AssetSerializer(results, many=True)
         return Response(serializer.data)
 
@@ -243,69 +282,22 @@ class AssetViewSet(viewsets.GenericViewSet, AssetPaginationMixin,):
         GET api/2/assets/blocked/ - retrieve list of Assets blocked by
         particular user as represented by session_id param
         """
-        blocked_asset_ids = []
         session_id = request.query_params.get('session_id')
+        if session_id is None or not session_id.isdigit():
+            raise ParseError("a session_id is required for this operation")
+        session = get_object_or_404(Session, pk=session_id)
 
-        # get user id from session_id
-        User = get_user_model()
-        device_id = Session.objects.filter(id=int(session_id))[0].device_id
-        try:
-            voter = User.objects.get(userprofile__device_id=device_id)
-        except:
-            # handle api/1 which will not have User and therefore no voter
-            voter = None
-            logger.info("no user associated with device_id")
-            pass
-        # filter votes for user_id and type='blocked_asset'
-        try:
-            asset_votes = Vote.objects.filter(voter_id=voter.id, type='block_asset')
-        except:
-            asset_votes = []
-            logger.info("user hasn't blocked anything")
-            pass
-        if len(asset_votes) > 0:
-            # extract asset_id from filtered votes and add to blocked_asset_ids
-            for asset_vote in asset_votes:
-                blocked_asset_ids.append(asset_vote.asset_id)
-
-            # generate list of assets associated with users that are blocked
-            assets_of_blocked_user = Vote.objects.filter(voter_id=voter.id, type='block_user') \
-                                                 .values_list('asset_id', flat=True)
-            # generate list of sessions in which blocked assets were created
-            sessions_of_blocked_assets = Asset.objects.filter(id__in=assets_of_blocked_user) \
-                                                      .values_list('session_id', flat=True)
-            # get device_ids associated with list of sessions
-            devices_of_blocked_sessions = Session.objects.filter(id__in=sessions_of_blocked_assets) \
-                                                         .values_list('device_id', flat=True)
-            # get the users associated with device_ids
-            blocked_user_ids = User.objects.filter(userprofile__device_id__in=devices_of_blocked_sessions) \
-                                           .values_list('id', flat=True)
-            # find assets created by blocked users
-            for blocked_user_id in blocked_user_ids:
-                blocked_user_assets = self.assets_by_user(blocked_user_id)
-                # extend user_blocked_list without duplicates
-                blocked_asset_ids.extend(x for x in blocked_user_assets if x not in blocked_asset_ids)
-
+        # one indexed read of the blocked set maintained as votes are recorded;
+        # api/1 sessions have no User and therefore no votes
+        blocked_asset_ids = get_blocked_asset_ids(session.device_id)
+        if blocked_asset_ids:
             result = OrderedDict()
-            result['device_id'] = device_id
-            result['blocked_asset_ids'] = set(blocked_asset_ids)
+            result['device_id'] = session.device_id
+            result['blocked_asset_ids'] = sorted(blocked_asset_ids)
             return Response(result)
         else:
             return Response(status=status.HTTP_204_NO_CONTENT)
 
-    def assets_by_user(self, user_id):
-        """
-        returns a list of asset_ids created by specified user_id
-        """
-        # get user's device_id
-        device_id = UserProfile.objects.filter(user__id=user_id).values('device_id')
-        # get sessions with that device_id
-        device_sessions = Session.objects.filter(device_id=device_id).values_list('id', flat=True)
-        # get asset_ids with that session_id
-        user_asset_ids = Asset.objects.filter(session_id__in=device_sessions).values_list('id', flat=True)
-
-        return user_asset_ids
-
 
 
 class AudiotrackViewSet(viewsets.ViewSet):
@@ -475,6 +467,7 @@ class EventViewSet(viewsets.ViewSet):
     """
     API V2: api/2/events/
             api/2/events/:id/
+            api/2/events/batch/
     """
 
     # TODO: Implement ViewCreate permission.
@@ -484,8 +477,13 @@ class EventViewSet(viewsets.ViewSet):
     def list(self, request):
         """
         GET api/2/events/ - Provides list of Events filtered by parameters
+        ?paginate=cursor returns pages of page_size (max 1000) with a `next` link
         """
         events = EventFilterSet(request.query_params).qs
+        if wants_keyset_page(request):
+            paginator = KeysetPagination('server_time')
+            page = paginator.paginate_queryset(events, request)
+            return paginator.get_paginated_response(serializers.EventSerializer(page, many=True).data)
         serializer = serializers.EventSerializer(events, many=True)
         return Response(serializer.data)
 
@@ -515,6 +513,24 @@ class EventViewSet(viewsets.ViewSet):
         serializer = serializers.EventSerializer(e)
         return Response(serializer.data)
 
+    @action(methods=['post'], detail=False)
+    def batch(self, request):
+        """
+        POST api/2/events/batch/ - Create many Events at once, e.g. events
+        buffered by a client while offline. Takes a list of events, or an
+        object with the list under "events"; each event has the fields of
+        POST api/2/events/.
+        """
+        events = request.data
+        if isinstance(events, dict):
+            events = events.get('events')
+        try:
+            created = log_events(events)
+        except RoundException as e:
+            raise ParseError(str(e))
+        serializer = serializers.EventSerializer(created, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 
 class LanguageViewSet(viewsets.ViewSet):
     """
@@ -596,8 +612,13 @@ class ListenEventViewSet(viewsets.ViewSet):
     def list(self, request):
         """
         GET api/2/listenevents/ - Get ListenEvents by filtering parameters
+        ?paginate=cursor returns pages of page_size (max 1000) with a `next` link
         """
-        events = ListeningHistoryItemFilterSet(request.query_params).qs
+        events = serializers.ListenEventSerializer.prefetch(ListeningHistoryItemFilterSet(request.query_params).qs)
+        if wants_keyset_page(request):
+            paginator = KeysetPagination('starttime')
+            page = paginator.paginate_queryset(events, request)
+            return paginator.get_paginated_response(serializers.ListenEventSerializer(page, many=True).data)
         serializer = serializers.ListenEventSerializer(events, many=True)
         return Response(serializer.data)
 
@@ -671,7 +692,8 @@ class LocalizedStringViewSet(viewsets.ViewSet):
         """
         GET api/2/localizedstrings/ - Provides list of LocalizedStrings filtered by parameters
         """
-        localizedstrings = LocalizedStringFilterSet(request.query_params).qs
+        localizedstrings = serializers.LocalizedStringSerializer.prefetch(
+            LocalizedStringFilterSet(request.query_params).qs)
         serializer = serializers.LocalizedStringSerializer(localizedstrings, many=True)
         return Response(serializer.data)
 
@@ -734,6 +756,7 @@ class ProjectViewSet(viewsets.ViewSet):
             api/2/projects/:id/uigroups/
             api/2/projects/:id/uiconfig/
             api/2/projects/:id/assets/
+            api/2/projects/:id/assets/points/
             api/2/projects/:id/uielements/
     """
     queryset = Project.objects.all()
@@ -749,7 +772,7 @@ class ProjectViewSet(viewsets.ViewSet):
         """
         GET api/2/projects/ - Provides list of Projects filtered by parameters
         """
-        projects = ProjectFilterSet(request.query_params).qs
+        projects = serializers.ProjectSerializer.prefetch(ProjectFilterSet(request.query_params).qs)
         serializer = serializers.ProjectSerializer(projects, many=True)
         return Response(serializer.data)
 
@@ -812,10 +835,12 @@ class ProjectViewSet(viewsets.ViewSet):
         if "session_id" in request.query_params:
             session = get_object_or_404(Session, pk=request.query_params["session_id"])
 
-        tags = get_project_tags(p=pk)
-        serializer = serializers.TagSerializer(tags, context={"session": session,
-                                                              "admin": "admin" in request.query_params}, many=True)
-        return Response(serializer.data)
+        def build():
+            tags = serializers.TagSerializer.prefetch(get_project_tags(p=pk))
+            serializer = serializers.TagSerializer(tags, context={"session": session,
+                                                                  "admin": "admin" in request.query_params}, many=True)
+            return serializer.data
+        return Response(api_cache.get_or_build("project_tags", pk, _cache_variant(request, session), build))
 
     @action(methods=['get'], detail=True)
     def uigroups(self, request, pk=None):
@@ -823,13 +848,14 @@ class ProjectViewSet(viewsets.ViewSet):
         GET api/2/projects/:id/uigroups/ - Get UIGroups for specific Project
         """
         params = request.query_params.copy()
+        session = None
         if "session_id" in params:
             try:
                 session = Session.objects.get(pk=params["session_id"])
             except:
                 raise ParseError("Session not found")
         params["project_id"] = pk
-        uigroups = UIGroupFilterSet(params).qs
+        uigroups = serializers.UIGroupSerializer.prefetch(UIGroupFilterSet(params).qs)
         serializer = serializers.UIGroupSerializer(uigroups,
                                                    context={"admin": "admin" in request.query_params,
                                                             "session": session}, many=True)
@@ -841,40 +867,55 @@ class ProjectViewSet(viewsets.ViewSet):
         GET api/2/projects/:id/uiconfig/ - Get UI config data for specific Project
         """
         params = request.query_params.copy()
+        session = None
         if "session_id" in params:
             try:
                 session = Session.objects.get(pk=params["session_id"])
             except:
                 raise ParseError("Session not found")
-        params["project_id"] = pk
-        params['active'] = 'true'
-        params['ui_mode'] = 'listen'
-        uigroups_listen = UIGroupFilterSet(params).qs
-        serializer_listen = serializers.UIConfigSerializer(uigroups_listen,
-                                                   context={"admin": "admin" in request.query_params,
-                                                            "session": session, "mode": "listen"}, many=True)
-        sld = serializer_listen.data
-        params['ui_mode'] = 'speak'
-        uigroups_speak = UIGroupFilterSet(params).qs
-        serializer_speak = serializers.UIConfigSerializer(uigroups_speak,
-                                                   context={"admin": "admin" in request.query_params,
-                                                            "session": session, "mode": "speak"}, many=True)
-        ssd = serializer_speak.data
-        return Response({ "listen" : sld,
-                          "speak"  : ssd })
 
-    @action(methods=['get'], detail=True)
+        def build():
+            params["project_id"] = pk
+            params['active'] = 'true'
+            # both modes are built from one pass over the groups
+            params.pop('ui_mode', None)
+            return serializers.build_uiconfig(UIGroupFilterSet(params).qs, session)
+        return Response(api_cache.get_or_build("project_uiconfig", pk, _cache_variant(request, session), build))
+
+    @action(methods=['get'], detail=True, renderer_classes=STREAMING_RENDERER_CLASSES)
     def assets(self, request, pk=None):
         """
         GET api/2/projects/:id/assets/ - Get Assets for specific Project
+        ?format=ndjson or ?stream=true streams the list a chunk at a time
         """
         params = request.query_params.copy()
         params["project_id"] = pk
-        assets = AssetFilterSet(params).qs
+        assets = serializers.AssetSerializer.prefetch(AssetFilterSet(params).qs)
+        if wants_stream(request):
+            return stream_list(request, assets, serializers.AssetSerializer,
+                               context={"admin": "admin" in request.query_params})
         # serialize and return
         serializer = serializers.AssetSerializer(assets, context={"admin": "admin" in request.query_params}, many=True)
         return Response(data=serializer.data)
 
+    @action(methods=['get'], detail=True, url_path='assets/points', url_name='assets-points')
+    def asset_points(self, request, pk=None):
+        """
+        GET api/2/projects/:id/assets/points/ - Get id, location, mediatype, length and tag ids
+        of the Assets for specific Project as parallel arrays, for plotting. Takes the same
+        filters as api/2/projects/:id/assets/ and answers If-None-Match with 304.
+        """
+        params = request.query_params.copy()
+        params["project_id"] = pk
+        assets = AssetFilterSet(params).qs
+        etag = quote_etag(get_asset_points_etag(assets, _cache_variant(request)))
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        response = Response(get_asset_points(assets))
+        response["ETag"] = etag
+        return response
+
     @action(methods=['get'], detail=True)
     def uielements(self, request, pk=None):
         """
@@ -890,34 +931,21 @@ class ProjectViewSet(viewsets.ViewSet):
             lc = Language.objects.get(language_code="en")
         if "variant" not in params:
             raise ParseError("Variant param is required.")
-        params["project_id"] = pk
-        uielements = UIElementFilterSet(params).qs
-        r = {}
-        # build data structure for each view individually
-        for uielementview in UIElementName.VIEWS:
-            current_ids = []
-            for uielement in uielements:
-                if uielement.uielementname.view == str(uielementview[0]):
-                    current_ids.append(uielement.id)
-            currentview_uielements = UIElement.objects.filter(id__in=current_ids)
-            serializer = serializers.UIElementProjectSerializer(currentview_uielements,
-                                                                context={"lc": lc.language_code},
-                                                                many=True)
-            # convert from list of dictionaries to dictionary of nested dictionaries
-            s = {}
-            for element in serializer.data:
-                for key, value in element.items():
-                    s[key] = value
-            r[str(uielementview[0])] = s
-
-        # different graphic asset zip file for each variant for each project
-        zip_url = settings.MEDIA_URL + "project" + pk + "-uielements" + params['variant'] + ".zip"
-        # put config as first item for human readability
-        result = OrderedDict()
-        result['config'] = { "project_id": int(pk),
-                             "files_url": zip_url }
-        result['uielements'] = r
-        return Response(result)
+
+        def build():
+            params["project_id"] = pk
+            uielements = UIElementFilterSet(params).qs
+            r = serializers.build_uielements(uielements, lc.id)
+
+            # different graphic asset zip file for each variant for each project
+            zip_url = settings.MEDIA_URL + "project" + pk + "-uielements" + params['variant'] + ".zip"
+            # put config as first item for human readability
+            result = OrderedDict()
+            result['config'] = { "project_id": int(pk),
+                                 "files_url": zip_url }
+            result['uielements'] = r
+            return result
+        return Response(api_cache.get_or_build("project_uielements", pk, _cache_variant(request), build))
 
 
 class ProjectGroupViewSet(viewsets.ViewSet):
@@ -1011,18 +1039,26 @@ class ProjectGroupViewSet(viewsets.ViewSet):
         else:
             return Response({"detail": "Both latitude and longitude parameters are required."})
         # filter for Projects in specified ProjectGroup
-        projects = Project.objects.filter(projectgroup__in=pk)
+        projects = Project.objects.filter(projectgroup=projectgroup)
+
+        # the serialized group is cached per language; only the location
+        # filter runs on every request
+        def build():
+            chooser_projects = serializers.ProjectChooserSerializer.prefetch(projects)
+            serializer = serializers.ProjectChooserSerializer(chooser_projects,
+                                                              context={"language_code": lc},
+                                                              many=True)
+            return serializer.data
+        data = api_cache.get_or_build("projectgroup_projects", pk, [("language_code", lc)], build)
         # filter for Projects at specified location
-        projects_geo_filter = get_projects_by_location(projects, lat, lon)
-        serializer = serializers.ProjectChooserSerializer(projects_geo_filter,
-                                                          context={"language_code": lc},
-                                                          many=True)
-        return Response(serializer.data)
+        project_ids = set(get_projects_by_location(projects, lat, lon).values_list('id', flat=True))
+        return Response([p for p in data if p["project_id"] in project_ids])
 
 
 class SessionViewSet(viewsets.ViewSet):
     """
     API V2: api/2/sessions/
+            api/2/sessions/:id/playlist/
     """
     queryset = Session.objects.all()
     permission_classes = (IsAuthenticated,)
@@ -1092,6 +1128,33 @@ class SessionViewSet(viewsets.ViewSet):
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(methods=['get'], detail=True)
+    def playlist(self, request, pk=None):
+        """
+        GET api/2/sessions/:id/playlist/ - Get the next Assets of each Audiotrack
+        with fade, pan and dead air timings, filtered by listener location and tags
+        """
+        session = self.get_object(pk)
+        params = request.query_params
+        if ("latitude" in params) != ("longitude" in params):
+            raise ParseError("Both latitude and longitude parameters are required.")
+        latitude = longitude = tag_ids = None
+        try:
+            if "latitude" in params:
+                latitude = float(params["latitude"])
+                longitude = float(params["longitude"])
+            if params.get("tag_ids"):
+                tag_ids = [int(t) for t in params["tag_ids"].split(",") if t != ""]
+            limit = int(params.get("limit", DEFAULT_PLAYLIST_LENGTH))
+        except ValueError:
+            raise ParseError("latitude and longitude must be numbers, tag_ids and limit integers")
+        result = get_session_playlist(session,
+                                      latitude=latitude,
+                                      longitude=longitude,
+                                      tag_ids=tag_ids,
+                                      limit=limit)
+        return Response(result)
+
 
 class SpeakerViewSet(viewsets.ViewSet):
     """
@@ -1306,6 +1369,49 @@ class SpeakerViewSet(viewsets.ViewSet):
 #                             status.HTTP_400_BAD_REQUEST)
 
 
+class StatsViewSet(viewsets.ViewSet):
+    """
+    API V2: api/2/stats/projects/
+            api/2/stats/assets/
+            api/2/stats/sessions/
+
+    Read from the rollup tables maintained by `manage.py rollup_stats`, so
+    figures lag the raw listen and session data until its next run.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get_stats(self, request, filterset, serializer, ordering):
+        stats = filterset(request.query_params).qs.order_by(*ordering)
+        return Response(serializer(stats, many=True).data)
+
+    @action(methods=['get'], detail=False)
+    def projects(self, request):
+        """
+        GET api/2/stats/projects/ - Listens, listen duration, sessions and unique devices
+        per project per day, filtered by project_id and start/end dates
+        """
+        return self.get_stats(request, ProjectDailyStatsFilterSet,
+                              serializers.ProjectDailyStatsSerializer, ('project_id', 'date'))
+
+    @action(methods=['get'], detail=False)
+    def assets(self, request):
+        """
+        GET api/2/stats/assets/ - Listens, listen duration and unique devices per asset
+        per day, filtered by project_id, asset_id and start/end dates
+        """
+        return self.get_stats(request, AssetDailyStatsFilterSet,
+                              serializers.AssetDailyStatsSerializer, ('asset_id', 'date'))
+
+    @action(methods=['get'], detail=False)
+    def sessions(self, request):
+        """
+        GET api/2/stats/sessions/ - Sessions and unique devices per project per hour,
+        filtered by project_id and start/end dates
+        """
+        return self.get_stats(request, ProjectHourlyStatsFilterSet,
+                              serializers.ProjectHourlyStatsSerializer, ('project_id', 'hour'))
+
+
 class TagViewSet(viewsets.ViewSet):
     """
     API V2: api/2/tags/
@@ -1325,7 +1431,7 @@ class TagViewSet(viewsets.ViewSet):
         """
         GET api/2/tags/ - Provides list of Tags filtered by parameters
         """
-        tags = TagFilterSet(request.query_params).qs
+        tags = serializers.TagSerializer.prefetch(TagFilterSet(request.query_params).qs)
         session = None
         if "session_id" in request.query_params:
             try:
@@ -1772,7 +1878,7 @@ class UIGroupViewSet(viewsets.ViewSet):
         """
         GET api/2/uigroups/ - Provides list of UIGroups filtered by parameters
         """
-        uigroups = UIGroupFilterSet(request.query_params).qs
+        uigroups = serializers.UIGroupSerializer.prefetch(UIGroupFilterSet(request.query_params).qs)
         session = None
         if "session_id" in request.query_params:
             try:
@@ -1929,6 +2035,87 @@ class UIItemViewSet(viewsets.ViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class UploadViewSet(viewsets.ViewSet):
+    """
+    API V2: api/2/uploads/
+            api/2/uploads/:id/
+            api/2/uploads/:id/finalize/
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get_object(self, pk):
+        try:
+            return uploads.get_upload(pk, owner_id=self.request.user.id)
+        except uploads.UploadNotFound:
+            raise Http404("Upload not found")
+
+    def retrieve(self, request, pk=None):
+        """
+        GET api/2/uploads/:id/ - Get the number of bytes received so far
+        """
+        upload = self.get_object(pk)
+        return Response(upload.as_dict())
+
+    def create(self, request):
+        """
+        POST api/2/uploads/ - Start a resumable upload of `size` bytes
+        """
+        try:
+            upload = uploads.create_upload(request.data.get("filename"), request.data.get("size"),
+                                           request.user.id)
+        except RoundException as e:
+            raise ParseError(str(e))
+        return Response(upload.as_dict(), status=status.HTTP_201_CREATED)
+
+    def update(self, request, pk=None):
+        """
+        PUT api/2/uploads/:id/ - Write the request body at the byte range given
+        in the Content-Range header
+        """
+        upload = self.get_object(pk)
+        try:
+            start, end = uploads.parse_content_range(request.META.get("HTTP_CONTENT_RANGE"))
+            upload.write_range(start, end, request.stream or BytesIO())
+        except uploads.UploadOffsetMismatch as e:
+            return Response(dict(upload.as_dict(), detail=str(e)), status=status.HTTP_409_CONFLICT)
+        except RoundException as e:
+            raise ParseError(str(e))
+        return Response(upload.as_dict())
+
+    def destroy(self, request, pk=None):
+        """
+        DELETE api/2/uploads/:id/ - Abandon an upload
+        """
+        upload = self.get_object(pk)
+        upload.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(methods=['post'], detail=True)
+    def finalize(self, request, pk=None):
+        """
+        POST api/2/uploads/:id/finalize/ - Create an Asset in envelope_id from the
+        completed upload. Accepts the same Asset parameters as POST api/2/assets/
+        """
+        upload = self.get_object(pk)
+        if "envelope_id" not in request.data:
+            raise ParseError("an envelope_id is required for this operation")
+        try:
+            fileitem = upload.open()
+        except uploads.UploadOffsetMismatch as e:
+            return Response(dict(upload.as_dict(), detail=str(e)), status=status.HTTP_409_CONFLICT)
+        try:
+            result = add_asset_to_envelope(request, envelope_id=request.data["envelope_id"],
+                                           fileitem=fileitem)
+        except (RoundException, ValidationError) as e:
+            return Response({"detail": str(e)}, status.HTTP_400_BAD_REQUEST)
+        finally:
+            fileitem.close()
+        upload.delete()
+        asset_obj = Asset.objects.get(pk=result['asset_id'])
+        serializer = serializers.AssetSerializer(asset_obj)
+        return Response(serializer.data)
+
+
 class UserViewSet(viewsets.ViewSet):
     """
     API V2: api/2/users/
@@ -2020,8 +2207,14 @@ class VoteViewSet(viewsets.ViewSet):
     def list(self, request):
         """
         GET api/2/votes/ - Provides list of Votes filtered by parameters
-        """
-        votes = VoteFilterSet(request.query_params).qs
+        ?paginate=cursor returns pages of page_size (max 1000) with a `next` link
+        """
+        votes = serializers.VoteSerializer.prefetch(VoteFilterSet(request.query_params).qs)
+        if wants_keyset_page(request):
+            # votes have no timestamp; ids follow creation order
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(votes, request)
+            return paginator.get_paginated_response(serializers.VoteSerializer(page, many=True).data)
         serializer = serializers.VoteSerializer(votes, many=True)
         return Response(serializer.data)
 
@@ -2086,17 +2279,16 @@ class VoteViewSet(viewsets.ViewSet):
         """
         GET api/2/votes/summary/ - Get summary of votes by type by asset
         """
-        response = []
-        asset_ids = []
         if "type" in request.query_params:
             type = request.query_params["type"]
         else:
             type = None
         votes = VoteFilterSet(request.query_params).qs
-        # serialize and return, deduped by asset_id
-        for vote in votes:
-            if vote.asset_id not in asset_ids:
-                serializer = serializers.VoteSummarySerializer(vote, context={"type": type})
-                asset_ids.append(vote.asset_id)
-                response.append(serializer.data)
+        # assets in the order they were first voted on
+        asset_ids = list(votes.order_by().values('asset_id')
+                              .annotate(first_vote=Min('id'))
+                              .order_by('first_vote')
+                              .values_list('asset_id', flat=True))
+        summaries = vote_summaries(asset_ids, type)
+        response = [{"asset_id": asset_id, "asset_votes": summaries[asset_id]} for asset_id in asset_ids]
         return Response(response)
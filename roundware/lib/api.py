@@ -3,14 +3,18 @@ from django.contrib.gis.geos import Point
 from django.contrib.gis.measure import D
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.move import file_move_safe
 from rest_framework.exceptions import ParseError
 from roundware.rw import models
-from roundware.lib import  discover_audiolength, convertaudio
+from roundware.lib import convertaudio, events, transcode
+from roundware.lib.localization import Localizations
 from roundware.lib.exception import RoundException
 from django.conf import settings
-from django.db.models import Count, Avg
+from django.db import transaction
+from django.db.models import Count, Max, Q
 from django.http import Http404
 import datetime
+import hashlib
 import json
 import os
 import subprocess
@@ -21,18 +25,6 @@ import logging
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
-def t(msg, field, language):
-    """
-    Locates the translation for the msg in the field object for the provided
-    session language.
-    """
-    # TODO: Replace with standard Django internationalization.
-    try:
-        msg = field.filter(language=language)[0].localized_string
-    except:
-        pass
-    return msg
-
 # This function only used by API/2 to keep backwards compatability
 def get_project_tags_old(p=None, s=None):
     if s is None and p is None:
@@ -42,14 +34,20 @@ def get_project_tags_old(p=None, s=None):
         p = s.project
         language = s.language
 
-    uigroups = models.UIGroup.objects.filter(project=p)
+    uigroups = list(models.UIGroup.objects.filter(project=p, active=True).select_related('tag_category'))
+    mappings_by_uigroup = {}
+    for mapping in models.UIItem.objects.filter(ui_group__in=uigroups, active=True).select_related('tag'):
+        mappings_by_uigroup.setdefault(mapping.ui_group_id, []).append(mapping)
+    localizations = Localizations().load(models.UIGroup, 'header_text_loc', [g.id for g in uigroups])
+    tag_ids = [m.tag_id for mappings in mappings_by_uigroup.values() for m in mappings]
+    localizations.load(models.Tag, 'loc_description', tag_ids)
+    localizations.load(models.Tag, 'loc_msg', tag_ids)
     modes = {}
 
     for uigroup in uigroups:
         if uigroup.active:
-            mappings = models.UIItem.objects.filter(
-                ui_group=uigroup, active=True)
-            header = t("", uigroup.header_text_loc, language)
+            mappings = mappings_by_uigroup.get(uigroup.id, [])
+            header = localizations.get(uigroup, 'header_text_loc', [language])
 
             masterD = {'name': uigroup.name,
                        'header_text': header,
@@ -61,7 +59,7 @@ def get_project_tags_old(p=None, s=None):
 
             default = []
             for mapping in mappings:
-                loc_desc = t("", mapping.tag.loc_description, language)
+                loc_desc = localizations.get(mapping.tag, 'loc_description', [language])
                 if mapping.default:
                     default.append(mapping.tag.id)
                 # masterOptionsList.append(mapping.toTagDictionary())
@@ -73,7 +71,7 @@ def get_project_tags_old(p=None, s=None):
                                           'relationships': mapping.tag.get_relationships_old(),
                                           'description': mapping.tag.description, 'shortcode': mapping.tag.value,
                                           'loc_description': loc_desc,
-                                          'value': t("", mapping.tag.loc_msg, language)})
+                                          'value': localizations.get(mapping.tag, 'loc_msg', [language])})
             masterD["options"] = masterOptionsList
             masterD["defaults"] = default
             if uigroup.ui_mode not in modes:
@@ -114,6 +112,41 @@ def log_event(event_type, session_id, form=None):
     s = models.Session.objects.get(id=session_id)
     if not s:
         raise RoundException("Failed to access session: %s " % session_id)
+    e = build_event(event_type, s.id, form)
+    e.save()
+    return e
+
+
+def queue_event(event_type, session_id, form=None):
+    """
+    Log an event without waiting for the insert: it is written with the next
+    batch of lib.events.EventBuffer, or at once if EVENT_BUFFER_ENABLED is
+    off. The session must already be known to exist. Malformed coordinates
+    or tags are left out rather than failing the request being logged.
+    """
+    e = build_event(event_type, session_id, form, strict=False)
+    if settings.EVENT_BUFFER_ENABLED:
+        events.get_buffer().append(e)
+    else:
+        e.save()
+    return e
+
+
+def build_event(event_type, session_id, form=None, strict=True):
+    """
+    Unsaved Event of event_type for the session, with the optional fields
+    described in log_event taken from form. Malformed coordinates or tags
+    raise RoundException, or unless strict are logged and left out.
+    """
+    def parse(parser, *args):
+        try:
+            return parser(*args)
+        except RoundException as error:
+            if strict:
+                raise
+            logger.warning("Session %s - %s event: %s, left out", session_id, event_type, error)
+            return None
+
     client_time = None
     latitude = None
     longitude = None
@@ -128,18 +161,76 @@ def log_event(event_type, session_id, form=None):
             tags = form.get("tag_ids", None)
         data = form.get("data", None)
 
-    e = models.Event(session=s,
+    e = models.Event(session_id=session_id,
                      event_type=event_type,
                      server_time=datetime.datetime.now(),
                      client_time=client_time,
-                     latitude=latitude,
-                     longitude=longitude,
-                     tags=tags,
+                     latitude=parse(parse_event_coordinate, "latitude", latitude),
+                     longitude=parse(parse_event_coordinate, "longitude", longitude),
+                     tags=parse(parse_event_tag_ids, tags),
                      data=data)
-    e.save()
+    # set here as well as in save() since batches are written with bulk_create
+    e.build_location()
     return e
 
 
+def parse_event_coordinate(name, value):
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise RoundException("%s must be a number" % name)
+
+
+def parse_event_tag_ids(value):
+    """
+    List of tag ids from a list or comma separated string of them.
+    """
+    if value in (None, ''):
+        return None
+    if isinstance(value, int):
+        value = [value]
+    elif not isinstance(value, (list, tuple)):
+        value = str(value).split(',')
+    try:
+        return [int(tag_id) for tag_id in value if str(tag_id).strip()]
+    except (TypeError, ValueError):
+        raise RoundException("tags must be a list of tag ids")
+
+
+def log_events(events):
+    """
+    Save a batch of events, possibly for several sessions, in one transaction.
+    Each event is a dict with session_id, event_type and the optional fields
+    of log_event. Nothing is saved unless every event is valid.
+    """
+    if not isinstance(events, list) or not events:
+        raise RoundException("events must be a non-empty list")
+    if len(events) > settings.EVENT_BATCH_MAX:
+        raise RoundException("at most %d events can be posted at once" % settings.EVENT_BATCH_MAX)
+
+    session_ids = set()
+    for i, event in enumerate(events):
+        if not isinstance(event, dict):
+            raise RoundException("event %d is not an object" % i)
+        if not event.get("event_type"):
+            raise RoundException("event %d: an event_type is required" % i)
+        try:
+            session_ids.add(int(event.get("session_id")))
+        except (TypeError, ValueError):
+            raise RoundException("event %d: a session_id is required" % i)
+
+    missing = session_ids - set(models.Session.objects.filter(id__in=session_ids)
+                                                      .values_list('id', flat=True))
+    if missing:
+        raise RoundException("Failed to access sessions: %s" % ", ".join(str(s) for s in sorted(missing)))
+
+    with transaction.atomic():
+        return models.Event.objects.bulk_create(
+            [build_event(event["event_type"], int(event["session_id"]), event) for event in events])
+
+
 def is_listener_in_range_of_stream(form, proj):
     # provide default session_id just in case none gets passed in form
     sn = models.Session.objects.get(id=form.get('session_id', 1))
@@ -264,7 +355,7 @@ def create_envelope(request):
 # returns success bool
 # {"success": true}
 # @profile(stats=True)
-def add_asset_to_envelope(request, envelope_id=None):
+def add_asset_to_envelope(request, envelope_id=None, fileitem=None):
     # get asset_id from the GET request
     asset_id = get_parameter_from_request(request, 'asset_id')
     asset = None
@@ -289,7 +380,7 @@ def add_asset_to_envelope(request, envelope_id=None):
 
     session = envelope.session
 
-    asset = save_asset_from_request(request, session, asset=asset)
+    asset = save_asset_from_request(request, session, asset=asset, fileitem=fileitem)
 
     envelope.assets.add(asset)
     envelope.save()
@@ -310,9 +401,27 @@ def add_asset_to_envelope(request, envelope_id=None):
 
 
 
-def save_asset_from_request(request, session, asset=None):
-    log_event("start_upload", session.id, request.GET)
-    fileitem = asset.file if asset else request.FILES.get('file')
+def store_uploaded_file(fileitem, dest_filepath):
+    """
+    Write an uploaded file to dest_filepath without reading it into memory.
+    Uploads spooled to disk by TemporaryFileUploadHandler are moved into place,
+    anything else is copied chunk by chunk.
+    """
+    if hasattr(fileitem, 'temporary_file_path'):
+        file_move_safe(fileitem.temporary_file_path(), dest_filepath)
+        # temporary files are created private to the worker
+        if settings.FILE_UPLOAD_PERMISSIONS is not None:
+            os.chmod(dest_filepath, settings.FILE_UPLOAD_PERMISSIONS)
+        return
+    with open(dest_filepath, 'wb') as fileout:
+        for chunk in fileitem.chunks():
+            fileout.write(chunk)
+
+
+def save_asset_from_request(request, session, asset=None, fileitem=None):
+    queue_event("start_upload", session.id, request.GET)
+    if fileitem is None:
+        fileitem = asset.file if asset else request.FILES.get('file')
     if fileitem is None or not fileitem.name:
         raise RoundException("No file in request")
 
@@ -353,24 +462,33 @@ def save_asset_from_request(request, session, asset=None):
         dest_filepath = os.path.join(settings.MEDIA_ROOT, dest_filename)
         count += 1
 
-    fileout = open(dest_filepath, 'wb')
-    fileout.write(fileitem.file.read())
-    fileout.close()
+    store_uploaded_file(fileitem, dest_filepath)
+
+    # Audio is converted by the process_media workers unless
+    # ASYNC_MEDIA_PROCESSING is disabled; the Asset keeps the uploaded file
+    # name until its TranscodeJob completes.
+    process_async = mediatype == "audio" and settings.ASYNC_MEDIA_PROCESSING
 
     # Delete the uploaded original after the copy has been made.
     if asset:
-        asset.file.delete()
+        asset.file.delete(save=False)
         asset.file.name = dest_filename
         asset.filename = dest_filename
-        asset.save()
+        # queued audio is saved below, together with its TranscodeJob
+        if not process_async:
+            asset.save()
+    audiolength = None
     # Make sure everything is in wav form only if media type is audio.
-    if mediatype == "audio":
-        newfilename = convertaudio.convert_uploaded_file(dest_filename)
+    if mediatype == "audio" and not process_async:
+        newfilename, audiolength = convertaudio.transcode_uploaded_file(dest_filename)
     else:
         newfilename = dest_filename
     if not newfilename:
         raise RoundException("File not converted successfully: " + newfilename)
 
+    tagset = []
+    desc_locset = []
+    alt_locset = []
     # if the request comes from the django admin interface
     # update the Asset with the right information
     if asset:
@@ -383,7 +501,6 @@ def save_asset_from_request(request, session, asset=None):
         latitude = get_parameter_from_request(request, 'latitude')
         longitude = get_parameter_from_request(request, 'longitude')
 
-        tagset = []
         tags = get_parameter_from_request(request, 'tags')
         if tags is None:
             tags = get_parameter_from_request(request, 'tag_ids')
@@ -394,7 +511,6 @@ def save_asset_from_request(request, session, asset=None):
             except:
                 raise RoundException("Could not decode tag list")
 
-        desc_locset = []
         description_loc_ids = get_parameter_from_request(request, 'description_loc_ids')
         if description_loc_ids is not None:
             ids = description_loc_ids.rstrip(',').split(',')
@@ -403,7 +519,6 @@ def save_asset_from_request(request, session, asset=None):
             except:
                 raise RoundException("Could not decode localized string list")
 
-        alt_locset = []
         alt_text_loc_ids = get_parameter_from_request(request, 'alt_text_loc_ids')
         if alt_text_loc_ids is not None:
             ids = alt_text_loc_ids.rstrip(',').split(',')
@@ -481,6 +596,12 @@ def save_asset_from_request(request, session, asset=None):
                              project=session.project,
                              user=user)
         asset.file.name = dest_filename
+
+    # Queued audio is saved as processing in the same transaction as its
+    # TranscodeJob, so the Asset is never listed with the unconverted file.
+    with transaction.atomic():
+        if process_async:
+            asset.status = models.Asset.PROCESSING
         asset.save()
         # m2m fields must be set after initial object is saved
         for tag in tagset:
@@ -489,16 +610,13 @@ def save_asset_from_request(request, session, asset=None):
             asset.loc_description.add(desc_loc)
         for alt_loc in alt_locset:
             asset.loc_alt_text.add(alt_loc)
+        if process_async:
+            transcode.enqueue_transcode(asset, dest_filename)
 
     # get/set the audio properties of the file only if mediatype is audio and
     # update the Asset
-    if mediatype == "audio":
-        discover_audiolength.discover_and_set_audiolength(
-            asset, newfilename)
-        # set start_time and end_time with initial values
-        asset.start_time = 0.0
-        asset.end_time = asset.audiolength / 1000000000.0
-        asset.save()
+    if not process_async and mediatype == "audio":
+        transcode.finish_audio_asset(asset, newfilename, audiolength)
 
     return asset
 
@@ -570,7 +688,7 @@ def vote_asset(request, asset_id=None):
 
     try:
         voter = User.objects.get(userprofile__device_id=session.device_id)
-        log_event("vote_asset", session_id, form)
+        queue_event("vote_asset", session_id, form)
     except ObjectDoesNotExist:
         # handle api/1 which will not have User and therefore no voter
         voter = None
@@ -583,24 +701,29 @@ def vote_asset(request, asset_id=None):
     except ObjectDoesNotExist:
         raise RoundException("Asset not found.")
 
-    # try to find existing vote for this session and asset
-    existing = models.Vote.objects.filter(session=session, asset=asset, type=form.get('vote_type'))
-    if len(existing) > 0:
-        # if value not included - remove old vote (toggle)
-        if "value" not in form:
-            existing.delete()
-        # if value included - update value and resave
-        else:
-            existing.update(value=form.get('value'))
-        v = existing.first()
-    else:
-        if 'value' not in form:
-            v = models.Vote(
-                asset=asset, session=session, type=form.get('vote_type'), voter=voter)
+    # the vote and the asset's VoteAggregates are written together
+    with transaction.atomic():
+        # try to find existing vote for this session and asset
+        existing = models.Vote.objects.filter(session=session, asset=asset, type=form.get('vote_type'))
+        if len(existing) > 0:
+            # if value not included - remove old vote (toggle)
+            if "value" not in form:
+                existing.delete()
+            # if value included - update value and resave
+            else:
+                # saved one by one so post_save refreshes the asset's totals
+                for vote in existing:
+                    vote.value = form.get('value')
+                    vote.save(update_fields=['value'])
+            v = existing.first()
         else:
-            v = models.Vote(asset=asset, session=session, value=int(
-                form.get('value')), type=form.get('vote_type'), voter=voter)
-        v.save()
+            if 'value' not in form:
+                v = models.Vote(
+                    asset=asset, session=session, type=form.get('vote_type'), voter=voter)
+            else:
+                v = models.Vote(asset=asset, session=session, value=int(
+                    form.get('value')), type=form.get('vote_type'), voter=voter)
+            v.save()
 
     # send signal to stream process to have user_blocked_list updated
     # if new vote is of block_* type
@@ -629,70 +752,112 @@ def vote_asset(request, asset_id=None):
 ###################################
 
 
+def format_vote_counts(aggregates):
+    """
+    Count of votes by vote type, with the average value of rate votes, from
+    the VoteAggregates of an asset.
+    """
+    counts = []
+    for aggregate in sorted(aggregates, key=lambda a: (a.count, a.type)):
+        count = {"type": aggregate.type, "total": aggregate.count}
+        if aggregate.type == models.Vote.RATE and aggregate.avg is not None:
+            count["avg"] = aggregate.avg
+        counts.append(count)
+    return counts
+
+
+def format_vote_summary(aggregates, vote_type=None):
+    """
+    Summary of votes from the VoteAggregates of an asset, restricted to
+    vote_type if given.
+    """
+    if not vote_type:
+        return format_vote_counts(aggregates)
+    aggregate = next((a for a in aggregates if a.type == vote_type), None)
+    count = aggregate.count if aggregate else 0
+    # return vote count only unless type=rating, in which case include average value
+    if vote_type == models.Vote.RATE:
+        return {"average": aggregate.avg if aggregate else None,
+                "count": count}
+    return count
+
+
 def vote_count_by_asset(asset_id):
     """
     Provides a count of votes, by vote type, for a given asset
     """
-    counts = models.Vote.objects.all() \
-                                .filter(asset_id=asset_id) \
-                                .values('type') \
-                                .annotate(total=Count('type')).order_by('total')
-    avg = models.Vote.objects.all().filter(asset_id=asset_id, type="rate").aggregate(Avg('value'))
-    if avg["value__avg"] is not None:
-        for count in counts:
-            if count["type"] == "rate":
-                count["avg"] = avg["value__avg"]
-    return counts
+    return format_vote_counts(models.VoteAggregate.objects.filter(asset_id=asset_id))
+
 
 def vote_summary_by_asset(asset_id, vote_type=None):
     """
     Provides a count of votes, by vote type, for a given asset
     """
-    response = {}
-    counts = models.Vote.objects.all().filter(asset_id=asset_id)
-    if vote_type:
-        counts = counts.filter(type=vote_type)
-        # return vote count only unless type=rating, in which case include average value
-        if vote_type == "rate":
-            avg = models.Vote.objects.all().filter(asset_id=asset_id, type="rate").aggregate(Avg('value'))
-            response["average"] = avg["value__avg"]
-            response["count"] = counts.count()
-        else:
-            response = counts.count()
-    else:
-        counts = counts.values('type') \
-                       .annotate(total=Count('type')).order_by('total')
-        avg = models.Vote.objects.all().filter(asset_id=asset_id, type="rate").aggregate(Avg('value'))
-        if avg["value__avg"] is not None:
-            for count in counts:
-                if count["type"] == "rate":
-                    count["avg"] = avg["value__avg"]
-        response = counts
+    return format_vote_summary(models.VoteAggregate.objects.filter(asset_id=asset_id), vote_type)
 
-    return response
+
+def vote_summaries(asset_ids, vote_type=None):
+    """
+    vote_summary_by_asset for many assets, read with a single query.
+    """
+    aggregates = {}
+    for aggregate in models.VoteAggregate.objects.filter(asset_id__in=asset_ids):
+        aggregates.setdefault(aggregate.asset_id, []).append(aggregate)
+    return {asset_id: format_vote_summary(aggregates.get(asset_id, []), vote_type)
+            for asset_id in asset_ids}
+
+
+def get_asset_points(assets):
+    """
+    Columnar summary of assets for plotting: parallel lists of id, latitude,
+    longitude, mediatype, audiolength and tag ids. Read as plain values in two
+    queries, without building Asset instances.
+    """
+    rows = list(assets.order_by('id').values_list('id', 'latitude', 'longitude',
+                                                  'mediatype', 'audiolength'))
+    tag_ids = {}
+    for asset_id, tag_id in models.Asset.tags.through.objects \
+                                  .filter(asset_id__in=assets.values('id')) \
+                                  .order_by('asset_id', 'tag_id') \
+                                  .values_list('asset_id', 'tag_id'):
+        tag_ids.setdefault(asset_id, []).append(tag_id)
+    columns = list(zip(*rows)) or [(), (), (), (), ()]
+    return {
+        "count": len(rows),
+        "id": list(columns[0]),
+        "latitude": list(columns[1]),
+        "longitude": list(columns[2]),
+        "mediatype": list(columns[3]),
+        "audiolength": list(columns[4]),
+        "tag_ids": [tag_ids.get(asset_id, []) for asset_id in columns[0]],
+    }
+
+
+def get_asset_points_etag(assets, variant):
+    """
+    ETag for get_asset_points of assets, which changes when any of them is
+    added, edited, deleted or retagged. Found from aggregates alone.
+    """
+    asset_totals = assets.order_by().aggregate(count=Count('id'), last_id=Max('id'),
+                                               updated=Max('updated'))
+    tag_totals = models.Asset.tags.through.objects \
+                       .filter(asset_id__in=assets.values('id')) \
+                       .aggregate(count=Count('id'), last_id=Max('id'))
+    state = (sorted(asset_totals.items()), sorted(tag_totals.items()), variant)
+    return hashlib.md5(repr(state).encode('utf-8')).hexdigest()
 
 
 def get_projects_by_location(projects, lat, lon):
     """
     Filters Projects by location, using active speaker ranges;
-    includes global listen projects.
+    includes global listen projects. Containment is resolved by PostGIS in a
+    single query against the speaker shapes.
     """
-    available_projects = []
-    for project in projects:
-        # if global project, add to new available_projects list
-        if not project.geo_listen_enabled:
-            available_projects.append(project)
-        # if not global, get active speakers and see if lat/lon contained in any active speaker
-        else:
-            speakers = models.Speaker.objects.filter(project=project, activeyn=True)
-            for speaker in speakers:
-                user_location = Point(float(lat), float(lon), srid=speaker.shape.srid)
-                inside = user_location.intersects(speaker.shape)
-                # as soon as one speaker is contained, stop iterating and add project to available_projects
-                if inside:
-                    available_projects.append(project)
-                    break
-    return available_projects
+    user_location = Point(float(lon), float(lat), srid=4326)
+    return projects.filter(
+        Q(geo_listen_enabled=False) |
+        Q(speaker__activeyn=True, speaker__shape__intersects=user_location)
+    ).distinct()
 
 # save speaker audio from request and return external url to audio
 def save_speaker_from_request(request):
@@ -709,14 +874,12 @@ def save_speaker_from_request(request):
     dest_filename = dest_file + filename_extension
     dest_filepath = os.path.join(settings.MEDIA_ROOT, dest_filename)
 
-    fileout = open(dest_filepath, 'wb')
-    fileout.write(fileitem.file.read())
-    fileout.close()
+    store_uploaded_file(fileitem, dest_filepath)
 
     # Do I need to delete the original file after copying to rwmedia/?
 
     # Make sure speaker audio is available in both mp3 and wav to be comprehensive
-    newfilename = convertaudio.convert_uploaded_file(dest_filename)
+    newfilename, audiolength = convertaudio.transcode_uploaded_file(dest_filename)
     if not newfilename:
         raise RoundException("File not converted successfully: " + newfilename)
 
@@ -3,37 +3,52 @@
 
 from __future__ import unicode_literals
 from django.conf import settings
-import shutil
 import os
 import ffmpeg
 from .exception import RoundException
 
+# Every uploaded recording is stored in each of these formats.
+TARGET_CODECS = {
+    'wav': 'pcm_s16le',
+    'mp3': 'libmp3lame',
+}
+
 
 # Converts the given file to both wav and mp3 and stores the files in the audio directory.
-# Handles files of various formats depending on the file extension.
-def convert_uploaded_file(filename):
+# Handles files of various formats depending on the file extension. Probes
+# the uploaded file once for its duration, then decodes it once and
+# writes every missing target format from a single ffmpeg invocation.
+# Returns the wav filename and the audio length in nanoseconds.
+def transcode_uploaded_file(filename):
     (filename_prefix, filename_extension) = os.path.splitext(filename)
-    upload_dir = settings.MEDIA_ROOT
-    filepath = os.path.join(upload_dir, filename)
+    filepath = os.path.join(settings.MEDIA_ROOT, filename)
     if not os.path.exists(filepath):
         raise RoundException(
             "Uploaded file not found: " + filepath)
-    else:
-        convert_audio_file(
-            upload_dir, filename_prefix, filename_extension, 'wav')
-        convert_audio_file(
-            upload_dir, filename_prefix, filename_extension, 'mp3')
-        return filename_prefix + '.wav'
-
-
-# Converts the file to the given type, or copies it if it is the correct type.
-def convert_audio_file(upload_dir, filename_prefix, filename_extension, dst_type):
-    filepath = os.path.join(upload_dir, filename_prefix + filename_extension)
-    if filename_extension == "." + dst_type:
-        if not settings.MEDIA_ROOT == upload_dir:
-            shutil.copyfile(
-                filepath,
-                os.path.join(settings.MEDIA_ROOT, filename_prefix + filename_extension))
-    else:
+
+    audiolength = probe_audiolength(filepath)
+
+    source = ffmpeg.input(filepath).audio
+    outputs = []
+    for dst_type, codec in sorted(TARGET_CODECS.items()):
+        # the wav name is returned, so an upload such as X.WAV is still converted to X.wav
+        if filename_extension == "." + dst_type:
+            continue
         output_filepath = os.path.join(settings.MEDIA_ROOT, f"{filename_prefix}.{dst_type}")
-        ffmpeg.input(filepath).output(output_filepath, acodec='libmp3lame').run()
+        outputs.append(ffmpeg.output(source, output_filepath, acodec=codec))
+    if outputs:
+        ffmpeg.merge_outputs(*outputs).overwrite_output().run(quiet=True)
+    return filename_prefix + '.wav', audiolength
+
+
+# Returns the duration of the file in nanoseconds as reported by ffprobe,
+# or None when the file has no readable duration.
+def probe_audiolength(filepath):
+    try:
+        probe = ffmpeg.probe(filepath)
+    except ffmpeg.Error as e:
+        raise RoundException("Recorded file is corrupt: %s %s" % (filepath, e.stderr))
+    duration = probe.get('format', {}).get('duration')
+    if duration is None:
+        return None
+    return int(round(float(duration) * 1000000000))
@@ -0,0 +1,217 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Buffered Event writes. Events logged by requests are collected in memory and
+# inserted by a background thread with bulk_create, every
+# EVENT_BUFFER_FLUSH_INTERVAL milliseconds or as soon as EVENT_BUFFER_MAX_ROWS
+# are waiting, and once more when the process exits. If EVENT_BUFFER_SPILL_DIR
+# is set, pending events are also appended to a file there so that events of a
+# process which dies before flushing are inserted by the next one to start.
+from __future__ import unicode_literals
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections, connection, transaction
+from roundware.rw import models
+import atexit
+import datetime
+import errno
+import json
+import os
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Event fields stored in spill files
+SPILL_FIELDS = ('session_id', 'event_type', 'server_time', 'client_time',
+                'latitude', 'longitude', 'tags', 'data')
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+SPILL_FILE_RE = re.compile(r'^events-(\d+)\.jsonl$')
+# Pending events kept while the database is unavailable, in multiples of max_rows
+MAX_BACKLOG = 50
+
+
+class EventBuffer(object):
+
+    def __init__(self, flush_interval, max_rows, spill_dir=None):
+        self.flush_interval = flush_interval / 1000.0
+        self.max_rows = max_rows
+        self.spill_dir = spill_dir
+        self.rows = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.closed = False
+
+    @property
+    def spill_path(self):
+        return os.path.join(self.spill_dir, 'events-%d.jsonl' % os.getpid())
+
+    def append(self, event):
+        """
+        Queue an unsaved Event for insertion.
+        """
+        self.start()
+        with self.lock:
+            self.rows.append(event)
+            if self.spill_dir:
+                with open(self.spill_path, 'a') as spill:
+                    spill.write(to_json(event) + '\n')
+            full = len(self.rows) >= self.max_rows
+        if full:
+            self.wakeup.set()
+
+    def start(self):
+        """
+        Start the flusher thread, again if the process was forked since.
+        """
+        if self.thread is not None and self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.thread is not None and self.pid == os.getpid():
+                return
+            if self.pid is not None:
+                # rows copied from the parent are the parent's to write
+                self.rows = []
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self.run, name='event-buffer', daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+        if self.spill_dir:
+            self.recover()
+
+    def run(self):
+        try:
+            while not self.closed:
+                self.wakeup.wait(self.flush_interval)
+                self.wakeup.clear()
+                close_old_connections()
+                self.flush()
+        finally:
+            connection.close()
+
+    def flush(self):
+        """
+        Insert all pending events. If the batch is rejected the events are
+        inserted one at a time and those still rejected are dropped; while the
+        database is unavailable they are kept for the next flush.
+        """
+        with self.lock:
+            rows, self.rows = self.rows, []
+        if not rows:
+            return 0
+        try:
+            with transaction.atomic():
+                models.Event.objects.bulk_create(rows, batch_size=self.max_rows)
+            written, rows = len(rows), []
+        except (OperationalError, InterfaceError):
+            logger.exception("Failed to write %d buffered events", len(rows))
+            written = 0
+        except Exception:
+            logger.exception("Failed to write %d buffered events in a batch, writing them one at a time",
+                             len(rows))
+            written, rows = self.write_each(rows)
+        with self.lock:
+            if rows:
+                self.rows = (rows + self.rows)[-self.max_rows * MAX_BACKLOG:]
+            if self.spill_dir:
+                self.write_spill(self.rows)
+        return written
+
+    def write_each(self, rows):
+        """
+        Insert rows one by one, dropping any the database rejects. Returns the
+        number written and the rows left when the database became unavailable.
+        """
+        written = 0
+        for i, row in enumerate(rows):
+            try:
+                with transaction.atomic():
+                    row.save(force_insert=True)
+            except (OperationalError, InterfaceError):
+                logger.exception("Failed to write %d buffered events", len(rows) - i)
+                return written, rows[i:]
+            except Exception:
+                logger.exception("Dropped buffered event %s", to_json(row))
+            else:
+                written += 1
+        return written, []
+
+    def close(self):
+        """
+        Stop the flusher thread and write whatever is still pending.
+        """
+        self.closed = True
+        self.wakeup.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(self.flush_interval + 5)
+        self.flush()
+
+    def write_spill(self, rows):
+        tmp_path = self.spill_path + '.tmp'
+        with open(tmp_path, 'w') as spill:
+            for row in rows:
+                spill.write(to_json(row) + '\n')
+        os.rename(tmp_path, self.spill_path)
+
+    def recover(self):
+        """
+        Queue the events left in the spill files of processes no longer running.
+        """
+        try:
+            filenames = os.listdir(self.spill_dir)
+        except OSError:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            return
+        for filename in filenames:
+            match = SPILL_FILE_RE.match(filename)
+            if not match or is_running(int(match.group(1))):
+                continue
+            path = os.path.join(self.spill_dir, filename)
+            claimed = path + '.%d' % os.getpid()
+            try:
+                # only one process may claim the file
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            with open(claimed) as spill:
+                events = [from_json(line) for line in spill if line.strip()]
+            logger.info("Recovered %d buffered events from %s", len(events), filename)
+            for event in events:
+                self.append(event)
+            os.remove(claimed)
+
+
+def to_json(event):
+    row = {field: getattr(event, field) for field in SPILL_FIELDS}
+    row['server_time'] = event.server_time.strftime(TIME_FORMAT)
+    return json.dumps(row, default=str)
+
+
+def from_json(line):
+    row = json.loads(line)
+    row['server_time'] = datetime.datetime.strptime(row['server_time'], TIME_FORMAT)
+    event = models.Event(**row)
+    event.build_location()
+    return event
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+_buffer = None
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = EventBuffer(settings.EVENT_BUFFER_FLUSH_INTERVAL,
+                              settings.EVENT_BUFFER_MAX_ROWS,
+                              settings.EVENT_BUFFER_SPILL_DIR)
+    return _buffer
@@ -0,0 +1,66 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# In-memory lookup of LocalizedStrings. A Localizations index is filled with
+# one query per localized field for a whole set of objects, after which any
+# (object, field, language) is resolved, with fallback languages, without
+# touching the database. Build one per request, for the objects it returns.
+from __future__ import unicode_literals
+from roundware.rw import models
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def language_id(language):
+    """
+    Id of a Language instance, or the value itself if it is already an id.
+    """
+    return getattr(language, 'pk', language)
+
+
+class Localizations(object):
+
+    def __init__(self):
+        # (model label, field name, object id) -> {language id: string}
+        self.strings = {}
+        self._english_id = None
+
+    @property
+    def english_id(self):
+        if self._english_id is None:
+            english = models.Language.objects.filter(language_code='en').values_list('id', flat=True).first()
+            self._english_id = english or 0
+        return self._english_id
+
+    def load(self, model, field_name, pks):
+        """
+        Read the LocalizedStrings of field_name, a ManyToManyField to
+        LocalizedString on model, for the objects with the given ids.
+        """
+        pks = set(pks)
+        if not pks:
+            return self
+        field = model._meta.get_field(field_name)
+        source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+        rows = field.remote_field.through.objects \
+                    .filter(**{'%s_id__in' % source: pks}) \
+                    .order_by('%s_id' % target) \
+                    .values_list('%s_id' % source, '%s__language_id' % target,
+                                 '%s__localized_string' % target)
+        label = model._meta.label
+        for pk, lang_id, string in rows:
+            # like field.filter(language=...)[0], the first string wins
+            self.strings.setdefault((label, field_name, pk), {}).setdefault(lang_id, string)
+        return self
+
+    def get(self, obj, field_name, languages, default=""):
+        """
+        The string of obj.field_name in the first of languages (Language
+        instances or ids, None entries skipped) that has one, else default.
+        """
+        strings = self.strings.get((obj._meta.label, field_name, obj.pk), {})
+        for language in languages:
+            if language is not None and language_id(language) in strings:
+                return strings[language_id(language)]
+        return default
@@ -0,0 +1,190 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Server-side asset selection and mixing for Audiotracks. Mirrors the logic
+# clients previously ran on the device so they only need to fetch the next
+# few items of each track rather than the project's entire asset list.
+from __future__ import unicode_literals
+from django.conf import settings
+from roundware.rw import models
+import datetime
+import random
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Audiotrack timings are stored in nanoseconds; the playlist is returned in seconds.
+NANOSECONDS = float(1000000000)
+DEFAULT_PLAYLIST_LENGTH = 10
+MAX_PLAYLIST_LENGTH = 100
+
+
+def get_session_playlist(session, latitude=None, longitude=None, tag_ids=None,
+                         limit=DEFAULT_PLAYLIST_LENGTH, rng=None):
+    """
+    Build the next `limit` items for every active Audiotrack of the session's
+    project, given the listener's location and selected tags.
+    """
+    rng = rng or random.Random()
+    limit = max(1, min(int(limit), MAX_PLAYLIST_LENGTH))
+    project = session.project
+
+    candidates = _get_candidate_assets(session, latitude, longitude, tag_ids)
+    recently_played = _get_listening_history(session)
+    timed_asset_ids = set(models.TimedAsset.objects.filter(project=project)
+                                                   .values_list('asset_id', flat=True))
+
+    tracks = []
+    audiotracks = models.Audiotrack.objects.filter(project=project, active=True) \
+                                           .prefetch_related('tag_filters').order_by('id')
+    for track in audiotracks:
+        assets = _filter_for_track(track, candidates)
+        assets = _remove_banned(track, assets, recently_played)
+        assets = _order_assets(project, track, assets, recently_played, timed_asset_ids, rng)
+        tracks.append({"track_id": track.id,
+                       "items": _build_items(track, assets, limit, rng)})
+
+    return {"session_id": session.id,
+            "project_id": project.id,
+            "tracks": tracks}
+
+
+def _get_candidate_assets(session, latitude, longitude, tag_ids):
+    """
+    Return the audio Assets of the session's project matching the listener's
+    tags and, for geo listening sessions, location.
+    """
+    project = session.project
+    assets = models.Asset.objects.filter(project=project, submitted=True, mediatype='audio',
+                                         status=models.Asset.READY) \
+                                 .prefetch_related('tags')
+    if tag_ids:
+        assets = assets.filter(tags__in=tag_ids).distinct()
+    if session.geo_listen_enabled and latitude is not None and longitude is not None \
+            and project.recording_radius:
+        # assets without a location are heard everywhere in the project
+        assets = models.filter_within_radius(assets, latitude, longitude,
+                                             project.recording_radius, keep_unlocated=True)
+    return list(assets)
+
+
+def _get_listening_history(session):
+    """
+    Return a dict of asset_id to the last time it started playing in the session.
+    """
+    history = {}
+    items = models.ListeningHistoryItem.objects.filter(session=session) \
+                                               .values_list('asset_id', 'starttime') \
+                                               .order_by('starttime')
+    for asset_id, starttime in items:
+        history[asset_id] = starttime
+    return history
+
+
+def _filter_for_track(track, assets):
+    """
+    Audiotrack tag_filters limit a track to assets with at least one of its tags.
+    """
+    track_tag_ids = set(tag.id for tag in track.tag_filters.all())
+    if not track_tag_ids:
+        return list(assets)
+    return [a for a in assets if track_tag_ids.intersection(t.id for t in a.tags.all())]
+
+
+def _remove_banned(track, assets, recently_played):
+    """
+    Assets played within the track's banned_duration (seconds) are not eligible,
+    and played assets are only eligible again if the track repeats recordings.
+    """
+    now = datetime.datetime.now()
+    banned_since = now - datetime.timedelta(seconds=track.banned_duration or 0)
+    eligible = []
+    for asset in assets:
+        played_at = recently_played.get(asset.id)
+        if played_at is None:
+            eligible.append(asset)
+        elif track.repeatrecordings and played_at <= banned_since:
+            eligible.append(asset)
+    return eligible
+
+
+def _order_assets(project, track, assets, recently_played, timed_asset_ids, rng):
+    """
+    Order assets per the project ordering, then apply the track's
+    timed_asset_priority. Previously played assets always go last.
+    """
+    if project.ordering == 'by_like':
+        likes = dict(models.VoteAggregate.objects.filter(asset_id__in=[a.id for a in assets], type=models.Vote.LIKE)
+                                                 .values_list('asset_id', 'count'))
+        assets = sorted(assets, key=lambda a: (-likes.get(a.id, 0), a.id))
+    elif project.ordering == 'by_weight':
+        assets = sorted(assets, key=lambda a: (-a.weight, a.id))
+    else:
+        assets = list(assets)
+        rng.shuffle(assets)
+
+    if track.timed_asset_priority == 'discard':
+        assets = [a for a in assets if a.id not in timed_asset_ids]
+    elif track.timed_asset_priority == 'highest':
+        assets = sorted(assets, key=lambda a: a.id not in timed_asset_ids)
+    elif track.timed_asset_priority == 'lowest':
+        assets = sorted(assets, key=lambda a: a.id in timed_asset_ids)
+
+    # sorted() is stable, so unplayed assets keep their order and replays come
+    # back oldest first
+    return sorted(assets, key=lambda a: (a.id in recently_played,
+                                         recently_played.get(a.id, datetime.datetime.min)))
+
+
+def _build_items(track, assets, limit, rng):
+    """
+    Pre-compute dead air, fades, pan and volume for the next `limit` assets.
+    """
+    items = []
+    if not assets:
+        return items
+    # cycle through the list when recordings repeat, otherwise stop at the end
+    count = limit if track.repeatrecordings else min(limit, len(assets))
+    for i in range(count):
+        asset = assets[i % len(assets)]
+        if i == 0 and not track.start_with_silence:
+            deadair = 0.0
+        else:
+            deadair = _uniform(rng, track.mindeadair, track.maxdeadair)
+
+        asset_start = asset.start_time or 0.0
+        asset_end = asset.end_time
+        if asset_end is None and asset.audiolength:
+            asset_end = asset.audiolength / NANOSECONDS
+        available = max(0.0, (asset_end or 0.0) - asset_start)
+
+        duration = _uniform(rng, track.minduration, track.maxduration)
+        if available:
+            duration = min(duration, available)
+            # play a random section of recordings longer than the chosen duration
+            start = asset_start + rng.uniform(0, available - duration)
+        else:
+            start = asset_start
+
+        fadein = min(_uniform(rng, track.minfadeintime, track.maxfadeintime), duration / 2)
+        fadeout = min(_uniform(rng, track.minfadeouttime, track.maxfadeouttime), duration / 2)
+
+        items.append({"asset_id": asset.id,
+                      "file": settings.MEDIA_URL + asset.filename if asset.filename else None,
+                      "deadair": deadair,
+                      "start": start,
+                      "duration": duration,
+                      "fadein": fadein,
+                      "fadeout": fadeout,
+                      "volume": rng.uniform(track.minvolume, track.maxvolume) * (asset.volume or 1.0),
+                      "pan_start": rng.uniform(track.minpanpos, track.maxpanpos),
+                      "pan_end": rng.uniform(track.minpanpos, track.maxpanpos),
+                      "pan_duration": _uniform(rng, track.minpanduration, track.maxpanduration)})
+    return items
+
+
+def _uniform(rng, low, high):
+    """
+    Random value between two nanosecond bounds, returned in seconds.
+    """
+    return rng.uniform(low or 0, high or 0) / NANOSECONDS
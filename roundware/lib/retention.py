@@ -0,0 +1,60 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Removal of Events and ListeningHistoryItems older than a retention window.
+# Rows are deleted oldest first in batches of ids, each in its own short
+# transaction, optionally after being appended to a gzipped JSON lines archive.
+from __future__ import unicode_literals
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from roundware.rw import models
+import datetime
+import gzip
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# model and the time field compared with the cutoff
+PRUNABLE = {
+    'events': (models.Event, 'server_time'),
+    'listenevents': (models.ListeningHistoryItem, 'starttime'),
+}
+
+
+def prune(name, days, batch_size=10000, archive_dir=None, dry_run=False):
+    """
+    Delete rows of PRUNABLE[name] older than `days` days, returning the number
+    of rows deleted (or that would be, with dry_run).
+    """
+    model, time_field = PRUNABLE[name]
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
+    expired = model.objects.filter(**{'%s__lt' % time_field: cutoff})
+    if dry_run:
+        return expired.count()
+
+    archive = None
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+        archive_path = os.path.join(archive_dir, '%s-%s.jsonl.gz' % (name, cutoff.strftime('%Y%m%d%H%M%S')))
+        archive = gzip.open(archive_path, 'at')
+    deleted = 0
+    try:
+        while True:
+            with transaction.atomic():
+                ids = list(expired.order_by(time_field).values_list('id', flat=True)[:batch_size])
+                if not ids:
+                    break
+                batch = model.objects.filter(id__in=ids)
+                if archive:
+                    for row in batch.order_by('id').values():
+                        archive.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+                    archive.flush()
+                batch.delete()
+            deleted += len(ids)
+            logger.info("Pruned %d %s older than %s", deleted, name, cutoff)
+    finally:
+        if archive:
+            archive.close()
+    return deleted
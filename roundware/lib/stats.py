@@ -0,0 +1,135 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Rollups of ListeningHistoryItems and Sessions into the *Stats tables read by
+# api/2/stats/. Each run finds the days (and hours) touched by rows added since
+# the source's StatsWatermark, plus everything within STATS_ROLLUP_LOOKBACK
+# hours to pick up late commits and updated listen durations, and recalculates
+# just those buckets from the raw tables using their time indexes.
+from __future__ import unicode_literals
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from roundware.rw import models
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def day_range(date):
+    start = datetime.datetime.combine(date, datetime.time())
+    return start, start + datetime.timedelta(days=1)
+
+
+def get_new_rows(name, model, time_field, lookback):
+    """
+    Rows of model added since the named watermark or within the lookback
+    window, with the id to move the watermark to.
+    """
+    watermark, created = models.StatsWatermark.objects.select_for_update().get_or_create(name=name)
+    last_id = model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    since = datetime.datetime.now() - datetime.timedelta(hours=lookback)
+    rows = model.objects.filter(id__gt=watermark.last_id, id__lte=last_id) | \
+        model.objects.filter(**{'%s__gte' % time_field: since})
+    return watermark, last_id, rows
+
+
+def rollup_listens(lookback):
+    """
+    Recalculate AssetDailyStats and the listen columns of ProjectDailyStats for
+    every day with new ListeningHistoryItems. Returns the number of days.
+    """
+    watermark, last_id, rows = get_new_rows('listens', models.ListeningHistoryItem, 'starttime', lookback)
+    # listens of assets without a project have nowhere to be counted
+    rows = rows.exclude(asset__project__isnull=True)
+    asset_days = {}
+    for asset_id, date in rows.annotate(date=TruncDate('starttime')) \
+                              .values_list('asset_id', 'date').distinct():
+        asset_days.setdefault(date, set()).add(asset_id)
+
+    for date, asset_ids in asset_days.items():
+        start, end = day_range(date)
+        listens = models.ListeningHistoryItem.objects.filter(starttime__gte=start, starttime__lt=end,
+                                                             asset__project__isnull=False)
+        totals = listens.filter(asset_id__in=asset_ids) \
+                        .values('asset_id', 'asset__project_id') \
+                        .annotate(listens=Count('id'), duration=Sum('duration'),
+                                  devices=Count('session__device_id', distinct=True))
+        project_ids = set()
+        for total in totals:
+            project_ids.add(total['asset__project_id'])
+            models.AssetDailyStats.objects.update_or_create(
+                asset_id=total['asset_id'], date=date,
+                defaults={'project_id': total['asset__project_id'],
+                          'listens': total['listens'],
+                          'duration': total['duration'] or 0,
+                          'devices': total['devices']})
+
+        totals = listens.filter(asset__project_id__in=project_ids) \
+                        .values('asset__project_id') \
+                        .annotate(listens=Count('id'), duration=Sum('duration'),
+                                  devices=Count('session__device_id', distinct=True))
+        for total in totals:
+            models.ProjectDailyStats.objects.update_or_create(
+                project_id=total['asset__project_id'], date=date,
+                defaults={'listens': total['listens'],
+                          'duration': total['duration'] or 0,
+                          'listen_devices': total['devices']})
+
+    watermark.last_id = max(watermark.last_id, last_id)
+    watermark.save()
+    return len(asset_days)
+
+
+def rollup_sessions(lookback):
+    """
+    Recalculate ProjectHourlyStats and the session columns of ProjectDailyStats
+    for every day with new Sessions. Returns the number of days.
+    """
+    watermark, last_id, rows = get_new_rows('sessions', models.Session, 'starttime', lookback)
+    project_days = {}
+    for project_id, date in rows.annotate(date=TruncDate('starttime')) \
+                                .values_list('project_id', 'date').distinct():
+        project_days.setdefault(date, set()).add(project_id)
+
+    for date, project_ids in project_days.items():
+        start, end = day_range(date)
+        sessions = models.Session.objects.filter(project_id__in=project_ids,
+                                                 starttime__gte=start, starttime__lt=end)
+        totals = sessions.annotate(hour=TruncHour('starttime')) \
+                         .values('project_id', 'hour') \
+                         .annotate(sessions=Count('id'), devices=Count('device_id', distinct=True))
+        for total in totals:
+            models.ProjectHourlyStats.objects.update_or_create(
+                project_id=total['project_id'], hour=total['hour'],
+                defaults={'sessions': total['sessions'],
+                          'devices': total['devices']})
+
+        totals = sessions.values('project_id') \
+                         .annotate(sessions=Count('id'), devices=Count('device_id', distinct=True))
+        for total in totals:
+            models.ProjectDailyStats.objects.update_or_create(
+                project_id=total['project_id'], date=date,
+                defaults={'sessions': total['sessions'],
+                          'session_devices': total['devices']})
+
+    watermark.last_id = max(watermark.last_id, last_id)
+    watermark.save()
+    return len(project_days)
+
+
+def rollup(lookback=None):
+    """
+    Bring all stats tables up to date. Each source is rolled up in one
+    transaction, holding its watermark row so concurrent runs wait in turn.
+    """
+    if lookback is None:
+        lookback = settings.STATS_ROLLUP_LOOKBACK
+    results = {}
+    for name, rollup_source in (('listens', rollup_listens), ('sessions', rollup_sessions)):
+        with transaction.atomic():
+            results[name] = rollup_source(lookback)
+        logger.info("Rolled up %s for %d days", name, results[name])
+    return results
@@ -0,0 +1,124 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Database-backed queue for converting uploaded audio outside the request.
+# Jobs are stored in rw_transcodejob and claimed with SELECT ... FOR UPDATE
+# SKIP LOCKED, so any number of `manage.py process_media` worker processes
+# can share the table without an external broker.
+from __future__ import unicode_literals
+from django.conf import settings
+from django.db import transaction
+from roundware.rw import models
+from roundware.lib import discover_audiolength, convertaudio
+from roundware.lib.exception import RoundException
+import datetime
+import time
+import traceback
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_transcode(asset, filename):
+    """
+    Mark the asset as processing and queue conversion of the uploaded file,
+    in one transaction so the asset is not left processing without a job.
+    """
+    with transaction.atomic():
+        asset.status = models.Asset.PROCESSING
+        asset.save()
+        job = models.TranscodeJob.objects.create(asset=asset, filename=filename)
+    logger.info("Asset %s - queued transcode job %s for %s", asset.id, job.id, filename)
+    return job
+
+
+def finish_audio_asset(asset, filename, audiolength=None):
+    """
+    Set audiolength, start_time and end_time from the converted file. Pass the
+    audiolength (nanoseconds) returned by the transcoder to skip re-reading it.
+    """
+    asset.filename = filename
+    if audiolength:
+        asset.audiolength = audiolength
+    else:
+        discover_audiolength.discover_and_set_audiolength(asset, filename)
+    if not asset.audiolength:
+        raise RoundException("Could not determine audio length: " + filename)
+    # set start_time and end_time with initial values
+    asset.start_time = 0.0
+    asset.end_time = asset.audiolength / 1000000000.0
+    asset.status = models.Asset.READY
+    asset.save()
+    return asset
+
+
+def claim_next_job():
+    """
+    Atomically move the oldest pending job to running and return it, or None.
+    """
+    with transaction.atomic():
+        job = models.TranscodeJob.objects.select_for_update(skip_locked=True) \
+                                         .filter(status=models.TranscodeJob.PENDING) \
+                                         .order_by('id').first()
+        if job is None:
+            return None
+        job.status = models.TranscodeJob.RUNNING
+        job.started = datetime.datetime.now()
+        job.attempts += 1
+        job.save()
+    return job
+
+
+def process_job(job):
+    """
+    Convert the job's file and update its Asset. Failed jobs are retried up to
+    settings.TRANSCODE_MAX_ATTEMPTS times before the Asset is marked failed.
+    """
+    try:
+        newfilename, audiolength = convertaudio.transcode_uploaded_file(job.filename)
+        if not newfilename:
+            raise RoundException("File not converted successfully: " + job.filename)
+        asset = models.Asset.objects.get(pk=job.asset_id)
+        finish_audio_asset(asset, newfilename, audiolength)
+        job.status = models.TranscodeJob.DONE
+        job.error = ""
+    except Exception:
+        job.error = traceback.format_exc()
+        logger.error("Transcode job %s failed: %s", job.id, job.error)
+        if job.attempts < settings.TRANSCODE_MAX_ATTEMPTS:
+            job.status = models.TranscodeJob.PENDING
+        else:
+            job.status = models.TranscodeJob.FAILED
+            models.Asset.objects.filter(pk=job.asset_id).update(status=models.Asset.FAILED)
+    job.finished = datetime.datetime.now()
+    job.save()
+    return job
+
+
+def requeue_stale_jobs(timeout):
+    """
+    Return jobs left running longer than `timeout` seconds, e.g. by a killed
+    worker, to the pending state.
+    """
+    cutoff = datetime.datetime.now() - datetime.timedelta(seconds=timeout)
+    return models.TranscodeJob.objects.filter(status=models.TranscodeJob.RUNNING,
+                                              started__lt=cutoff) \
+                                      .update(status=models.TranscodeJob.PENDING)
+
+
+def run_worker(poll_interval=1.0, max_jobs=None):
+    """
+    Process jobs until max_jobs have run, sleeping poll_interval seconds
+    whenever the queue is empty. Runs forever when max_jobs is None.
+    """
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        job = claim_next_job()
+        if job is None:
+            if max_jobs is not None:
+                break
+            time.sleep(poll_interval)
+            continue
+        process_job(job)
+        processed += 1
+    return processed
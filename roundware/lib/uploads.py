@@ -0,0 +1,206 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Resumable uploads: clients create an upload, PUT byte ranges until every
+# byte has arrived, then finalize it into an Asset. Each upload is a directory
+# under RESUMABLE_UPLOAD_DIR, outside the publicly served MEDIA_ROOT, holding
+# upload.json and the partial file, so interrupted transfers only resend the
+# missing range. Uploads are only visible to the user who created them.
+from __future__ import unicode_literals
+from django.conf import settings
+from django.core.files import File
+from roundware.lib.exception import RoundException
+import fcntl
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadNotFound(RoundException):
+    pass
+
+
+class UploadOffsetMismatch(RoundException):
+    pass
+
+
+class ResumableUploadFile(File):
+    """
+    The assembled upload, handed to save_asset_from_request. Exposes
+    temporary_file_path() so store_uploaded_file moves rather than copies it.
+    What is moved is a second link to the data, so the upload keeps its data
+    if creating the Asset fails afterwards.
+    """
+    def __init__(self, upload):
+        self.link_path = os.path.join(upload.path, 'finalize')
+        if os.path.exists(self.link_path):
+            os.remove(self.link_path)
+        os.link(upload.data_path, self.link_path)
+        super(ResumableUploadFile, self).__init__(open(self.link_path, 'rb'), name=upload.filename)
+        self.upload = upload
+
+    def temporary_file_path(self):
+        return self.link_path
+
+    def close(self):
+        super(ResumableUploadFile, self).close()
+        if os.path.exists(self.link_path):
+            os.remove(self.link_path)
+
+
+class ResumableUpload(object):
+
+    def __init__(self, upload_id, filename, size, created, owner_id):
+        self.id = upload_id
+        self.filename = filename
+        self.size = size
+        self.created = created
+        self.owner_id = owner_id
+
+    @property
+    def path(self):
+        return get_upload_root(self.id)
+
+    @property
+    def data_path(self):
+        return os.path.join(self.path, 'data')
+
+    @property
+    def offset(self):
+        """
+        Number of bytes received so far.
+        """
+        return os.path.getsize(self.data_path)
+
+    @property
+    def complete(self):
+        return self.offset == self.size
+
+    def as_dict(self):
+        return {"id": self.id,
+                "filename": self.filename,
+                "size": self.size,
+                "offset": self.offset}
+
+    def write_range(self, start, end, stream):
+        """
+        Write bytes start..end (inclusive) read from stream. A range may resend
+        bytes already received but must not leave a gap.
+        """
+        with open(self.data_path, 'r+b') as data:
+            # one writer at a time, so concurrent PUTs cannot interleave
+            fcntl.flock(data, fcntl.LOCK_EX)
+            offset = os.fstat(data.fileno()).st_size
+            if start > offset:
+                raise UploadOffsetMismatch("Range starts at %d but only %d bytes were received" % (start, offset))
+            if end < start or end >= self.size:
+                raise RoundException("Range %d-%d is outside the upload size %d" % (start, end, self.size))
+            remaining = end - start + 1
+            data.seek(start)
+            while remaining:
+                chunk = stream.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                data.write(chunk)
+                remaining -= len(chunk)
+        if remaining:
+            logger.info("Upload %s - range %d-%d interrupted, %d bytes missing", self.id, start, end, remaining)
+        return self.offset
+
+    def open(self):
+        if not self.complete:
+            raise UploadOffsetMismatch("Upload incomplete: received %d of %d bytes" % (self.offset, self.size))
+        return ResumableUploadFile(self)
+
+    def delete(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def get_upload_root(upload_id=''):
+    return os.path.join(settings.RESUMABLE_UPLOAD_DIR, upload_id)
+
+
+def parse_content_range(header):
+    """
+    Parse a 'bytes start-end/total' Content-Range header into (start, end).
+    """
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise RoundException("Content-Range header must be of the form 'bytes start-end/total'")
+    return int(match.group(1)), int(match.group(2))
+
+
+def create_upload(filename, size, owner_id):
+    """
+    Start a new resumable upload of `size` bytes by the user owner_id.
+    """
+    filename = os.path.basename(filename or '')
+    if not filename:
+        raise RoundException("filename is required for this operation")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise RoundException("size must be the total number of bytes to upload")
+    if size <= 0:
+        raise RoundException("size must be the total number of bytes to upload")
+    if size > settings.RESUMABLE_UPLOAD_MAX_SIZE:
+        raise RoundException("size must be at most %d bytes" % settings.RESUMABLE_UPLOAD_MAX_SIZE)
+
+    remove_expired_uploads()
+    upload = ResumableUpload(uuid.uuid4().hex, filename, size, time.time(), owner_id)
+    os.makedirs(upload.path, mode=0o700)
+    open(upload.data_path, 'wb').close()
+    with open(os.path.join(upload.path, 'upload.json'), 'w') as f:
+        json.dump({"filename": upload.filename,
+                   "size": upload.size,
+                   "created": upload.created,
+                   "owner_id": upload.owner_id}, f)
+    logger.info("Upload %s - created for %s (%d bytes)", upload.id, filename, size)
+    return upload
+
+
+def get_upload(upload_id, owner_id=None):
+    """
+    The upload with the given id. Unless owner_id is None, uploads of other
+    users and uploads which lost their data are reported as not found.
+    """
+    if not UPLOAD_ID_RE.match(upload_id or ''):
+        raise UploadNotFound("Upload not found")
+    try:
+        with open(os.path.join(get_upload_root(upload_id), 'upload.json')) as f:
+            meta = json.load(f)
+    except (IOError, ValueError):
+        raise UploadNotFound("Upload not found")
+    if owner_id is not None and meta.get("owner_id") != owner_id:
+        raise UploadNotFound("Upload not found")
+    upload = ResumableUpload(upload_id, meta["filename"], meta["size"], meta["created"], meta.get("owner_id"))
+    if owner_id is not None and not os.path.isfile(upload.data_path):
+        raise UploadNotFound("Upload not found")
+    return upload
+
+
+def remove_expired_uploads():
+    """
+    Delete uploads older than settings.RESUMABLE_UPLOAD_EXPIRY seconds.
+    """
+    root = get_upload_root()
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - settings.RESUMABLE_UPLOAD_EXPIRY
+    for upload_id in os.listdir(root):
+        try:
+            upload = get_upload(upload_id)
+        except UploadNotFound:
+            continue
+        if upload.created < cutoff:
+            upload.delete()
@@ -6,6 +6,8 @@ from guardian.admin import GuardedModelAdmin
 from guardian.shortcuts import get_objects_for_user
 from .models import *
 from django.contrib import admin
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
 from roundware.rw.admin_helper import add_asset_to_envelope, create_envelope
 from roundware.rw.filters import AudiolengthListFilter, TagCategoryListFilter
@@ -170,6 +172,13 @@ class AssetAdmin(ProjectProtectedModelAdmin):
         extra_context['extends_url'] = "admin/change_list.html"
         return super(AssetAdmin, self).changelist_view(request, extra_context=extra_context)
 
+    def get_queryset(self, request):
+        # vote totals for the sortable get_likes and get_flags columns
+        aggregates = VoteAggregate.objects.filter(asset=OuterRef('pk'))
+        return super(AssetAdmin, self).get_queryset(request).annotate(
+            likes=Coalesce(Subquery(aggregates.filter(type=Vote.LIKE).values('count')), 0),
+            flags=Coalesce(Subquery(aggregates.filter(type=Vote.FLAG).values('count')), 0))
+
     def lookup_allowed(self, lookup, *args, **kwargs):
         if lookup.startswith(self.valid_lookups):
             return True
@@ -436,6 +445,8 @@ class EventAdmin(ProjectProtectedThroughSessionModelAdmin):
     # search_fields = ('session',)
     list_filter = ('event_type', 'server_time')
     ordering = ['-id']
+    # counting every row is slow on large tables
+    show_full_result_count = False
 
 
 class EnvelopeAdmin(ProjectProtectedThroughSessionModelAdmin):
@@ -520,6 +531,7 @@ class SpeakerAdmin(LeafletGeoAdmin, ProjectProtectedModelAdmin):
 class ListeningHistoryItemAdmin(ProjectProtectedThroughAssetModelAdmin):
     list_display = ('id', 'session', 'asset', 'starttime', 'norm_duration')
     ordering = ['session']
+    show_full_result_count = False
 
 
 class TimedAssetAdmin(ProjectProtectedModelAdmin):
@@ -529,6 +541,43 @@ class TimedAssetAdmin(ProjectProtectedModelAdmin):
     list_filter = ('project__name',)
 
 
+class TranscodeJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'asset', 'filename', 'status', 'attempts', 'created', 'finished')
+    list_filter = ('status',)
+    readonly_fields = ('asset', 'filename', 'attempts', 'error', 'created', 'started', 'finished')
+    ordering = ['-id']
+
+
+class StatsAdmin(admin.ModelAdmin):
+    # rows are written by `manage.py rollup_stats`
+    list_filter = ('project',)
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class AssetDailyStatsAdmin(StatsAdmin):
+    list_display = ('date', 'project', 'asset', 'listens', 'devices', 'duration')
+    date_hierarchy = 'date'
+    ordering = ['-date', 'asset']
+
+
+class ProjectDailyStatsAdmin(StatsAdmin):
+    list_display = ('date', 'project', 'listens', 'listen_devices', 'duration', 'sessions', 'session_devices')
+    date_hierarchy = 'date'
+    ordering = ['-date', 'project']
+
+
+class ProjectHourlyStatsAdmin(StatsAdmin):
+    list_display = ('hour', 'project', 'sessions', 'devices')
+    date_hierarchy = 'hour'
+    ordering = ['-hour', 'project']
+
+
 admin.site.register(Language, LanguageAdmin)
 admin.site.register(LocalizedString, LocalizedStringAdmin)
 admin.site.register(Session, SessionAdmin)
@@ -549,3 +598,7 @@ admin.site.register(Envelope, EnvelopeAdmin)
 admin.site.register(ListeningHistoryItem, ListeningHistoryItemAdmin)
 admin.site.register(Vote, VoteAdmin)
 admin.site.register(TimedAsset, TimedAssetAdmin)
+admin.site.register(TranscodeJob, TranscodeJobAdmin)
+admin.site.register(AssetDailyStats, AssetDailyStatsAdmin)
+admin.site.register(ProjectDailyStats, ProjectDailyStatsAdmin)
+admin.site.register(ProjectHourlyStats, ProjectHourlyStatsAdmin)
@@ -2,9 +2,11 @@ from __future__ import unicode_literals
 #from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
 
-from model_bakery.recipe import Recipe
+from model_bakery.recipe import Recipe, foreign_key, seq
 
-from roundware.rw.models import Session
+from roundware.rw.models import (Asset, Event, ListeningHistoryItem, LocalizedString,
+                                 Project, Session, Tag, TagCategory, TagRelationship,
+                                 UIElement, UIElementName, UIGroup, UIItem, Vote)
 from roundware.settings import DEFAULT_SESSION_ID
 
 # User = get_user_model()
@@ -20,3 +22,70 @@ basic_user = Recipe(
 )
 
 default_session = Recipe(Session)
+
+# Recipes used to seed projects of arbitrary size, see roundware/api2/test_query_budget.py
+project = Recipe(
+    Project,
+    name=seq('project'),
+    geo_listen_enabled=False,
+)
+
+localized_string = Recipe(
+    LocalizedString,
+    localized_string=seq('string'),
+)
+
+tag_category = Recipe(
+    TagCategory,
+    name=seq('category'),
+)
+
+tag = Recipe(
+    Tag,
+    value=seq('tag'),
+    tag_category=foreign_key(tag_category),
+    filter='',
+    location=None,
+)
+
+tag_relationship = Recipe(TagRelationship, parent=None)
+
+uigroup = Recipe(
+    UIGroup,
+    name=seq('group'),
+    active=True,
+    index=seq(0),
+)
+
+uiitem = Recipe(
+    UIItem,
+    active=True,
+    index=seq(0),
+    parent=None,
+)
+
+uielementname = Recipe(
+    UIElementName,
+    name=seq('element'),
+    view='home',
+)
+
+uielement = Recipe(
+    UIElement,
+    uielementname=foreign_key(uielementname),
+    variant='@2x',
+    file_extension='png',
+)
+
+asset = Recipe(
+    Asset,
+    mediatype='audio',
+    submitted=True,
+    audiolength=5000000000,
+)
+
+listen_event = Recipe(ListeningHistoryItem, duration=5000000000)
+
+event = Recipe(Event, event_type='start_session')
+
+vote = Recipe(Vote, type=Vote.LIKE)
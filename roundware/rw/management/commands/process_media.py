@@ -0,0 +1,48 @@
+from . import RoundwareCommand
+from django import db
+from roundware.lib import transcode
+import multiprocessing
+
+
+def _worker(poll_interval):
+    # connections must not be shared with the parent process
+    db.connections.close_all()
+    transcode.run_worker(poll_interval=poll_interval)
+
+
+class Command(RoundwareCommand):
+    args = ''
+    help = 'Runs a pool of worker processes converting queued audio uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help='Number of worker processes (default: number of CPUs)')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait between polls of an empty queue')
+        parser.add_argument('--stale-timeout', type=int, default=3600,
+                            help='Requeue jobs left running for this many seconds')
+        parser.add_argument('--once', action='store_true',
+                            help='Process the pending jobs in this process and exit')
+
+    def handle(self, *args, **options):
+        requeued = transcode.requeue_stale_jobs(options['stale_timeout'])
+        if requeued:
+            self.stdout.write("Requeued %s stale jobs" % requeued)
+
+        if options['once']:
+            processed = transcode.run_worker(max_jobs=float('inf'))
+            self.stdout.write("Processed %s jobs" % processed)
+            return
+
+        self.stdout.write("Starting %s media workers" % options['processes'])
+        db.connections.close_all()
+        workers = [multiprocessing.Process(target=_worker, args=(options['poll_interval'],))
+                   for i in range(options['processes'])]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
@@ -0,0 +1,32 @@
+from . import RoundwareCommand
+from django.conf import settings
+from roundware.lib import retention
+
+
+class Command(RoundwareCommand):
+    args = ''
+    help = 'Deletes Events and ListenEvents older than the retention window, optionally archiving them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event-days', type=int, default=settings.EVENT_RETENTION_DAYS,
+                            help='Keep this many days of Events (default: EVENT_RETENTION_DAYS)')
+        parser.add_argument('--listen-days', type=int, default=settings.LISTEN_EVENT_RETENTION_DAYS,
+                            help='Keep this many days of ListenEvents (default: LISTEN_EVENT_RETENTION_DAYS)')
+        parser.add_argument('--archive', default=settings.EVENT_ARCHIVE_DIR,
+                            help='Directory to append deleted rows to as gzipped JSON lines')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Rows deleted per transaction')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many rows would be deleted')
+
+    def handle(self, *args, **options):
+        for name, days in (('events', options['event_days']), ('listenevents', options['listen_days'])):
+            if days is None:
+                self.stdout.write("No retention set for %s" % name)
+                continue
+            count = retention.prune(name, days, batch_size=options['batch_size'],
+                                    archive_dir=options['archive'], dry_run=options['dry_run'])
+            if options['dry_run']:
+                self.stdout.write("Would delete %s %s older than %s days" % (count, name, days))
+            else:
+                self.stdout.write("Deleted %s %s older than %s days" % (count, name, days))
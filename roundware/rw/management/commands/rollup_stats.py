@@ -0,0 +1,17 @@
+from . import RoundwareCommand
+from django.conf import settings
+from roundware.lib import stats
+
+
+class Command(RoundwareCommand):
+    args = ''
+    help = 'Updates the listen and session stats tables with rows added since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lookback', type=int, default=settings.STATS_ROLLUP_LOOKBACK,
+                            help='Also recalculate the last LOOKBACK hours (default: STATS_ROLLUP_LOOKBACK)')
+
+    def handle(self, *args, **options):
+        results = stats.rollup(options['lookback'])
+        for name, days in sorted(results.items()):
+            self.stdout.write("Rolled up %s for %s days" % (name, days))
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rw', '0037_asset_file_and_loc_caption'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asset',
+            name='location',
+            field=django.contrib.gis.db.models.fields.PointField(blank=True, editable=False, geography=True, null=True, srid=4326),
+        ),
+        migrations.RunSQL(
+                # backfill the geography point from existing coordinates
+                "UPDATE rw_asset SET location = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography "
+                "WHERE latitude IS NOT NULL AND longitude IS NOT NULL;",
+                reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rw', '0038_asset_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asset',
+            name='status',
+            field=models.CharField(choices=[('ready', 'ready'), ('processing', 'processing'), ('failed', 'failed')], default='ready', max_length=16),
+        ),
+        migrations.CreateModel(
+            name='TranscodeJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(max_length=256)),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=16)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(default=datetime.datetime.now)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rw.Asset')),
+            ],
+            options={
+                'verbose_name': 'Transcode Job',
+                'verbose_name_plural': 'Transcode Jobs',
+                'index_together': {('status', 'id')},
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rw', '0039_transcodejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlockedAsset',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rw.Asset')),
+                ('vote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rw.Vote')),
+                ('voter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('vote', 'asset')},
+                'index_together': {('voter', 'asset')},
+            },
+        ),
+        # build the blocked sets from existing votes
+        migrations.RunSQL(
+            """
+            INSERT INTO rw_blockedasset (voter_id, asset_id, vote_id)
+            SELECT voter_id, asset_id, id FROM rw_vote
+            WHERE type = 'block_asset' AND voter_id IS NOT NULL;
+            INSERT INTO rw_blockedasset (voter_id, asset_id, vote_id)
+            SELECT DISTINCT v.voter_id, a.id, v.id FROM rw_vote v
+            JOIN rw_asset voted ON voted.id = v.asset_id
+            JOIN rw_session voted_session ON voted_session.id = voted.session_id
+            JOIN rw_session s ON s.device_id = voted_session.device_id
+            JOIN rw_asset a ON a.session_id = s.id
+            WHERE v.type = 'block_user' AND v.voter_id IS NOT NULL
+            AND voted_session.device_id <> '';
+            """,
+            migrations.RunSQL.noop),
+    ]
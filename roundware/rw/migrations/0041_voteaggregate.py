@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rw', '0040_blockedasset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('like', 'like'), ('flag', 'flag'), ('rate', 'rate'), ('block_asset', 'block_asset'), ('block_user', 'block_user')], max_length=16)),
+                ('count', models.IntegerField(default=0)),
+                ('sum', models.IntegerField(default=0)),
+                ('avg', models.FloatField(blank=True, null=True)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rw.Asset')),
+            ],
+            options={
+                'unique_together': {('asset', 'type')},
+                'index_together': {('type', 'count')},
+            },
+        ),
+        # totals for existing votes
+        migrations.RunSQL(
+            """
+            INSERT INTO rw_voteaggregate (asset_id, type, count, sum, avg)
+            SELECT asset_id, type, COUNT(*), COALESCE(SUM(value), 0), AVG(value)
+            FROM rw_vote GROUP BY asset_id, type;
+            """,
+            migrations.RunSQL.noop),
+    ]
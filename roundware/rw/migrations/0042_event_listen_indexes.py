@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rw', '0041_voteaggregate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['session', 'server_time'], name='rw_event_session_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['event_type', 'server_time'], name='rw_event_type_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listeninghistoryitem',
+            index=models.Index(fields=['session', 'starttime'], name='rw_listen_session_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listeninghistoryitem',
+            index=models.Index(fields=['asset', 'starttime'], name='rw_listen_asset_time_idx'),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.fields
+from django.contrib.postgres.indexes import GinIndex
+from django.db import migrations, models
+
+# casts text to double precision, or NULL for anything the cast rejects,
+# including numbers such as 1e400 which are out of range
+TO_FLOAT_SQL = """
+CREATE FUNCTION pg_temp.rw_to_float(value text) RETURNS double precision AS $$
+BEGIN
+    RETURN value::double precision;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rw', '0042_event_listen_indexes'),
+    ]
+
+    operations = [
+        # coordinates which do not cast to double precision cannot be converted
+        migrations.RunSQL(
+            TO_FLOAT_SQL +
+            "UPDATE rw_event SET latitude = NULL "
+            "WHERE latitude IS NOT NULL AND pg_temp.rw_to_float(latitude) IS NULL;"
+            "UPDATE rw_event SET longitude = NULL "
+            "WHERE longitude IS NOT NULL AND pg_temp.rw_to_float(longitude) IS NULL;"
+            "DROP FUNCTION pg_temp.rw_to_float(text);",
+            reverse_sql=migrations.RunSQL.noop
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='location',
+            field=django.contrib.gis.db.models.fields.PointField(blank=True, editable=False, geography=True, null=True, srid=4326),
+        ),
+        migrations.RunSQL(
+            # backfill the geography point from the coordinates, where they are in range
+            "UPDATE rw_event SET location = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography "
+            "WHERE latitude BETWEEN -90 AND 90 AND longitude BETWEEN -180 AND 180;",
+            reverse_sql=migrations.RunSQL.noop
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='tag_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, null=True, size=None),
+        ),
+        migrations.RunSQL(
+            # comma separated tag ids to an integer array, skipping anything else
+            "UPDATE rw_event SET tag_ids = ARRAY("
+            "SELECT trim(t)::integer FROM unnest(string_to_array(tags, ',')) AS t "
+            "WHERE trim(t) ~ '^\\d{1,9}$') "
+            "WHERE tags IS NOT NULL AND tags <> '';",
+            reverse_sql=migrations.RunSQL.noop
+        ),
+        migrations.RemoveField(
+            model_name='event',
+            name='tags',
+        ),
+        migrations.RenameField(
+            model_name='event',
+            old_name='tag_ids',
+            new_name='tags',
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=GinIndex(fields=['tags'], name='rw_event_tags_gin'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rw', '0043_event_typed_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AssetDailyStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('listens', models.IntegerField(default=0)),
+                ('duration', models.BigIntegerField(default=0)),
+                ('devices', models.IntegerField(default=0)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rw.Asset')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rw.Project')),
+            ],
+            options={
+                'verbose_name': 'Asset Daily Stats',
+                'verbose_name_plural': 'Asset Daily Stats',
+                'unique_together': {('asset', 'date')},
+                'index_together': {('project', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ProjectDailyStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('listens', models.IntegerField(default=0)),
+                ('duration', models.BigIntegerField(default=0)),
+                ('listen_devices', models.IntegerField(default=0)),
+                ('sessions', models.IntegerField(default=0)),
+                ('session_devices', models.IntegerField(default=0)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rw.Project')),
+            ],
+            options={
+                'verbose_name': 'Project Daily Stats',
+                'verbose_name_plural': 'Project Daily Stats',
+                'unique_together': {('project', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ProjectHourlyStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('sessions', models.IntegerField(default=0)),
+                ('devices', models.IntegerField(default=0)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rw.Project')),
+            ],
+            options={
+                'verbose_name': 'Project Hourly Stats',
+                'verbose_name_plural': 'Project Hourly Stats',
+                'unique_together': {('project', 'hour')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['project', 'starttime'], name='rw_session_project_time_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rw', '0044_stats_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['created', 'id'], name='rw_asset_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['server_time', 'id'], name='rw_event_time_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listeninghistoryitem',
+            index=models.Index(fields=['starttime', 'id'], name='rw_listen_time_id_idx'),
+        ),
+    ]
@@ -3,6 +3,7 @@
 
 
 from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
 from django.core.cache import cache
 
 cache # pyflakes, make sure it is imported, for patching in tests
@@ -12,11 +13,14 @@ from django.core.exceptions import NON_FIELD_ERRORS
 from django.utils.safestring import mark_safe
 from django.db import transaction
 from django.contrib.gis.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from rw.fields import ValidatedFileField
 from django.conf import settings
 from datetime import datetime
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.db.models import Manager as GeoManager
+from django.db.models import Q
 import logging
 from geopy.distance import distance
 
@@ -29,6 +33,14 @@ class Asset(models.Model):
     """
     ASSET_MEDIA_TYPES = [('audio', 'audio'), ('video', 'video'),
                          ('photo', 'photo'), ('text', 'text')]
+    READY = 'ready'
+    PROCESSING = 'processing'
+    FAILED = 'failed'
+    STATUSES = (
+        (READY, 'ready'),
+        (PROCESSING, 'processing'),
+        (FAILED, 'failed'),
+    )
     MEDIATYPE_CONTENT_TYPES = {
         'audio': settings.ALLOWED_AUDIO_MIME_TYPES,
         'video': [],
@@ -39,6 +51,10 @@ class Asset(models.Model):
     class Meta:
         ordering = ['id']
         app_label = 'rw'
+        indexes = [
+            # keyset pagination of api/2/assets/
+            models.Index(fields=['created', 'id'], name='rw_asset_created_id_idx'),
+        ]
 
     session = models.ForeignKey(
         'Session', null=True, blank=True, on_delete = models.SET_NULL)
@@ -46,6 +62,9 @@ class Asset(models.Model):
         settings.AUTH_USER_MODEL, null=True, blank=True, on_delete = models.SET_NULL)
     latitude = models.FloatField(null=True, blank=False)
     longitude = models.FloatField(null=True, blank=False)
+    # geography point kept in sync with latitude/longitude on save; backs
+    # radius queries with a GiST index
+    location = models.PointField(geography=True, null=True, blank=True, editable=False)
     shape = models.MultiPolygonField(geography=True, null=True, blank=True)
     filename = models.CharField(max_length=256, null=True, blank=True)
     file = ValidatedFileField(storage=FileSystemStorage(
@@ -56,6 +75,8 @@ class Asset(models.Model):
     volume = models.FloatField(null=True, blank=True, default=1.0)
 
     submitted = models.BooleanField(default=True)
+    # audio uploads are 'processing' until their TranscodeJob completes
+    status = models.CharField(max_length=16, choices=STATUSES, default=READY)
     project = models.ForeignKey(
         'Project', null=True, blank=False, on_delete = models.SET_NULL)
 
@@ -202,31 +223,35 @@ class Asset(models.Model):
     get_tags.name = "Tags"
     get_tags.allow_tags = True
 
+    def get_vote_count(self, vote_type):
+        for aggregate in self.voteaggregate_set.all():
+            if aggregate.type == vote_type:
+                return aggregate.count
+        return 0
+
     def get_flags(self):
-        return self.vote_set.filter(type__iexact="flag").count()
+        # annotated by AssetAdmin so the column can be sorted
+        if hasattr(self, "flags"):
+            return self.flags
+        return self.get_vote_count("flag")
 
     def get_likes(self):
-        return self.vote_set.filter(type__iexact="like").count()
+        if hasattr(self, "likes"):
+            return self.likes
+        return self.get_vote_count("like")
 
-    # get_flags.admin_order_field = "vote"
+    get_flags.admin_order_field = "flags"
     get_flags.short_description = "Flags"
     get_flags.name = "Flags"
 
-    # get_likes.admin_order_field = "vote"
+    get_likes.admin_order_field = "likes"
     get_likes.short_description = "Likes"
     get_likes.name = "Likes"
 
     def get_votes(self, dict=False):
-        votes = self.vote_set.all()
         votes_dict = {}
-        for v in votes:
-            dict_num = votes_dict.get(v.type, 0)
-            if v.value is None:
-                value = 0
-            else:
-                value = v.value
-            t_dict = {v.type: dict_num + value}
-            votes_dict.update(t_dict)
+        for aggregate in self.voteaggregate_set.all():
+            votes_dict[aggregate.type] = aggregate.sum
         if dict:
             return votes_dict
         return ", ".join("%s : %d" % (v, num) for v, num in votes_dict.items())
@@ -239,8 +264,15 @@ class Asset(models.Model):
         speaker_location = (self.latitude, self.longitude)
         return distance(listener_location, speaker_location)
 
+    def build_location(self):
+        if self.latitude is not None and self.longitude is not None:
+            self.location = Point(float(self.longitude), float(self.latitude), srid=4326)
+        else:
+            self.location = None
+
     @transaction.atomic
     def save(self, force_insert=False, force_update=False, using=None, *args, **kwargs):
+        self.build_location()
         super(Asset, self).save(
             force_insert, force_update, using, *args, **kwargs)
 
@@ -333,9 +365,29 @@ class Event(models.Model):
 
     event_type = models.CharField(max_length=50)
     data = models.TextField(null=True, blank=True)
-    latitude = models.CharField(max_length=50, null=True, blank=True)
-    longitude = models.CharField(max_length=50, null=True, blank=True)
-    tags = models.TextField(null=True, blank=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    location = models.PointField(geography=True, null=True, blank=True, editable=False)
+    tags = ArrayField(models.IntegerField(), null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['session', 'server_time'], name='rw_event_session_time_idx'),
+            models.Index(fields=['event_type', 'server_time'], name='rw_event_type_time_idx'),
+            # time ranges and keyset pagination of api/2/events/
+            models.Index(fields=['server_time', 'id'], name='rw_event_time_id_idx'),
+            GinIndex(fields=['tags'], name='rw_event_tags_gin'),
+        ]
+
+    def build_location(self):
+        if self.latitude is not None and self.longitude is not None:
+            self.location = Point(float(self.longitude), float(self.latitude), srid=4326)
+        else:
+            self.location = None
+
+    def save(self, *args, **kwargs):
+        self.build_location()
+        super(Event, self).save(*args, **kwargs)
 
 
 class Language(models.Model):
@@ -374,6 +426,11 @@ class ListeningHistoryItem(models.Model):
     class Meta:
         verbose_name = 'Listening History Item'
         verbose_name_plural = 'Listening History Items'
+        indexes = [
+            models.Index(fields=['session', 'starttime'], name='rw_listen_session_time_idx'),
+            models.Index(fields=['asset', 'starttime'], name='rw_listen_asset_time_idx'),
+            models.Index(fields=['starttime', 'id'], name='rw_listen_time_id_idx'),
+        ]
 
 
 class LocalizedString(models.Model):
@@ -515,6 +572,11 @@ class Session(models.Model):
     def __str__(self):
         return str(self.id)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'starttime'], name='rw_session_project_time_idx'),
+        ]
+
 
 class Speaker(models.Model):
     """
@@ -681,6 +743,104 @@ class TimedAsset(models.Model):
         verbose_name_plural = 'Timed Assets'
 
 
+class TranscodeJob(models.Model):
+    """
+    Queued conversion of an uploaded audio file, run by the process_media workers
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'pending'),
+        (RUNNING, 'running'),
+        (DONE, 'done'),
+        (FAILED, 'failed'),
+    )
+    asset = models.ForeignKey(Asset, on_delete = models.CASCADE)
+    # uploaded file name relative to MEDIA_ROOT
+    filename = models.CharField(max_length=256)
+    status = models.CharField(max_length=16, choices=STATUSES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(default=datetime.now)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return "%s: Asset id: %s: %s" % (self.id, self.asset_id, self.status)
+
+    class Meta:
+        verbose_name = 'Transcode Job'
+        verbose_name_plural = 'Transcode Jobs'
+        index_together = [('status', 'id')]
+
+
+class StatsWatermark(models.Model):
+    """
+    Id of the last row of a source table included in the stats rollups
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "%s: %s" % (self.name, self.last_id)
+
+
+class AssetDailyStats(models.Model):
+    """
+    ListeningHistoryItems of an Asset per day, maintained by `manage.py rollup_stats`
+    """
+    asset = models.ForeignKey(Asset, on_delete = models.CASCADE)
+    project = models.ForeignKey(Project, on_delete = models.CASCADE)
+    date = models.DateField()
+    listens = models.IntegerField(default=0)
+    # nanoseconds
+    duration = models.BigIntegerField(default=0)
+    devices = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Asset Daily Stats'
+        verbose_name_plural = 'Asset Daily Stats'
+        unique_together = [('asset', 'date')]
+        index_together = [('project', 'date')]
+
+
+class ProjectDailyStats(models.Model):
+    """
+    Listens and Sessions of a Project per day, maintained by `manage.py rollup_stats`
+    """
+    project = models.ForeignKey(Project, on_delete = models.CASCADE)
+    date = models.DateField()
+    listens = models.IntegerField(default=0)
+    # nanoseconds
+    duration = models.BigIntegerField(default=0)
+    listen_devices = models.IntegerField(default=0)
+    sessions = models.IntegerField(default=0)
+    session_devices = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Project Daily Stats'
+        verbose_name_plural = 'Project Daily Stats'
+        unique_together = [('project', 'date')]
+
+
+class ProjectHourlyStats(models.Model):
+    """
+    Sessions of a Project per hour, maintained by `manage.py rollup_stats`
+    """
+    project = models.ForeignKey(Project, on_delete = models.CASCADE)
+    hour = models.DateTimeField()
+    sessions = models.IntegerField(default=0)
+    devices = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Project Hourly Stats'
+        verbose_name_plural = 'Project Hourly Stats'
+        unique_together = [('project', 'hour')]
+
+
 class UIElement(models.Model):
     """
     UI elements used to skin various versions of the transformer app
@@ -865,6 +1025,68 @@ class Vote(models.Model):
         return str(self.id) + ": Session id: " + str(self.session.id) + ": Asset id: " + str(self.asset.id) + ": Type: " + str(self.type)
 
 
+class VoteAggregate(models.Model):
+    """
+    Count, sum and average value of the Votes of each type on an Asset, kept
+    current by update_vote_aggregates so vote totals and rankings are read
+    without scanning Vote.
+    """
+    asset = models.ForeignKey(Asset, on_delete = models.CASCADE)
+    type = models.CharField(max_length=16, choices=Vote.VOTE_TYPES)
+    count = models.IntegerField(default=0)
+    sum = models.IntegerField(default=0)
+    avg = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return "Asset id: %s: Type: %s: Count: %s" % (self.asset_id, self.type, self.count)
+
+    class Meta:
+        unique_together = [('asset', 'type')]
+        index_together = [('type', 'count')]
+
+
+def update_vote_aggregates(asset_id):
+    """
+    Recalculate the VoteAggregates of an Asset from its Votes. The Asset row
+    is locked first so concurrent votes on it, including the first vote of a
+    type, are applied in turn.
+    """
+    with transaction.atomic():
+        if not Asset.objects.select_for_update().filter(pk=asset_id).exists():
+            # the Asset is being deleted, its aggregates with it
+            return
+        aggregates = {a.type: a for a in VoteAggregate.objects.filter(asset_id=asset_id)}
+        totals = Vote.objects.filter(asset_id=asset_id).values('type') \
+                             .annotate(count=models.Count('id'), sum=models.Sum('value'), avg=models.Avg('value'))
+        for total in totals:
+            aggregate = aggregates.pop(total['type'], None) or VoteAggregate(asset_id=asset_id, type=total['type'])
+            aggregate.count = total['count']
+            aggregate.sum = total['sum'] or 0
+            aggregate.avg = total['avg']
+            aggregate.save()
+        # types without votes left
+        VoteAggregate.objects.filter(id__in=[a.id for a in aggregates.values()]).delete()
+
+
+class BlockedAsset(models.Model):
+    """
+    Materialized set of Assets each voter has blocked, either directly with a
+    block_asset Vote or through a block_user Vote on any Asset of the same
+    device. Maintained by the Vote and Asset post_save handlers below; rows are
+    removed with the Vote that caused them.
+    """
+    voter = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete = models.CASCADE)
+    asset = models.ForeignKey(Asset, on_delete = models.CASCADE)
+    vote = models.ForeignKey(Vote, on_delete = models.CASCADE)
+
+    def __str__(self):
+        return "%s: Voter id: %s: Asset id: %s" % (self.id, self.voter_id, self.asset_id)
+
+    class Meta:
+        unique_together = [('vote', 'asset')]
+        index_together = [('voter', 'asset')]
+
+
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.get_or_create(user=instance)
@@ -872,6 +1094,75 @@ def create_user_profile(sender, instance, created, **kwargs):
 post_save.connect(create_user_profile, sender=settings.AUTH_USER_MODEL)
 
 
+def block_assets_for_vote(sender, instance, created, **kwargs):
+    """
+    Add the Assets blocked by a new block_asset or block_user Vote.
+    """
+    if not created or instance.voter_id is None:
+        return
+    if instance.type == Vote.BLOCK_ASSET:
+        asset_ids = [instance.asset_id]
+    elif instance.type == Vote.BLOCK_USER:
+        device_id = Session.objects.filter(asset__id=instance.asset_id) \
+                                   .exclude(device_id='').values('device_id')
+        asset_ids = Asset.objects.filter(session__device_id__in=device_id).values_list('id', flat=True)
+    else:
+        return
+    BlockedAsset.objects.bulk_create(
+        [BlockedAsset(voter_id=instance.voter_id, asset_id=asset_id, vote=instance)
+         for asset_id in asset_ids],
+        ignore_conflicts=True)
+
+post_save.connect(block_assets_for_vote, sender=Vote)
+
+
+def block_new_asset(sender, instance, created, **kwargs):
+    """
+    Add a new Asset to the blocked set of every voter who blocked its device.
+    """
+    if not created or instance.session_id is None or not instance.session.device_id:
+        return
+    votes = Vote.objects.filter(type=Vote.BLOCK_USER, voter__isnull=False,
+                                asset__session__device_id=instance.session.device_id) \
+                        .values_list('id', 'voter_id')
+    BlockedAsset.objects.bulk_create(
+        [BlockedAsset(voter_id=voter_id, asset=instance, vote_id=vote_id)
+         for vote_id, voter_id in votes],
+        ignore_conflicts=True)
+
+post_save.connect(block_new_asset, sender=Asset)
+
+
+def update_vote_aggregates_for_vote(sender, instance, **kwargs):
+    update_vote_aggregates(instance.asset_id)
+
+post_save.connect(update_vote_aggregates_for_vote, sender=Vote)
+post_delete.connect(update_vote_aggregates_for_vote, sender=Vote)
+
+
+def get_blocked_asset_ids(device_id):
+    """
+    Set of ids of all Assets blocked by the User of the device, read from BlockedAsset.
+    """
+    if not device_id:
+        return set()
+    return set(BlockedAsset.objects.filter(voter__userprofile__device_id=device_id)
+                                   .values_list('asset_id', flat=True))
+
+
+def filter_within_radius(queryset, latitude, longitude, radius, keep_unlocated=False):
+    """
+    Limit a queryset of Assets or Events to those within `radius` meters of
+    the point, using the indexed geography location column. Rows without a
+    location are dropped unless keep_unlocated is set.
+    """
+    point = Point(float(longitude), float(latitude), srid=4326)
+    within = Q(location__dwithin=(point, D(m=float(radius))))
+    if keep_unlocated:
+        within |= Q(location__isnull=True)
+    return queryset.filter(within)
+
+
 def get_field_names_from_model(model):
     """Pass in a model class. Return list of strings of field names"""
     return [f.name for f in model._meta.fields]
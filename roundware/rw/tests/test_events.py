@@ -0,0 +1,102 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from model_bakery import baker
+from django.test.utils import override_settings
+
+from roundware.rw import models
+from roundware.lib import api, events
+
+from rw.tests.common import RWTestCase
+from mock import patch
+import os
+import shutil
+import subprocess
+import tempfile
+
+
+# the flusher thread has its own connection, outside the test transaction
+@patch.object(events.EventBuffer, 'start')
+class TestEventBuffer(RWTestCase):
+
+    def setUp(self):
+        super(type(self), TestEventBuffer).setUp(self)
+        self.session = baker.make(models.Session)
+        self.spill_dir = tempfile.mkdtemp()
+        self.buffer = events.EventBuffer(500, 3, self.spill_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.spill_dir)
+
+    def spilled(self):
+        with open(self.buffer.spill_path) as spill:
+            return [line for line in spill if line.strip()]
+
+    def test_flush_writes_pending_events(self, start):
+        for event_type in ('start_upload', 'vote_asset'):
+            self.buffer.append(api.build_event(event_type, self.session.id, {"tag_ids": "1,2"}))
+        self.assertEqual(models.Event.objects.count(), 0)
+        self.assertEqual(len(self.spilled()), 2)
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(sorted(models.Event.objects.values_list('event_type', flat=True)),
+                         ['start_upload', 'vote_asset'])
+        self.assertEqual(self.spilled(), [])
+
+    def test_rejected_event_does_not_block_the_batch(self, start):
+        self.buffer.append(api.build_event('start_upload', self.session.id))
+        bad = api.build_event('vote_asset', self.session.id)
+        bad.event_type = None
+        self.buffer.append(bad)
+        self.buffer.append(api.build_event('stop_upload', self.session.id))
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(sorted(models.Event.objects.values_list('event_type', flat=True)),
+                         ['start_upload', 'stop_upload'])
+        self.assertEqual(self.buffer.rows, [])
+        self.assertEqual(self.spilled(), [])
+
+    @patch.object(events.models.Event.objects, 'bulk_create', side_effect=events.OperationalError)
+    def test_events_are_kept_while_database_is_unavailable(self, bulk_create, start):
+        self.buffer.append(api.build_event('start_upload', self.session.id))
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(len(self.buffer.rows), 1)
+        self.assertEqual(len(self.spilled()), 1)
+
+    def test_full_buffer_wakes_flusher(self, start):
+        for i in range(3):
+            self.assertFalse(self.buffer.wakeup.is_set())
+            self.buffer.append(api.build_event('vote_asset', self.session.id))
+        self.assertTrue(self.buffer.wakeup.is_set())
+
+    def test_events_of_dead_process_are_recovered(self, start):
+        # a process id which is no longer running
+        child = subprocess.Popen(['true'])
+        child.wait()
+        event = api.build_event('start_session', self.session.id, {"data": "offline"})
+        with open(os.path.join(self.spill_dir, 'events-%d.jsonl' % child.pid), 'w') as spill:
+            spill.write(events.to_json(event) + '\n')
+
+        self.buffer.recover()
+        self.buffer.flush()
+        recovered = models.Event.objects.get()
+        self.assertEqual(recovered.event_type, 'start_session')
+        self.assertEqual(recovered.data, 'offline')
+        self.assertEqual(recovered.server_time, event.server_time)
+        self.assertEqual(os.listdir(self.spill_dir), ['events-%d.jsonl' % os.getpid()])
+
+    @override_settings(EVENT_BUFFER_ENABLED=True)
+    def test_queue_event_uses_buffer(self, start):
+        with patch.object(events, 'get_buffer', return_value=self.buffer):
+            api.queue_event('vote_asset', self.session.id)
+        self.assertEqual(models.Event.objects.count(), 0)
+        self.buffer.flush()
+        self.assertEqual(models.Event.objects.count(), 1)
+
+    def test_queue_event_leaves_out_malformed_fields(self, start):
+        event = api.queue_event('start_upload', self.session.id,
+                                {"latitude": "abc", "longitude": "2.0", "tags": "1,x"})
+        self.assertIsNone(event.latitude)
+        self.assertEqual(event.longitude, 2.0)
+        self.assertIsNone(event.tags)
+        self.assertEqual(models.Event.objects.count(), 1)
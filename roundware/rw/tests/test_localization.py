@@ -0,0 +1,32 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from model_bakery import baker
+
+from roundware.rw import models
+from roundware.lib.localization import Localizations
+
+from rw.tests.common import RWTestCase
+
+
+class TestLocalizations(RWTestCase):
+
+    def setUp(self):
+        super(type(self), TestLocalizations).setUp(self)
+        self.french = baker.make(models.Language, language_code='fr', id=3)
+        self.tag2 = baker.make(models.Tag, tag_category=self.tagcat1, value='tag2',
+                               loc_msg=[self.spanish_msg])
+
+    def test_one_query_per_field(self):
+        with self.assertNumQueries(1):
+            localizations = Localizations().load(models.Tag, 'loc_msg', [self.tag1.id, self.tag2.id])
+        with self.assertNumQueries(0):
+            self.assertEqual(localizations.get(self.tag1, 'loc_msg', [self.english]), "One")
+            self.assertEqual(localizations.get(self.tag1, 'loc_msg', [self.spanish.id]), "Uno")
+            self.assertEqual(localizations.get(self.tag2, 'loc_msg', [self.english]), "")
+
+    def test_fallback_languages(self):
+        localizations = Localizations().load(models.Tag, 'loc_msg', [self.tag1.id, self.tag2.id])
+        self.assertEqual(localizations.get(self.tag1, 'loc_msg', [self.french, None, self.spanish]), "Uno")
+        self.assertEqual(localizations.get(self.tag2, 'loc_msg', [self.french, localizations.english_id],
+                                           self.tag2.value), "tag2")
@@ -107,3 +107,79 @@ class TestAsset(RWTestCase):
 
     def test_distance(self):
         distance = self.asset1.distance({'latitude': 0, 'longitude': 0})
+
+
+class TestBlockedAsset(RWTestCase):
+
+    def setUp(self):
+        super(type(self), TestBlockedAsset).setUp(self)
+        self.voter = baker.make('auth.User')
+        self.voter.userprofile.device_id = 'voter-device'
+        self.voter.userprofile.save()
+        self.voter_session = baker.make('rw.Session', device_id='voter-device')
+        self.creator_session = baker.make('rw.Session', device_id='creator-device')
+        self.other_session = baker.make('rw.Session', device_id='other-device')
+        self.asset1 = baker.make('rw.Asset', session=self.creator_session)
+        self.asset2 = baker.make('rw.Asset', session=self.creator_session)
+        self.other_asset = baker.make('rw.Asset', session=self.other_session)
+
+    def vote(self, asset, vote_type):
+        return baker.make('rw.Vote', voter=self.voter, session=self.voter_session,
+                          asset=asset, type=vote_type)
+
+    def test_block_asset(self):
+        self.vote(self.asset1, models.Vote.BLOCK_ASSET)
+        self.assertEqual(models.get_blocked_asset_ids('voter-device'), {self.asset1.id})
+
+    def test_block_user_includes_later_assets(self):
+        vote = self.vote(self.asset1, models.Vote.BLOCK_USER)
+        asset3 = baker.make('rw.Asset', session=self.creator_session)
+        baker.make('rw.Asset', session=self.other_session)
+        self.assertEqual(models.get_blocked_asset_ids('voter-device'),
+                         {self.asset1.id, self.asset2.id, asset3.id})
+        # removing the vote unblocks the assets
+        vote.delete()
+        self.assertEqual(models.get_blocked_asset_ids('voter-device'), set())
+
+    def test_other_votes_do_not_block(self):
+        self.vote(self.asset1, models.Vote.LIKE)
+        self.assertEqual(models.get_blocked_asset_ids('voter-device'), set())
+        self.assertEqual(models.get_blocked_asset_ids('creator-device'), set())
+
+
+class TestVoteAggregate(RWTestCase):
+
+    def setUp(self):
+        super(type(self), TestVoteAggregate).setUp(self)
+        self.asset = baker.make('rw.Asset')
+        self.other_asset = baker.make('rw.Asset')
+
+    def vote(self, vote_type, value=None):
+        return baker.make('rw.Vote', asset=self.asset, type=vote_type, value=value)
+
+    def totals(self):
+        return {a.type: (a.count, a.sum, a.avg) for a in models.VoteAggregate.objects.filter(asset=self.asset)}
+
+    def test_votes_are_aggregated_by_type(self):
+        self.vote(models.Vote.LIKE)
+        self.vote(models.Vote.LIKE)
+        self.vote(models.Vote.RATE, 2)
+        self.vote(models.Vote.RATE, 5)
+        self.assertEqual(self.totals(), {"like": (2, 0, None), "rate": (2, 7, 3.5)})
+        self.assertEqual(self.asset.get_likes(), 2)
+        self.assertEqual(self.asset.get_flags(), 0)
+        self.assertEqual(self.asset.get_votes(dict=True), {"like": 0, "rate": 7})
+        self.assertFalse(models.VoteAggregate.objects.filter(asset=self.other_asset).exists())
+
+    def test_changed_and_deleted_votes(self):
+        vote = self.vote(models.Vote.LIKE)
+        vote.type = models.Vote.FLAG
+        vote.save()
+        self.assertEqual(self.totals(), {"flag": (1, 0, None)})
+        vote.delete()
+        self.assertEqual(self.totals(), {})
+
+    def test_deleting_voted_asset(self):
+        self.vote(models.Vote.LIKE)
+        self.asset.delete()
+        self.assertFalse(models.VoteAggregate.objects.exists())
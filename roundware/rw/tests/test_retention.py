@@ -0,0 +1,45 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from model_bakery import baker
+
+from roundware.rw import models
+from roundware.lib import retention
+
+from rw.tests.common import RWTestCase
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+
+class TestPrune(RWTestCase):
+
+    def setUp(self):
+        super(type(self), TestPrune).setUp(self)
+        now = datetime.datetime.now()
+        session = baker.make(models.Session)
+        self.old = [baker.make(models.Event, session=session, event_type='old',
+                               server_time=now - datetime.timedelta(days=40 + i)) for i in range(3)]
+        self.new = baker.make(models.Event, session=session, event_type='new',
+                              server_time=now - datetime.timedelta(days=1))
+        self.archive_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.archive_dir)
+
+    def test_dry_run_counts_expired_rows(self):
+        self.assertEqual(retention.prune('events', 30, dry_run=True), 3)
+        self.assertEqual(models.Event.objects.count(), 4)
+
+    def test_prune_archives_and_deletes_in_batches(self):
+        self.assertEqual(retention.prune('events', 30, batch_size=2, archive_dir=self.archive_dir), 3)
+        self.assertEqual(list(models.Event.objects.all()), [self.new])
+
+        (archive,) = os.listdir(self.archive_dir)
+        with gzip.open(os.path.join(self.archive_dir, archive), 'rt') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(sorted(row["id"] for row in rows), sorted(e.id for e in self.old))
+        self.assertEqual(rows[0]["event_type"], 'old')
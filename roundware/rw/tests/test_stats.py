@@ -0,0 +1,70 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from model_bakery import baker
+
+from roundware.rw import models
+from roundware.lib import stats
+
+from rw.tests.common import RWTestCase
+import datetime
+
+
+class TestRollup(RWTestCase):
+
+    def setUp(self):
+        super(type(self), TestRollup).setUp(self)
+        self.project = baker.make(models.Project)
+        self.asset = baker.make(models.Asset, project=self.project)
+        self.day = datetime.date(2020, 5, 1)
+        self.noon = datetime.datetime(2020, 5, 1, 12)
+        self.sessions = [baker.make(models.Session, project=self.project, device_id=device_id,
+                                    starttime=self.noon + datetime.timedelta(minutes=i * 45))
+                         for i, device_id in enumerate(('a', 'a', 'b'))]
+        for session in self.sessions:
+            self.listen(session)
+
+    def listen(self, session, starttime=None):
+        return baker.make(models.ListeningHistoryItem, session=session, asset=self.asset,
+                          starttime=starttime or session.starttime, duration=2000000000)
+
+    def test_rollup(self):
+        stats.rollup(lookback=0)
+        asset_stats = models.AssetDailyStats.objects.get()
+        self.assertEqual((asset_stats.date, asset_stats.listens, asset_stats.devices, asset_stats.duration),
+                         (self.day, 3, 2, 6000000000))
+        project_stats = models.ProjectDailyStats.objects.get()
+        self.assertEqual((project_stats.listens, project_stats.listen_devices,
+                          project_stats.sessions, project_stats.session_devices), (3, 2, 3, 2))
+        self.assertEqual(list(models.ProjectHourlyStats.objects.order_by('hour')
+                                    .values_list('hour', 'sessions', 'devices')),
+                         [(self.noon, 2, 1), (self.noon + datetime.timedelta(hours=1), 1, 1)])
+
+    def test_only_days_with_new_rows_are_recalculated(self):
+        stats.rollup(lookback=0)
+        # older rows are no longer read once behind the watermark
+        models.AssetDailyStats.objects.update(listens=100)
+        session = baker.make(models.Session, project=self.project, device_id='c',
+                             starttime=self.noon + datetime.timedelta(days=1))
+        self.listen(session)
+
+        stats.rollup(lookback=0)
+        self.assertEqual(list(models.AssetDailyStats.objects.order_by('date')
+                                    .values_list('date', 'listens', 'devices')),
+                         [(self.day, 100, 2), (self.day + datetime.timedelta(days=1), 1, 1)])
+
+        # a late listen on the first day recalculates it
+        self.listen(self.sessions[0], self.noon + datetime.timedelta(hours=3))
+        stats.rollup(lookback=0)
+        self.assertEqual(models.AssetDailyStats.objects.get(date=self.day).listens, 4)
+        self.assertEqual(models.ProjectDailyStats.objects.get(date=self.day).listens, 4)
+
+    def test_listens_of_assets_without_a_project_are_skipped(self):
+        orphan = baker.make(models.Asset, project=None)
+        baker.make(models.ListeningHistoryItem, session=self.sessions[0], asset=orphan,
+                   starttime=self.noon, duration=2000000000)
+        stats.rollup(lookback=0)
+        self.assertEqual(models.AssetDailyStats.objects.get().asset_id, self.asset.id)
+        self.assertEqual(models.ProjectDailyStats.objects.get().listens, 3)
+        self.assertEqual(models.StatsWatermark.objects.get(name='listens').last_id,
+                         models.ListeningHistoryItem.objects.latest('id').id)
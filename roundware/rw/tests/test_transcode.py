@@ -0,0 +1,98 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from model_bakery import baker
+from django.test.utils import override_settings
+
+from roundware.rw import models
+from roundware.lib import transcode, convertaudio
+
+from rw.tests.common import RWTestCase
+from mock import patch
+import os
+import tempfile
+
+
+@override_settings(TRANSCODE_MAX_ATTEMPTS=2)
+class TestTranscodeQueue(RWTestCase):
+
+    def setUp(self):
+        super(type(self), TestTranscodeQueue).setUp(self)
+        self.asset = baker.make(models.Asset, mediatype='audio')
+        self.job = transcode.enqueue_transcode(self.asset, 'upload.m4a')
+
+    def test_enqueue_marks_asset_processing(self):
+        self.asset.refresh_from_db()
+        self.assertEqual(self.asset.status, models.Asset.PROCESSING)
+        self.assertEqual(self.job.status, models.TranscodeJob.PENDING)
+
+    @patch.object(transcode.convertaudio, 'transcode_uploaded_file',
+                  return_value=('upload.wav', 5000000000))
+    def test_job_completion_updates_asset(self, convert):
+        job = transcode.claim_next_job()
+        self.assertEqual(job.id, self.job.id)
+        self.assertEqual(job.status, models.TranscodeJob.RUNNING)
+        # a running job is not handed out twice
+        self.assertIsNone(transcode.claim_next_job())
+
+        transcode.process_job(job)
+        convert.assert_called_once_with('upload.m4a')
+        self.asset.refresh_from_db()
+        self.assertEqual(self.asset.status, models.Asset.READY)
+        self.assertEqual(self.asset.filename, 'upload.wav')
+        self.assertEqual(self.asset.start_time, 0.0)
+        self.assertEqual(self.asset.end_time, 5.0)
+        self.assertEqual(job.status, models.TranscodeJob.DONE)
+
+    @patch.object(transcode.convertaudio, 'transcode_uploaded_file', side_effect=OSError("ffmpeg"))
+    def test_failed_job_is_retried_then_fails_asset(self, convert):
+        self.assertEqual(transcode.run_worker(max_jobs=1), 1)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, models.TranscodeJob.PENDING)
+
+        self.assertEqual(transcode.run_worker(max_jobs=1), 1)
+        self.job.refresh_from_db()
+        self.asset.refresh_from_db()
+        self.assertEqual(self.job.status, models.TranscodeJob.FAILED)
+        self.assertIn("ffmpeg", self.job.error)
+        self.assertEqual(self.asset.status, models.Asset.FAILED)
+
+
+class TestSinglePassTranscode(RWTestCase):
+
+    def setUp(self):
+        super(type(self), TestSinglePassTranscode).setUp(self)
+        self.media_root = tempfile.mkdtemp()
+        open(os.path.join(self.media_root, 'upload.m4a'), 'wb').close()
+        open(os.path.join(self.media_root, 'upload.mp3'), 'wb').close()
+        open(os.path.join(self.media_root, 'UPLOAD.WAV'), 'wb').close()
+
+    @patch.object(convertaudio.ffmpeg, 'probe', return_value={'format': {'duration': '12.5'}})
+    @patch.object(convertaudio.ffmpeg, 'merge_outputs')
+    def test_one_ffmpeg_run_for_all_formats(self, merge_outputs, probe):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            filename, audiolength = convertaudio.transcode_uploaded_file('upload.m4a')
+        self.assertEqual(filename, 'upload.wav')
+        self.assertEqual(audiolength, 12500000000)
+        probe.assert_called_once_with(os.path.join(self.media_root, 'upload.m4a'))
+        outputs = merge_outputs.call_args[0]
+        self.assertEqual([o.node.kwargs['acodec'] for o in outputs], ['libmp3lame', 'pcm_s16le'])
+        merge_outputs.return_value.overwrite_output.return_value.run.assert_called_once_with(quiet=True)
+
+    @patch.object(convertaudio.ffmpeg, 'probe', return_value={'format': {'duration': '3.0'}})
+    @patch.object(convertaudio.ffmpeg, 'merge_outputs')
+    def test_existing_format_is_not_rewritten(self, merge_outputs, probe):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            convertaudio.transcode_uploaded_file('upload.mp3')
+        outputs = merge_outputs.call_args[0]
+        self.assertEqual([o.node.kwargs['acodec'] for o in outputs], ['pcm_s16le'])
+
+    @patch.object(convertaudio.ffmpeg, 'probe', return_value={'format': {'duration': '3.0'}})
+    @patch.object(convertaudio.ffmpeg, 'merge_outputs')
+    def test_upper_case_extension_is_converted(self, merge_outputs, probe):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            filename, audiolength = convertaudio.transcode_uploaded_file('UPLOAD.WAV')
+        # the returned .wav file must be written
+        self.assertEqual(filename, 'UPLOAD.wav')
+        outputs = merge_outputs.call_args[0]
+        self.assertEqual([o.node.kwargs['acodec'] for o in outputs], ['libmp3lame', 'pcm_s16le'])
@@ -0,0 +1,104 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from django.core.files import File
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.test import SimpleTestCase
+
+from roundware.lib import uploads
+from roundware.lib.api import store_uploaded_file
+from roundware.lib.exception import RoundException
+
+from io import BytesIO
+import os
+import shutil
+import tempfile
+import tracemalloc
+
+# size of the simulated upload and the most memory storing it may allocate
+UPLOAD_SIZE = 32 * 1024 * 1024
+MEMORY_CEILING = 2 * 1024 * 1024
+
+
+class TestStoreUploadedFile(SimpleTestCase):
+
+    def setUp(self):
+        self.dest_dir = tempfile.mkdtemp()
+        self.dest = os.path.join(self.dest_dir, 'upload.wav')
+
+    def tearDown(self):
+        shutil.rmtree(self.dest_dir)
+
+    def fill(self, fileobj):
+        block = b'\0' * (1024 * 1024)
+        for i in range(UPLOAD_SIZE // len(block)):
+            fileobj.write(block)
+        fileobj.flush()
+        fileobj.seek(0)
+
+    def store_measuring_peak(self, fileitem):
+        tracemalloc.start()
+        try:
+            store_uploaded_file(fileitem, self.dest)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return peak
+
+    def test_temporary_upload_is_moved(self):
+        upload = TemporaryUploadedFile('upload.wav', 'audio/wav', UPLOAD_SIZE, None)
+        self.fill(upload)
+        temporary_path = upload.temporary_file_path()
+
+        peak = self.store_measuring_peak(upload)
+        upload.close()
+
+        self.assertLess(peak, MEMORY_CEILING)
+        self.assertFalse(os.path.exists(temporary_path))
+        self.assertEqual(os.path.getsize(self.dest), UPLOAD_SIZE)
+
+    def test_other_files_are_copied_in_chunks(self):
+        source = tempfile.NamedTemporaryFile(dir=self.dest_dir, delete=False)
+        self.fill(source)
+
+        with File(open(source.name, 'rb')) as fileitem:
+            peak = self.store_measuring_peak(fileitem)
+        source.close()
+
+        self.assertLess(peak, MEMORY_CEILING)
+        self.assertEqual(os.path.getsize(self.dest), UPLOAD_SIZE)
+
+
+class TestResumableUpload(SimpleTestCase):
+
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.dest_dir = tempfile.mkdtemp()
+        self.settings_override = self.settings(RESUMABLE_UPLOAD_DIR=self.upload_dir,
+                                               RESUMABLE_UPLOAD_MAX_SIZE=10)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.upload_dir)
+        shutil.rmtree(self.dest_dir)
+
+    def test_size_is_limited(self):
+        with self.assertRaises(RoundException):
+            uploads.create_upload('long.m4a', 11, 1)
+
+    def test_data_is_kept_until_the_upload_is_deleted(self):
+        upload = uploads.create_upload('long.m4a', 10, 1)
+        upload.write_range(0, 9, BytesIO(b"0123456789"))
+        fileitem = upload.open()
+        # the Asset file is moved into place, then creating the Asset fails
+        store_uploaded_file(fileitem, os.path.join(self.dest_dir, 'upload.m4a'))
+        fileitem.close()
+        upload = uploads.get_upload(upload.id, owner_id=1)
+        self.assertTrue(upload.complete)
+
+    def test_upload_without_data_is_not_found(self):
+        upload = uploads.create_upload('long.m4a', 10, 1)
+        os.remove(upload.data_path)
+        with self.assertRaises(uploads.UploadNotFound):
+            uploads.get_upload(upload.id, owner_id=1)
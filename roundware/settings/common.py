@@ -59,6 +59,39 @@ EMAIL_USE_TLS = True
 STARTUP_NOTIFICATION_MESSAGE = ""
 # Number of seconds to ban an asset/recording from playing again
 BANNED_TIMEOUT_LIMIT = 1800
+# Convert uploaded audio in `manage.py process_media` workers rather than
+# inside the upload request
+ASYNC_MEDIA_PROCESSING = True
+# Number of times a failed transcode job is retried before the Asset is marked failed
+TRANSCODE_MAX_ATTEMPTS = 3
+# Resumable uploads (api/2/uploads/) are assembled in this directory, which must
+# not be publicly served, and removed if not finalized within RESUMABLE_UPLOAD_EXPIRY seconds
+RESUMABLE_UPLOAD_DIR = '/var/www/roundware/uploads/'
+RESUMABLE_UPLOAD_EXPIRY = 60 * 60 * 24
+# Largest size, in bytes, a resumable upload may declare
+RESUMABLE_UPLOAD_MAX_SIZE = 1024 * 1024 * 1024
+# CACHES alias used for the API V2 project configuration endpoints and the
+# number of seconds responses are kept if no project edit invalidates them
+API_CACHE = 'api'
+API_CACHE_TIMEOUT = 60 * 60
+# Most events accepted by one POST to api/2/events/batch/
+EVENT_BATCH_MAX = 1000
+# Events logged during uploads, votes and session creation are inserted in
+# batches by a background thread every EVENT_BUFFER_FLUSH_INTERVAL milliseconds
+# or EVENT_BUFFER_MAX_ROWS events. Set EVENT_BUFFER_SPILL_DIR to a writable
+# directory to keep unwritten events across a crash.
+EVENT_BUFFER_ENABLED = True
+EVENT_BUFFER_FLUSH_INTERVAL = 500
+EVENT_BUFFER_MAX_ROWS = 200
+EVENT_BUFFER_SPILL_DIR = None
+# Days of Events and ListenEvents kept by `manage.py prune_events` (None keeps
+# everything) and the directory pruned rows are archived to, if any
+EVENT_RETENTION_DAYS = None
+LISTEN_EVENT_RETENTION_DAYS = None
+EVENT_ARCHIVE_DIR = None
+# Hours of listens and sessions recalculated by every `manage.py rollup_stats`
+# run, besides the rows added since the previous run
+STATS_ROLLUP_LOOKBACK = 24
 ######## END ROUNDWARE SPECIFIC SETTINGS #########
 
 # change this to reflect your environment
@@ -217,6 +250,7 @@ INSTALLED_APPS = (
     'leaflet',
     'corsheaders',
     'roundware.rw',
+    'roundware.api2',
     'roundware.notifications',
 )
 
@@ -306,6 +340,17 @@ CACHES = {
         'OPTIONS': {
             'MAX_ENTRIES': 1000
         }
+    },
+    # API V2 responses, invalidated when projects are edited. Must be shared by
+    # all server processes; for multi-node installs point it at memcached:
+    # 'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+    # 'LOCATION': '127.0.0.1:11211',
+    'api': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': '/var/tmp/django_cache_api',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000
+        }
     }
 }
 
@@ -17,6 +17,9 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
     }
 }
+API_CACHE = 'default'
+# write events within the test transaction
+EVENT_BUFFER_ENABLED = False
 
 # True when unit tests are running. Used by roundwared.recording_collection
 TESTING = True
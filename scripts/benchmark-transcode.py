@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Compare the previous upload conversion (one ffmpeg run per format followed by
+# mediainfo) with the single-pass transcoder in roundware.lib.convertaudio.
+# Reports ffmpeg/ffprobe/mediainfo CPU time, how many of those processes were
+# started and how many of them were given the source file, counted as they
+# run, using the recordings in files/test-audio.
+#
+# Usage: python3 scripts/benchmark-transcode.py [repeat]
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ASSET_PATH = os.path.join(ROOT, 'files', 'test-audio')
+sys.path.insert(0, ROOT)
+
+from django.conf import settings
+settings.configure(MEDIA_ROOT=tempfile.mkdtemp())
+
+import ffmpeg
+from roundware.lib import convertaudio
+
+
+def legacy(filename):
+    # The conversion performed before single-pass transcoding.
+    (filename_prefix, filename_extension) = os.path.splitext(filename)
+    filepath = os.path.join(settings.MEDIA_ROOT, filename)
+    for dst_type in ('wav', 'mp3'):
+        if filename_extension != "." + dst_type:
+            output_filepath = os.path.join(settings.MEDIA_ROOT, f"{filename_prefix}.{dst_type}")
+            ffmpeg.input(filepath).output(output_filepath, acodec='libmp3lame') \
+                                  .overwrite_output().run(quiet=True)
+    subprocess.check_output(['mediainfo', '--Inform=General;%Duration%',
+                             os.path.join(settings.MEDIA_ROOT, filename_prefix + '.wav')])
+
+
+def single_pass(filename):
+    convertaudio.transcode_uploaded_file(filename)
+
+
+class ProcessCounter(object):
+    """
+    Wraps subprocess.Popen, which ffmpeg-python also uses, counting the
+    processes started and those given the source file as an argument.
+    """
+
+    def __init__(self):
+        self.popen = subprocess.Popen
+        self.sources = set()
+        self.runs = 0
+        self.reads = 0
+
+    def __call__(self, args, *popen_args, **kwargs):
+        self.runs += 1
+        if self.sources.intersection(args):
+            self.reads += 1
+        return self.popen(args, *popen_args, **kwargs)
+
+    def __enter__(self):
+        subprocess.Popen = self
+        return self
+
+    def __exit__(self, *exc_info):
+        subprocess.Popen = self.popen
+
+
+def prepare(filenames):
+    # Re-encode the mp3 fixtures as ogg so both wav and mp3 must be written.
+    sources = []
+    for filename in filenames:
+        source = os.path.splitext(filename)[0] + '.ogg'
+        ffmpeg.input(os.path.join(ASSET_PATH, filename)) \
+              .output(os.path.join(settings.MEDIA_ROOT, source)) \
+              .overwrite_output().run(quiet=True)
+        sources.append(source)
+    return sources
+
+
+def run(convert, sources, repeat):
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.time()
+    with ProcessCounter() as counter:
+        counter.sources.update(os.path.join(settings.MEDIA_ROOT, source) for source in sources)
+        for i in range(repeat):
+            for source in sources:
+                convert(source)
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return cpu, time.time() - start, counter.runs, counter.reads
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    filenames = sorted(f for f in os.listdir(ASSET_PATH) if f.endswith('.mp3'))
+    try:
+        sources = prepare(filenames)
+        results = {}
+        for name, convert in (('legacy', legacy), ('single-pass', single_pass)):
+            results[name] = run(convert, sources, repeat)
+            print("%-12s cpu %7.2fs  wall %7.2fs  processes %d  source reads %d" % ((name,) + results[name]))
+        print("cpu time saved: %.0f%%" % (100 * (1 - results['single-pass'][0] / results['legacy'][0])))
+    finally:
+        shutil.rmtree(settings.MEDIA_ROOT)
+
+
+if __name__ == '__main__':
+    main()